@@ -7,21 +7,78 @@ Author:         Alexander Adranly
 Description:    Implementation of the Search class for the A* Algorithm
 
 """
+import time
+
+import costtogo
+import landmarks
+import resultcache
+from closedset import make_closed_set
+from frontier import make_frontier
+from instrument import CountingClosedSet, SearchStats, TimedFrontier, instrument_environment, timer
+from nodepool import NodePool
+from state import State
+
+HEURISTICS = ('manhattan', 'exact', 'alt')
 
 
 class Search(object):
 
-    def __init__(self, init_state, environment):
+    def __init__(self, init_state, environment, frontier='heap', closed='grid', nodes='state',
+                 heuristic='manhattan', epsilon=1, epsilon_step=0.5, time_limit=None, prune=False,
+                 stats=False, cache=False):
         """
         A* SEARCH ALGORITHM
             
             A popular Informed Search Algorithm that is both OPTIMAL and COMPLETE
         
+        --- PARAMETERS ---
+        frontier: str: frontier backend to use, see frontier.py
+            'list': sorted python list, O(n) per insertion (reference implementation)
+            'heap': binary heap with a position index, O(log n) per operation
+            'bucket': bucket (Dial) queue on the integer A* values
+            
+            All backends expand states in the same order and return the same frontier.
+        
+        closed: str: closed set backend to use, see closedset.py
+            'grid': one byte per cell of the map
+            'hash': set of explored positions, for searches that only touch a small part of a large map
+        
+        nodes: str: how search nodes are stored
+            'state': one State object per generated successor
+            'pool': parallel integer arrays (see nodepool.py), State objects are only built for the results
+        
+        heuristic: str: heuristic to guide the search with
+            'manhattan': distance plus elevation difference to the goal (see Environment.heuristic_table)
+            'exact': cost-to-go from a reverse Dijkstra search (see costtogo.py), cached per map and goal.
+                     Only states on optimal paths are expanded, and a start whose cost-to-go exceeds
+                     the energy budget is rejected without searching
+            'alt': largest of 'manhattan' and the landmark bounds (see landmarks.py), tighter on rugged maps
+        
+        prune: bool: drop successors whose A* value is over the energy budget, and reject the query before
+            searching when the A* value of the start is over the budget. The heuristic never overestimates,
+            so such states cannot reach the goal within budget: the solution is the same, only the frontier
+            and the explored states of a failed search shrink. heuristic='exact' always rejects such queries.
+        
+        epsilon: float: heuristic inflation factor of the anytime mode (ARA*)
+        epsilon_step: float: how much epsilon is lowered after each solution of the anytime mode
+        time_limit: float: wall-clock budget of the anytime mode, in seconds, None for no limit
+        
+            With epsilon > 1 or a time limit the search runs in anytime mode (see search_anytime):
+            a first solution is found quickly with f = g + epsilon * h, then improved with lower
+            epsilons until epsilon reaches 1 or time runs out. With the defaults the search is plain A*.
+        
+        stats: bool: count and time what the search does, see statistics() and instrument.py
+        
+        cache: bool: answer from the shared result cache and record the result in it (see resultcache.py).
+            An optimal search answers every energy budget of the same start and goal: a hit returns the
+            cached solution with an empty frontier and closed list. Ignored in anytime mode and for a start
+            that already carries a path.
+        
         --- INSTANCE VARIABLES ---
-        self.frontier: [State, ...]: list of unexplored states
+        self.frontier: Frontier: unexplored states
         
             The frontier must maintain several qualities:
-            Quality 1: the lowest A* value should be in the back of the frontier so it can be popped from the back
+            Quality 1: the lowest A* value should be popped first
             
             Quality 2: Consider directions N before E before S before W, meaning that if an agent has
             multiple options for states that all have the same A* value, pick N before S before E before W
@@ -33,8 +90,9 @@ class Search(object):
             Quality 4: When two states have the same A* but not the same position, prefer the state that has been
             in the frontier the longest for expansion
         
-        self.visited: [State, ...]: list of explored states
+        self.visited: ClosedSet: explored states
             
+            Membership is tested by position in O(1).
             States are ordered in the order that they were explored in the frontier
             ex: [first_explored, second_explored, ...]
             
@@ -47,31 +105,69 @@ class Search(object):
             
             In order to reduce function calls throughout the program and slightly increase performance,
             I decided to pre-compute all the heuristic values
+            (see Environment.heuristic_table, vectorized when the map is stored in numpy)
             
         self.current_state: State: The state that is currently selected for expansion
+        
+        self.pool: NodePool: node storage when nodes='pool', None otherwise
+            
+            The frontier and the closed set then hold node indexes instead of states
+        
+        self.bound: float: proven ratio between the cost of the solution and the optimal cost in anytime mode,
+            None in plain A* mode or when no solution was found
+            
+        self.solutions: [(epsilon, cost, seconds), ...]: solutions found in anytime mode, in order
             
         """
-        self.frontier = [init_state]
-        self.visited = []
+        if nodes not in ('state', 'pool'):
+            raise ValueError("unknown nodes '" + str(nodes) + "', expected 'state' or 'pool'")
+        if heuristic not in HEURISTICS:
+            raise ValueError("unknown heuristic '" + str(heuristic) + "', expected one of " + str(HEURISTICS))
+        if epsilon < 1 or epsilon_step <= 0:
+            raise ValueError("epsilon must be at least 1 and epsilon_step positive")
+
+        self.stats = None
+        if stats:
+            self.stats = SearchStats()
+            environment = instrument_environment(environment, self.stats)
         self.environment = environment
+        self.frontier = self.track_frontier(make_frontier(frontier))
+        self.visited = make_closed_set(closed, self.environment.width, self.environment.height)
+        if self.stats is not None:
+            self.visited = CountingClosedSet(self.visited, self.stats)
 
         # STATIC ENVIRONMENT
         # Pre-compute Heuristics
-        self.heuristics = []
-        for r in range(0, self.environment.width):
-            self.heuristics.append([])
-
-        for r in range(0, self.environment.width):
-            for c in range(0, self.environment.height):
-                x_goal, y_goal = self.environment.end_x, self.environment.end_y
-
-                goal_elevation = self.environment.elevation(x_goal, y_goal)
-                current_elevation = self.environment.elevation(r, c)
-
-                self.heuristics[r].append(abs(x_goal-r) + abs(y_goal-c) + abs(goal_elevation-current_elevation))
-
-        self.frontier[0].a_star = self.a_star(self.frontier[0])
-        self.current_state = self.frontier[0]
+        self.exact = heuristic == 'exact'
+        self.prune = prune
+        started = timer()
+        if self.exact:
+            self.heuristics = costtogo.cost_to_go_table(self.environment)
+        elif heuristic == 'alt':
+            self.heuristics = landmarks.alt_table(self.environment)
+        else:
+            self.heuristics = self.environment.heuristic_table()
+        if self.stats is not None:
+            self.stats.times['heuristic'] += timer() - started
+
+        init_state.a_star = self.a_star(init_state)
+        self.current_state = init_state
+        self.pool = None
+        self.epsilon = epsilon
+        self.epsilon_step = epsilon_step
+        self.time_limit = time_limit
+        self.bound = None
+        self.solutions = []
+        self.cache = cache and epsilon == 1 and time_limit is None and init_state.parent is None and \
+            not init_state.prefix_moves and init_state.cost_so_far == 0
+
+        if nodes == 'pool':
+            self.pool = NodePool()
+            root = self.pool.add(init_state.position[0], init_state.position[1],
+                                 init_state.cost_so_far, init_state.a_star)
+            self.frontier.push(root, init_state.position, init_state.a_star)
+        else:
+            self.frontier.push(init_state, init_state.position, init_state.a_star)
 
     def search(self):
         """
@@ -82,6 +178,34 @@ class Search(object):
         frontier ([State, ...]): an array of states which are in the frontier at the end of the search
         visited ([State, ...]): an array of states that have been expanded during the search
         """
+        if not self.cache:
+            return self.search_uncached()
+
+        environment = self.environment
+        start, goal = self.current_state.position, (environment.end_x, environment.end_y)
+        answer = resultcache.cache.lookup(environment, start, goal, environment.energy_budget)
+        if answer is not None:
+            return self.cached_results(*answer)
+        solution, frontier, visited = self.search_uncached()
+        resultcache.cache.store(environment, start, goal, environment.energy_budget, solution)
+        return solution, frontier, visited
+
+    def search_uncached(self):
+        """
+        --- HELPER METHOD ---
+        Search without the result cache, see search()
+        """
+        if (self.prune or self.exact) and self.current_state.a_star > self.environment.energy_budget:
+            # even a lower bound on the cost to the goal is over budget
+            if self.pool is not None:
+                return self.pooled_results(None)
+            return None, self.frontier.items(), self.visited.items()
+
+        if self.epsilon > 1 or self.time_limit is not None:
+            return self.search_anytime()
+
+        if self.pool is not None:
+            return self.search_pooled()
 
         # Loop
         # while there are still states to explore
@@ -93,18 +217,20 @@ class Search(object):
             # check first if the state we are exploring is a goal state
             if self.environment.is_goal_state(self.current_state):
                 # found a goal state
-                self.visited.append(self.current_state)                           # note we 'explored' state in a sense
-                return self.current_state, self.frontier, self.visited
+                # note we 'explored' state in a sense
+                self.visited.add(self.current_state, self.current_state.position)
+                return self.current_state, self.frontier.items(), self.visited.items()
 
-            self.visited.append(self.current_state)                               # note we actually explored the state
+            # note we actually explored the state
+            self.visited.add(self.current_state, self.current_state.position)
             self.explore()
 
-        return None, self.frontier, self.visited
+        return None, self.frontier.items(), self.visited.items()
 
     def explore(self):
         """
         Expand Upon a Frontier Node and Retrieve the possible states the agent can transition to
-        Organize those states in the frontier so that the most favored one ends up in the back
+        Organize those states in the frontier so that the most favored one is expanded next
         
         NOTE:
             self.current_state: is where we receive the state we are supposed to expand
@@ -122,8 +248,8 @@ class Search(object):
             # For each possible action the agent does, we want to be able to:
             #   1. Calculate the cost and A* value for each new neighbor state
             #   2. Insert or not insert the state into the frontier to help the driver
-            #      easily pop the best value to search from the back of the list. By
-            #      following the self.frontier requirements defined above
+            #      easily pop the best value to search. By following the self.frontier
+            #      requirements defined above
 
             # 1. Calculate the Cost and A* value
             move.cost_so_far += self.cost(frontier_node, move)
@@ -131,57 +257,266 @@ class Search(object):
             move.a_star = self.a_star(move)
 
             # 2. Insert or not insert the state into the frontier to help the driver search
-            if not self.has_been_visited(move) and move.cost_so_far <= self.environment.energy_budget:
-                # CONDITION: 2
-                # check and see if there are any other values in the frontier with A* values
-                # If there are: remove the one with the higher A* value (trying to find fastest way to tile)
-                # If they both have the same A* value: discard the newer one
-                remove_marker = []
-                move_rejected = False
-
-                for i in range(0, len(self.frontier)):
-                    # check and see if two nodes have the same position, if they do then thats when change happens
-                    if move.position == self.frontier[i].position:
-                        # two states have the same position, check their A* values
-                        if move.a_star < self.frontier[i].a_star:
-                            # new state A* is smaller so we take that one
-                            remove_marker.append(self.frontier[i])
-                        else:
-                            # if they both have the same A* value: discard the newer one
-                            # remove the one with the higher A* value
-                            # reject this new neighbor state
-                            move_rejected = True
-
-                # remove all older nodes that have position collisions
-                for marker in remove_marker:
-                    self.frontier.remove(marker)
-
-                # if the new state was not rejected based on a frontier clash
-                # insert accordingly into the frontier
-                if not move_rejected:
-                    self.frontier.append(move)
-
-                    # LOOP to place new state accordingly
-                    select = len(self.frontier)-1  # (int) tracks newly added state index
-                    while select > 0:
-                        # shuffle from the front to the back of the list as far as you can
-                        # swap back if your a star is higher than the guy behind you
-                        if self.frontier[select].a_star > self.frontier[select-1].a_star:
-                            self.frontier[select], self.frontier[select-1] = self.frontier[select-1], self.frontier[select]
-                            select -= 1
-
-                        elif self.frontier[select].a_star == self.frontier[select-1].a_star:
-                            # if the two states compared are the same A* value
-                            # they are older then you (waiting in frontier longer)
-                            # swap behind it
-                            self.frontier[select], self.frontier[select-1] = self.frontier[select-1], self.frontier[select]
-                            select -= 1
-
-                        else:
-                            # select has not decreased this round
-                            # select is at the correct place in the frontier
-                            # no need to iterate anymore
-                            break
+            if self.has_been_visited(move):
+                continue
+            if move.cost_so_far > self.environment.energy_budget or \
+                    (self.prune and move.a_star > self.environment.energy_budget):
+                if self.stats is not None:
+                    self.stats.budget_prunes += 1
+                continue
+
+            # CONDITION: 2
+            # the frontier keeps a single state per position:
+            # the one with the lower A* value stays, on a tie the newer one is discarded
+            self.frontier.push(move, move.position, move.a_star)
+
+    def search_anytime(self):
+        """
+        Anytime Repairing A* (ARA*)
+        
+        Each iteration expands states on f = g + epsilon * h until no queued state can beat the solution,
+        so the solution costs at most epsilon times the optimum. States whose cost goes down after they
+        were expanded in the iteration are kept aside (inconsistent) and queued again for the next iteration
+        with a lower epsilon, every cost found so far is kept: the next iteration only repairs the search.
+        
+        Runs on State objects with a heap frontier, whatever the nodes and frontier options
+        
+        :return: same as search(), visited holds the states expanded by all the iterations
+        """
+        environment = self.environment
+        goal = (environment.end_x, environment.end_y)
+        started = time.time()
+        deadline = None if self.time_limit is None else started + self.time_limit
+
+        epsilon = float(self.epsilon)
+        best = {self.current_state.position: self.current_state}            # cheapest state of each position
+        inconsistent = {}
+        expanded = []
+        frontier = self.track_frontier(make_frontier('heap'))
+        frontier.push(self.current_state, self.current_state.position, self.inflated(self.current_state, epsilon))
+
+        proven = None                                                      # epsilon of the last finished iteration
+        while True:
+            timed_out = self.improve_path(frontier, best, inconsistent, epsilon, deadline, expanded)
+            if not timed_out:
+                proven = epsilon
+
+            solution = best.get(goal)
+            if solution is not None:
+                if not self.solutions or solution.cost_so_far < self.solutions[-1][1]:
+                    self.solutions.append((epsilon, solution.cost_so_far, time.time() - started))
+                self.bound = self.suboptimality(solution, frontier, inconsistent, proven)
+
+            if timed_out or epsilon <= 1 or (self.bound is not None and self.bound <= 1):
+                break
+
+            # lower epsilon, queue the inconsistent states again and re-sort the frontier
+            epsilon = max(1.0, epsilon - self.epsilon_step)
+            states = frontier.items() + list(inconsistent.values())
+            inconsistent = {}
+            frontier = self.track_frontier(make_frontier('heap'))
+            for state in states:
+                frontier.push(state, state.position, self.inflated(state, epsilon))
+
+        self.frontier = frontier
+        return best.get(goal), frontier.items(), expanded
+
+    def improve_path(self, frontier, best, inconsistent, epsilon, deadline, expanded):
+        """
+        --- HELPER METHOD ---
+        One iteration of search_anytime
+        
+        :return: (bool) True if the time limit was reached before the iteration finished
+        """
+        environment = self.environment
+        goal = (environment.end_x, environment.end_y)
+        closed = set()
+
+        while len(frontier) != 0:
+            solution = best.get(goal)
+            if solution is not None and solution.cost_so_far <= frontier.min_priority():
+                return False
+            if deadline is not None and len(expanded) % 64 == 0 and time.time() >= deadline:
+                return True
+
+            state = frontier.pop()
+            closed.add(state.position)
+            expanded.append(state)
+            if self.stats is not None:
+                self.stats.expansions += 1
+
+            for move in environment.get_available_moves(state):
+                move.cost_so_far += self.cost(state, move)
+                if move.cost_so_far > environment.energy_budget:
+                    if self.stats is not None:
+                        self.stats.budget_prunes += 1
+                    continue
+                known = best.get(move.position)
+                if known is not None and known.cost_so_far <= move.cost_so_far:
+                    if self.stats is not None:
+                        self.stats.duplicates += 1
+                    continue
+
+                move.a_star = self.a_star(move)
+                if self.prune and move.a_star > environment.energy_budget:
+                    if self.stats is not None:
+                        self.stats.budget_prunes += 1
+                    continue
+                best[move.position] = move
+                if move.position in closed:
+                    inconsistent[move.position] = move
+                else:
+                    frontier.push(move, move.position, self.inflated(move, epsilon))
+        return False
+
+    def inflated(self, state, epsilon):
+        """
+        --- HELPER METHOD ---
+        :return: (float) g + epsilon * h of a state
+        """
+        return state.cost_so_far + epsilon * self.heuristics[state.position[0]][state.position[1]]
+
+    def suboptimality(self, solution, frontier, inconsistent, epsilon):
+        """
+        --- HELPER METHOD ---
+        Any cheaper solution goes through a queued or inconsistent state, so the lowest g + h among them
+        is a lower bound on the optimal cost
+        
+        :param epsilon: (float) epsilon of the last finished iteration, None if the first one was interrupted
+        :return: (float) proven bound on solution cost / optimal cost, None if nothing is proven
+        """
+        states = frontier.items() + list(inconsistent.values())
+        if not states:
+            return 1.0
+        lower = min(state.cost_so_far + self.heuristics[state.position[0]][state.position[1]] for state in states)
+        if lower >= solution.cost_so_far:
+            return 1.0
+        if lower <= 0:
+            return epsilon
+        if epsilon is None:
+            return float(solution.cost_so_far) / lower
+        return max(1.0, min(epsilon, float(solution.cost_so_far) / lower))
+
+    def search_pooled(self):
+        """
+        Same search as search(), running on the node pool
+        
+        :return: same as search()
+        """
+        pool = self.pool
+        goal = (self.environment.end_x, self.environment.end_y)
+        node = 0                                                                  # root node
+
+        while len(self.frontier) != 0 and pool.g[node] <= self.environment.energy_budget:
+            node = self.frontier.pop()
+            position = pool.position(node)
+            self.visited.add(node, position)
+
+            if position == goal:
+                return self.pooled_results(node)
+
+            self.explore_pooled(node)
+
+        return self.pooled_results(None)
+
+    def explore_pooled(self, node):
+        """
+        Same expansion as explore(), running on the node pool
+        
+        Successors are generated lazily: a neighbor that is closed, over budget or that would lose its
+        frontier clash is rejected before a node is allocated for it
+        
+        :param node: (int) index of the node to expand
+        :return: None
+        """
+        pool = self.pool
+        environment = self.environment
+        x_pos, y_pos, cost_so_far = pool.x[node], pool.y[node], pool.g[node]
+        src_elevation = environment.elevation(x_pos, y_pos)
+
+        # !!! Generated in NESW Order to maintain direction preference
+        for x_next, y_next, move in environment.successors(x_pos, y_pos):
+            position = (x_next, y_next)
+            if position in self.visited:
+                continue
+
+            cost = cost_so_far + environment.elevation_cost(src_elevation, environment.elevation(x_next, y_next))
+            if cost > environment.energy_budget:
+                if self.stats is not None:
+                    self.stats.budget_prunes += 1
+                continue
+
+            a_star = cost + self.heuristics[x_next][y_next]
+            if self.prune and a_star > environment.energy_budget:
+                if self.stats is not None:
+                    self.stats.budget_prunes += 1
+                continue
+
+            existing = self.frontier.get(position)
+            if existing is not None and a_star >= pool.f[existing]:
+                # the older node keeps its place in the frontier
+                if self.stats is not None:
+                    self.stats.duplicates += 1
+                continue
+
+            self.frontier.push(pool.add(x_next, y_next, cost, a_star, node, move), position, a_star)
+
+    def track_frontier(self, frontier):
+        """
+        --- HELPER METHOD ---
+        :param frontier: (Frontier) new frontier of the search, replacing the previous one
+        :return: the frontier, wrapped in a TimedFrontier when stats are on
+        """
+        if self.stats is None:
+            return frontier
+        del self.stats.frontiers[:]
+        return TimedFrontier(frontier, self.stats)
+
+    def statistics(self):
+        """
+        Counters and timers of the search (see instrument.SearchStats) and of its environment
+        (see Environment.statistics)
+        
+        :return: {'search': {str: value}, 'environment': {str: value}}, None unless stats=True
+        """
+        if self.stats is None:
+            return None
+        values = {'search': self.stats.as_dict(), 'environment': self.environment.statistics()}
+        if self.cache:
+            values['result_cache'] = resultcache.cache.stats()
+        return values
+
+    def cached_results(self, cost, path):
+        """
+        --- HELPER METHOD ---
+        Results of a query answered by the result cache
+        
+        :param cost: (int) cost of the cached solution, None when there is none within the budget
+        :param path: (PackedPath) moves of the cached solution
+        :return: same as search(), with an empty frontier and closed list
+        """
+        if cost is None:
+            return None, [], []
+        solution = State(self.environment.end_x, self.environment.end_y)
+        solution.moves_so_far = path.moves()
+        solution.cost_so_far = cost
+        solution.a_star = cost
+        return solution, [], []
+
+    def pooled_results(self, solution):
+        """
+        --- HELPER METHOD ---
+        Build the State objects returned by search_pooled
+        
+        :param solution: (int) index of the goal node, or None
+        :return: same as search()
+        """
+        states = {0: self.current_state}                                          # the root is the initial state
+        frontier = self.pool.to_states(self.frontier.items(), states)
+        visited = self.pool.to_states(self.visited.items(), states)
+        if solution is None:
+            return None, frontier, visited
+        return states[solution], frontier, visited
 
     def a_star(self, neighbor_state):
         """
@@ -248,7 +583,4 @@ class Search(object):
         :param current_state: (State): queried state to check if it has been visited 
         :return: (bool): True if state visited, False if otherwise
         """
-        for node in self.visited:
-            if current_state.position == node.position:
-                return True
-        return False
+        return current_state.position in self.visited
@@ -0,0 +1,196 @@
+#!usr/bin/python
+"""
+File:           batch.py
+
+Author:         Alexander Adranly
+
+Description:    Run many (start, goal, energy) queries against a single map
+
+    The map is loaded once. Queries are grouped by goal so that each worker computes the heuristic
+    table of a goal once (see Environment.enable_heuristic_cache), the groups are spread over a
+    process pool and the results are handed back in input order as soon as they are available.
+
+    Query format, one query per line (blank lines and lines starting with '#' are skipped):
+        start_x start_y end_x end_y energy
+
+    Result format (format_result), one line per query, tab separated:
+        start_x start_y end_x end_y energy cost moves states_considered
+    cost and moves are '-' when there is no solution, moves are written as a string (e.g. NNEE)
+"""
+import multiprocessing
+
+from state import State
+
+# state of a pool worker, filled in by init_worker
+_worker = {}
+
+
+def parse_query(line):
+    """
+    :param line: (str) line of a query file
+    :return: (start_x, start_y, end_x, end_y, energy), or None for a blank or comment line
+    """
+    line = line.strip()
+    if len(line) == 0 or line.startswith('#'):
+        return None
+    fields = line.split()
+    if len(fields) != 5:
+        raise ValueError("expected 'start_x start_y end_x end_y energy', got '" + line + "'")
+    return tuple([int(field) for field in fields])
+
+
+def read_queries(lines):
+    """
+    :param lines: iterable of query lines (e.g. an open file or sys.stdin)
+    :return: generator of queries, see parse_query
+    """
+    for line in lines:
+        query = parse_query(line)
+        if query is not None:
+            yield query
+
+
+def run_query(environment, search_pkg, query, options):
+    """
+    Run a single query
+
+    :param environment: (Environment) map shared by all the queries
+    :param search_pkg: (module) search algorithm module, e.g. astar
+    :param query: (start_x, start_y, end_x, end_y, energy)
+    :param options: {str: value}: extra keyword arguments for the Search class
+    :return: (query, moves, cost, states considered): moves (str) and cost are None without a solution
+    """
+    start_x, start_y, end_x, end_y, energy = query
+    search = search_pkg.Search(State(start_x, start_y), environment.derive(energy, (end_x, end_y)), **options)
+    solution, frontier, visited = search.search()
+    if solution is None:
+        return query, None, None, len(visited)
+    return query, ''.join(solution.moves_so_far), solution.cost_so_far, len(visited)
+
+
+def format_result(result):
+    """
+    :param result: value returned by run_query
+    :return: (str) result line, see the module description
+    """
+    query, moves, cost, considered = result
+    fields = [str(value) for value in query]
+    fields.append('-' if cost is None else str(cost))
+    fields.append('-' if moves is None else moves)
+    fields.append(str(considered))
+    return '\t'.join(fields)
+
+
+def init_worker(environment, module_name, options, cache_size):
+    """
+    Pool initializer: with the fork start method the environment is inherited by the worker,
+    it is never pickled per task
+
+    :return: None
+    """
+    environment.enable_heuristic_cache(cache_size)
+    _worker['environment'] = environment
+    _worker['search_pkg'] = __import__(module_name)
+    _worker['options'] = options
+
+
+def run_group(group):
+    """
+    Pool task: run a group of queries that share a goal
+
+    :param group: [(index, query), ...]
+    :return: [(index, result), ...]
+    """
+    return [(index, run_query(_worker['environment'], _worker['search_pkg'], query, _worker['options']))
+            for index, query in group]
+
+
+def group_by_goal(window, chunksize):
+    """
+    :param window: [(index, query), ...]: queries to dispatch
+    :param chunksize: (int) maximum number of queries in a group
+    :return: [[(index, query), ...], ...]: groups of queries with the same goal
+    """
+    goals = {}
+    order = []
+    for index, query in window:
+        goal = (query[2], query[3])
+        if goal not in goals:
+            goals[goal] = []
+            order.append(goal)
+        goals[goal].append((index, query))
+
+    groups = []
+    for goal in order:
+        queries = goals[goal]
+        for i in range(0, len(queries), chunksize):
+            groups.append(queries[i:i + chunksize])
+    return groups
+
+
+def run_batch(environment, queries, module_name='astar', options=None, processes=1,
+              chunksize=64, window=4096, cache_size=8):
+    """
+    Run queries against a single map
+
+    :param environment: (Environment) loaded map, its goal and budget are ignored
+    :param queries: iterable of (start_x, start_y, end_x, end_y, energy)
+    :param module_name: (str) search algorithm module name
+    :param options: {str: value}: extra keyword arguments for the Search class
+    :param processes: (int) number of worker processes, 1 runs the queries in this process
+    :param chunksize: (int) maximum number of queries sent to a worker at once
+    :param window: (int) number of queries read ahead and grouped by goal at a time
+    :param cache_size: (int) number of heuristic tables kept by each worker
+    :return: generator of run_query results, in input order
+    """
+    options = {} if options is None else options
+
+    if processes <= 1:
+        init_worker(environment, module_name, options, cache_size)
+        for index_query in _windows(queries, window):
+            for index, result in sorted(_run_window(index_query, chunksize), key=lambda item: item[0]):
+                yield result
+        return
+
+    pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                initargs=(environment, module_name, options, cache_size))
+    try:
+        for index_query in _windows(queries, window):
+            pending = {}
+            next_index = index_query[0][0]
+            for results in pool.imap_unordered(run_group, group_by_goal(index_query, chunksize)):
+                for index, result in results:
+                    pending[index] = result
+                # stream back everything that is ready, in input order
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _windows(queries, window):
+    """
+    --- HELPER METHOD ---
+    :return: generator of [(index, query), ...] lists of at most window queries
+    """
+    batch = []
+    for index, query in enumerate(queries):
+        batch.append((index, query))
+        if len(batch) >= window:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_window(index_query, chunksize):
+    """
+    --- HELPER METHOD ---
+    Run a window of queries in this process, goal by goal
+    """
+    for group in group_by_goal(index_query, chunksize):
+        for item in run_group(group):
+            yield item
@@ -7,171 +7,406 @@ Author:         Alexander Adranly
 Description:    Implementation of the Search class for the Bidirectional BFS-Algorithm
 
 """
+from collections import deque
+
+from closedset import make_closed_set
+from frontier import HeapFrontier
+from instrument import CountingClosedSet, SearchStats, TimedFrontier, instrument_environment, timer
+from nodepool import NO_PARENT, NodePool
+
+# marker for entries that were replaced by a cheaper state
+_REMOVED = object()
+
+# directions of BidirectionalSearch
+FORWARD, BACKWARD = 0, 1
+
+
+class BreadthFrontier(object):
+
+    def __init__(self):
+        """
+        BREADTH FIRST FRONTIER
+
+            FIFO queue with at most one entry per position.
+            Entries are [counter, position, item, cost]; the counter increases on every insertion,
+            so it also gives the order of an entry in the frontier.
+            Replaced entries are marked removed and skipped when they reach the front of the queue.
+
+        --- INSTANCE VARIABLES ---
+        self.queue: deque of entries, oldest first, removed entries included
+        self.index: {(x_pos, y_pos): entry}: live entry for each position in the frontier
+        """
+        self.queue = deque()
+        self.index = {}
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, item, position, cost):
+        """
+        Insert an item at the back of the queue
+
+        :param item: the object stored in the frontier (State or node index)
+        :param position: (x_pos, y_pos): position of the item
+        :param cost: (int) cost so far of the item
+        :return: the new entry
+        """
+        self.counter += 1
+        entry = [self.counter, position, item, cost]
+        self.queue.append(entry)
+        self.index[position] = entry
+        return entry
+
+    def popleft(self):
+        """
+        :return: the oldest item of the frontier
+        """
+        while self.queue:
+            entry = self.queue.popleft()
+            if entry[2] is not _REMOVED:
+                del self.index[entry[1]]
+                return entry[2]
+        raise IndexError("pop from an empty frontier")
+
+    def filter(self, position, cost):
+        """
+        Checks to see if the frontier has an entry with the same position as a new state
+        The filter will then throw out one of them based on their comparative costs:
+        the new state is rejected unless it is strictly cheaper, in which case the old entry is removed
+
+        :param position: (x_pos, y_pos): position of the new state
+        :param cost: (int) cost so far of the new state
+        :return: (bool): was the new state rejected or not?
+        """
+        entry = self.index.get(position)
+        if entry is None:
+            return False
+
+        if cost < entry[3]:
+            # remove the current entry, the new state is added later
+            entry[2] = _REMOVED
+            del self.index[position]
+            return False
+
+        # same or higher cost, keep the older one
+        return True
+
+    def get(self, position):
+        """
+        :param position: (x_pos, y_pos): position in question
+        :return: the live entry for the position, or None
+        """
+        return self.index.get(position)
+
+    def items(self):
+        """
+        :return: [item, ...]: items in queue order, oldest first
+        """
+        return [entry[2] for entry in self.queue if entry[2] is not _REMOVED]
 
 
 class Search(object):
 
-    def __init__(self, init_state, environment):
+    def __init__(self, init_state, environment, closed='grid', nodes='state', mode='bfs', prune=False,
+                 stats=False):
         """
         Bidirectional Breadth First SEARCH ALGORITHM
 
             Breadth-First Search that searches from the start state and from the goal state
             The algorithm tries to look at the intersection of the two frontiers to find a solution
 
+        --- PARAMETERS ---
+        closed: str: closed set backend to use, see closedset.py ('grid' or 'hash')
+
+        nodes: str: how search nodes are stored
+            'state': one State object per generated successor
+            'pool': parallel integer arrays (see nodepool.py), State objects are only built for the results
+
+        mode: str: 'bfs' for this search, 'dijkstra' or 'astar' to run a BidirectionalSearch instead
+
+        prune: bool: drop a state when its cost plus a lower bound on the rest of the path (to the goal for
+            the front search, from the start for the back search, see Environment.lower_bound) is over the
+            energy budget, and reject the query before searching when the lower bound of the whole path is over
+            the budget. Such states cannot be part of a solution within budget.
+
+        stats: bool: count and time what the search does, see statistics() and instrument.py
+
         --- INSTANCE VARIABLES ---
-        self.front_frontier: [State, ...]: list of unexplored states starting from the START STATE
-        self.back_frontier: [State, ...]: list of unexplored states starting from the END STATE
+        self.front_frontier: BreadthFrontier: unexplored states starting from the START STATE
+        self.back_frontier: BreadthFrontier: unexplored states starting from the END STATE
 
             The frontier must maintain several qualities:
             FIFO Queue
-            
+
             The states with the highest priority to expand are the earliest ones inserted
             The expanded states are inserted in the back of the queue
 
-        self.explored: [State, ...]: list of explored states
+            Each frontier indexes its states by position, so a new state is only checked
+            against the state at the same position in the opposite frontier
+
+        self.explored: ClosedSet: explored states of both searches
 
+            Membership is tested by position in O(1).
             States are ordered in the order that they were explored in the frontier
             ex: [first_explored, second_explored, ...]
 
         self.environment: Environment: reference to the Environment class
 
-            The environment class has all the information about the environment/map that the algorithm needs to 
+            The environment class has all the information about the environment/map that the algorithm needs to
             search it.
 
+        self.pool: NodePool: node storage when nodes='pool', None otherwise
+
+            The frontiers and the closed set then hold node indexes instead of states.
+            Node 0 is the start and node 1 the goal.
+
         """
+        if nodes not in ('state', 'pool'):
+            raise ValueError("unknown nodes '" + str(nodes) + "', expected 'state' or 'pool'")
+        if mode not in ('bfs', 'dijkstra', 'astar'):
+            raise ValueError("unknown mode '" + str(mode) + "', expected 'bfs', 'dijkstra' or 'astar'")
+
+        self.optimal = None
+        if mode != 'bfs':
+            self.optimal = BidirectionalSearch(init_state, environment, heuristic=mode == 'astar', closed=closed,
+                                               prune=prune, stats=stats)
+
+        self.stats = None
+        if stats and self.optimal is None:
+            self.stats = SearchStats()
+            environment = instrument_environment(environment, self.stats)
         self.environment = environment
-        self.front_frontier = [init_state]
-        self.back_frontier = [self.environment.get_goal_state()]
-        self.explored = []
+        self.front_frontier = BreadthFrontier()
+        self.back_frontier = BreadthFrontier()
+        self.explored = make_closed_set(closed, self.environment.width, self.environment.height)
+        if self.stats is not None:
+            self.front_frontier = TimedFrontier(self.front_frontier, self.stats)
+            self.back_frontier = TimedFrontier(self.back_frontier, self.stats)
+            self.explored = CountingClosedSet(self.explored, self.stats)
+        self.pool = None
+        self.prune = prune
+        self.start = init_state.position
+
+        goal_state = self.environment.get_goal_state()
+        if nodes == 'pool':
+            self.pool = NodePool()
+            self.root_states = {0: init_state, 1: goal_state}
+            for root in (init_state, goal_state):
+                self.pool.add(root.position[0], root.position[1], root.cost_so_far, 0)
+            self.front_frontier.append(0, init_state.position, init_state.cost_so_far)
+            self.back_frontier.append(1, goal_state.position, goal_state.cost_so_far)
+        else:
+            self.front_frontier.append(init_state, init_state.position, init_state.cost_so_far)
+            self.back_frontier.append(goal_state, goal_state.position, goal_state.cost_so_far)
 
     def search(self):
         """
         Bidirectional Depth-First Search Algorithm
         Driver for the search algorithm
-        
-        :return: 
+
+        :return:
         solution ([char, ...]): an array of moves in order (e.g.,['N', 'E', 'E']), or None
         frontier ([State, ...]): an array of states which are in the frontier at the end of the search
         visited ([State, ...]): an array of states that have been expanded during the search
         """
+        if self.optimal is not None:
+            return self.optimal.search()
+
+        expand = self.expand if self.pool is None else self.expand_pooled
+
+        if self.prune and self.environment.lower_bound(self.start[0], self.start[1]) > self.environment.energy_budget:
+            # even a lower bound on the cost of the path is over budget
+            return self.results(None)
 
         while True:
             # FAILURE CASE
             # if they both go through their entire frontiers and find nothing, return
             if len(self.front_frontier) == 0 and len(self.back_frontier) == 0:
-                final_frontier = self.front_frontier
-                final_frontier.extend(self.back_frontier)
-                return None, final_frontier, self.explored
+                return self.results(None)
 
             # STEP: PICK STATES TO EXPAND FROM FRONT AND END FRONTIERS
             # if there are more states, pop from both frontiers
-            current_front = None if len(self.front_frontier) == 0 else self.front_frontier.pop(0)
-            current_back = None if len(self.back_frontier) == 0 else self.back_frontier.pop(0)
+            current_front = None if len(self.front_frontier) == 0 else self.front_frontier.popleft()
+            current_back = None if len(self.back_frontier) == 0 else self.back_frontier.popleft()
 
             # STEP: EXPLORE FRONT STATE
+            meetings = []
             if current_front is not None:
-                # if there is a new state to explore, add to explored states and insert
-                # its neighboring moves into the frontier
-                self.explored.append(current_front)
-
-                # get the next moves
-                moves = self.environment.get_available_moves(current_front)
-                for move in moves:
-                    # calculate move cost
-                    move.cost_so_far += self.cost(current_front, move)
-                    # REPETITIVE POSITION FILTER
-                    # if the state already exists in the frontier, take the one with the lowest cost
-                    if not self.filter(self.front_frontier, move):
-                        if not self.has_been_visited(move) and move.cost_so_far <= self.environment.energy_budget:
-                            # add move if it is within our budget and hasnt been explored yet
-                            self.front_frontier.append(move)
+                meetings = expand(current_front, self.front_frontier, self.back_frontier, True)
 
             # SOLUTION TEST
-            solution_test = self.test_for_solution()
+            solution_test = self.test_for_solution(meetings)
             if solution_test is not None:
                 return solution_test
 
+            # STEP: EXPLORE BACK STATE
+            meetings = []
             if current_back is not None:
-                # if there is a new state to explore, add to explored states and insert
-                # its neighboring moves into the frontier
-                self.explored.append(current_back)
-
-                # get the next moves
-                moves = self.environment.get_available_moves(current_back)
-                for move in moves:
-                    # calculate move cost
-                    move.cost_so_far += self.cost(current_back, move)
-                    # REPETITIVE POSITION FILTER
-                    # if the state already exists in the frontier, take the one with the lowest cost
-                    if not self.filter(self.back_frontier, move):
-                        if not self.has_been_visited(move) and move.cost_so_far <= self.environment.energy_budget:
-                            # add move if it is within our budget and hasn't been explored yet
-                            self.back_frontier.append(move)
+                meetings = expand(current_back, self.back_frontier, self.front_frontier, False)
 
             # SOLUTION TEST
-            solution_test = self.test_for_solution()
+            solution_test = self.test_for_solution(meetings)
             if solution_test is not None:
                 return solution_test
 
+    def expand(self, current, frontier, opposite, forward):
+        """
+        Explore a state: add it to the explored states and insert its neighboring moves into its frontier
+
+        :param current: (State) state to explore
+        :param frontier: (BreadthFrontier) frontier the state came from
+        :param opposite: (BreadthFrontier) frontier of the other search
+        :param forward: (bool) True if frontier is the front frontier
+        :return: [(front entry, back entry), ...]: new states that meet a state of the opposite frontier
+        """
+        meetings = []
+        self.explored.add(current, current.position)
+
+        # get the next moves
+        moves = self.environment.get_available_moves(current)
+        for move in moves:
+            # calculate move cost
+            move.cost_so_far += self.cost(current, move)
+            # REPETITIVE POSITION FILTER
+            # if the state already exists in the frontier, take the one with the lowest cost
+            if not frontier.filter(move.position, move.cost_so_far) and not self.has_been_visited(move):
+                if move.cost_so_far <= self.environment.energy_budget \
+                        and self.within_budget(move.position, move.cost_so_far, forward):
+                    # add move if it is within our budget and hasn't been explored yet
+                    entry = frontier.append(move, move.position, move.cost_so_far)
+                    meetings.extend(self.meet(entry, opposite, forward))
+                elif self.stats is not None:
+                    self.stats.budget_prunes += 1
+
+        return meetings
+
+    def expand_pooled(self, node, frontier, opposite, forward):
+        """
+        Same as expand(), running on the node pool
+
+        The frontier filter runs before anything is allocated, a node is only added to the pool
+        for a successor that actually enters the frontier
+
+        :param node: (int) index of the node to explore
+        :return: same as expand()
+        """
+        pool = self.pool
+        environment = self.environment
+        meetings = []
+        x_pos, y_pos, cost_so_far = pool.x[node], pool.y[node], pool.g[node]
+        self.explored.add(node, (x_pos, y_pos))
+        src_elevation = environment.elevation(x_pos, y_pos)
+
+        for x_next, y_next, move in environment.successors(x_pos, y_pos):
+            position = (x_next, y_next)
+            cost = cost_so_far + environment.elevation_cost(src_elevation, environment.elevation(x_next, y_next))
+
+            # REPETITIVE POSITION FILTER
+            if not frontier.filter(position, cost) and position not in self.explored:
+                if cost <= environment.energy_budget and self.within_budget(position, cost, forward):
+                    entry = frontier.append(pool.add(x_next, y_next, cost, 0, node, move), position, cost)
+                    meetings.extend(self.meet(entry, opposite, forward))
+                elif self.stats is not None:
+                    self.stats.budget_prunes += 1
+
+        return meetings
+
+    def within_budget(self, position, cost, forward):
+        """
+        --- HELPER METHOD ---
+        Budget pruning: can a path through a state still be within budget?
+
+        :param position: (x_pos, y_pos): position of the state
+        :param cost: (int) cost of the state
+        :param forward: (bool) True for a state of the front search
+        :return: (bool) True if the state is kept
+        """
+        if not self.prune:
+            return True
+        target = None if forward else self.start
+        return cost + self.environment.lower_bound(position[0], position[1], target) <= self.environment.energy_budget
+
+    def statistics(self):
+        """
+        Counters and timers of the search (see instrument.SearchStats) and of its environment
+        (see Environment.statistics)
+
+        :return: {'search': {str: value}, 'environment': {str: value}}, None unless stats=True
+        """
+        if self.optimal is not None:
+            return self.optimal.statistics()
+        if self.stats is None:
+            return None
+        return {'search': self.stats.as_dict(), 'environment': self.environment.statistics()}
+
     @staticmethod
-    def filter(frontier, node):
-        """
-        Checks to see if the frontier has any nodes with a similar position to the node
-        in question
-        The filter will then throw out one of the duplicate nodes based on their comparative costs
-        
-        :param frontier: [State, ...]: list of unexplored states that possibly share the same position as node
-        :param node: State: Node in question that may be a duplicate position with one of the frontier nodes
-        :return: (bool): was the node rejected or not?
-        """
-        move_rejected = False
-        remove_list = []
-        for i in range(0, len(frontier)):
-            if node.position == frontier[i].position:
-                # take the one with the lowest cost
-                if node.cost_so_far < frontier[i].cost_so_far:
-                    # remove the current node
-                    # add the new node later
-                    remove_list.append(frontier[i])
-                elif node.cost_so_far > frontier[i].cost_so_far:
-                    # new move has greater cost, dont  keep it
-                    move_rejected = True
-                else:
-                    # if they both have the same cost, keep the older one
-                    move_rejected = True
-
-        # remove all discarded nodes from frontier
-        for n in remove_list:
-            frontier.remove(n)
-
-        return move_rejected
+    def meet(entry, opposite, forward):
+        """
+        Look up the state at the same position as a new entry in the opposite frontier
+
+        :param entry: new frontier entry
+        :param opposite: (BreadthFrontier) frontier of the other search
+        :param forward: (bool) True if the entry belongs to the front frontier
+        :return: [(front entry, back entry)] if both frontiers hold the position, [] otherwise
+        """
+        other = opposite.get(entry[1])
+        if other is None:
+            return []
+        return [(entry, other)] if forward else [(other, entry)]
 
     # CHECKING METHODS
-    def test_for_solution(self):
+    def test_for_solution(self, meetings):
         """
-        Tests both of the frontiers to see if there is an existing solution
+        Tests the states that were just added to a frontier to see if there is an existing solution
         If there is a solution, the function will return the necessary information
         If there is not a solution, the function will return None
-        
-        :return: 
+
+        Every earlier test failed, so a new intersection of the two frontiers has to involve one of the
+        new states. Like Environment.frontier_overlap, the cheapest combined path wins and ties go to
+        the front state that has been in the frontier the longest.
+
+        :param meetings: [(front entry, back entry), ...]: new intersections of the two frontiers
+        :return:
         solution ([char, ...]): an array of moves in order (e.g.,['N', 'E', 'E'])
         frontier ([State, ...]): an array of states which are in the frontier at the end of the search
         visited ([State, ...]): an array of states that have been expanded during the search
-        
+
         or
-        
+
         None
         """
-        # check to see if there is any intersection
-        overlap_test = self.environment.frontier_overlap(self.front_frontier, self.back_frontier)
-        if len(overlap_test) > 0:
-            # the solution is in the first index
-            # if there is an intersection, then there is a solution
-            final_frontier = self.front_frontier
-            final_frontier.extend(self.back_frontier)
-            return overlap_test[0], final_frontier, self.explored
+        if len(meetings) == 0:
+            return None
+
+        front, back = min(meetings, key=lambda meeting: (meeting[0][3] + meeting[1][3], meeting[0][0]))
+        if self.pool is None:
+            return self.results(self.environment.join_paths(front[2], back[2]))
+
+        states = dict(self.root_states)
+        start, end = self.pool.to_states([front[2], back[2]], states)
+        return self.results(self.environment.join_paths(start, end), states)
+
+    def results(self, solution, states=None):
+        """
+        --- HELPER METHOD ---
+        Build the values returned by search()
+
+        :param solution: (State) solution state, or None
+        :param states: {int: State}: states already built for the node pool, if any
+        :return: same as search()
+        """
+        final_frontier = self.front_frontier.items()
+        final_frontier.extend(self.back_frontier.items())
+        explored = self.explored.items()
+
+        if self.pool is not None:
+            if states is None:
+                states = dict(self.root_states)
+            final_frontier = self.pool.to_states(final_frontier, states)
+            explored = self.pool.to_states(explored, states)
 
-        return None
+        return solution, final_frontier, explored
 
     def has_been_visited(self, current_state):
         """
@@ -183,10 +418,7 @@ class Search(object):
         True: the state is question has been visited
         False: the state in question has NOT been visited
         """
-        for node in self.explored:
-            if current_state.position == node.position:
-                return True
-        return False
+        return current_state.position in self.explored
 
     def cost(self, src_state, dest_state):
         """
@@ -204,7 +436,7 @@ class Search(object):
                 cost: 1
 
         :param src_state: (State) the state the agent is currently at
-        :param dest_state: (State) a transitional state for which we want to calculate the resulting cost 
+        :param dest_state: (State) a transitional state for which we want to calculate the resulting cost
         :return: (int) resultant cost to travel from one state to another state
         """
         src_elevation = self.environment.elevation(src_state.position[0], src_state.position[1])
@@ -223,3 +455,224 @@ class Search(object):
             # move is Flat
             return 1
 
+
+class BidirectionalSearch(object):
+
+    def __init__(self, init_state, environment, heuristic=True, closed='grid', prune=False, stats=False):
+        """
+        Bidirectional Dijkstra / A* SEARCH ALGORITHM
+
+            OPTIMAL bidirectional search. The forward search expands from the start with the normal move costs,
+            the backward search expands from the goal over reversed edges: reaching u from v going backwards
+            costs cost(u, v), the cost of the real move from u to v. Uphill and downhill moves are not
+            symmetric, so this is what makes the combined path cost exact.
+
+            Every time a position is labeled by both searches, the combined cost is a candidate solution.
+            The best candidate (mu) is only accepted once it is proven optimal:
+                Dijkstra: mu <= min g of the forward frontier + min g of the backward frontier
+                A*: mu <= max(min f of the forward frontier, min f of the backward frontier)
+
+            The side with the lowest frontier key is expanded next. A position already settled by the other
+            search is closed without being expanded, every path through it is covered by mu.
+            The solution has the same cost as the one found by astar.Search.
+
+        --- PARAMETERS ---
+        heuristic: bool: True for bidirectional A*, False for bidirectional Dijkstra
+            The forward search estimates the cost to the goal, the backward search the cost from the start,
+            both with |dx| + |dy| + |delta elevation|, which is consistent for both directions
+
+        closed: str: closed set backend to use, see closedset.py ('grid' or 'hash')
+
+        prune: bool: drop a node when its cost plus the lower bound on the rest of the path is over the energy
+            budget, and reject the query before searching when the lower bound of the whole path is
+
+        stats: bool: count and time what the search does, see statistics() and instrument.py
+
+        --- INSTANCE VARIABLES ---
+        self.pool: NodePool: nodes of both searches
+        self.frontiers: (HeapFrontier, HeapFrontier): forward and backward frontiers of node indexes
+        self.closed: (ClosedSet, ClosedSet): forward and backward closed sets
+        self.labels: ({(x_pos, y_pos): int}, {(x_pos, y_pos): int}): best node for each position reached
+        self.explored: [int, ...]: expanded nodes of both searches, in order
+        self.heuristics: (int[][], int[][]): forward and backward heuristic tables, None for Dijkstra
+        self.best_cost: int: cost of the best solution found so far (mu), None if there is none yet
+        self.meeting: (int, int): forward and backward nodes of the best solution
+        """
+        self.stats = None
+        if stats:
+            self.stats = SearchStats()
+            environment = instrument_environment(environment, self.stats)
+        self.environment = environment
+        self.init_state = init_state
+        self.goal_state = environment.get_goal_state()
+        self.pool = NodePool()
+        self.frontiers = (HeapFrontier(), HeapFrontier())
+        self.closed = (make_closed_set(closed, environment.width, environment.height),
+                       make_closed_set(closed, environment.width, environment.height))
+        if self.stats is not None:
+            self.frontiers = tuple(TimedFrontier(frontier, self.stats) for frontier in self.frontiers)
+            self.closed = tuple(CountingClosedSet(closed_set, self.stats) for closed_set in self.closed)
+        self.labels = ({}, {})
+        self.explored = []
+        self.best_cost = None
+        self.meeting = None
+        self.prune = prune
+
+        self.heuristics = None
+        if heuristic:
+            started = timer()
+            self.heuristics = (environment.heuristic_table(),
+                               environment.heuristic_table(init_state.position))
+            if self.stats is not None:
+                self.stats.times['heuristic'] += timer() - started
+
+        # node 0 is the start, node 1 the goal
+        self.label(FORWARD, init_state.position, init_state.cost_so_far)
+        self.label(BACKWARD, self.goal_state.position, 0)
+
+    def search(self):
+        """
+        Driver for the search algorithm
+
+        :return:
+        solution ([char, ...]): an array of moves in order (e.g.,['N', 'E', 'E']), or None
+        frontier ([State, ...]): an array of states which are in the frontier at the end of the search
+        visited ([State, ...]): an array of states that have been expanded during the search
+        """
+        forward, backward = self.frontiers
+        if self.prune and self.lower_bound(FORWARD, self.init_state.position) > self.environment.energy_budget:
+            # even a lower bound on the cost of the path is over budget
+            return self.results()
+
+        while len(forward) != 0 and len(backward) != 0:
+            forward_key, backward_key = forward.min_priority(), backward.min_priority()
+            if self.best_cost is not None and self.is_proven(forward_key, backward_key):
+                break
+            self.expand(FORWARD if forward_key <= backward_key else BACKWARD)
+
+        return self.results()
+
+    def is_proven(self, forward_key, backward_key):
+        """
+        --- STOPPING RULE ---
+
+        :param forward_key: (int) lowest key of the forward frontier
+        :param backward_key: (int) lowest key of the backward frontier
+        :return: (bool) True if no path cheaper than self.best_cost is left to find
+        """
+        if self.heuristics is None:
+            return self.best_cost <= forward_key + backward_key
+        return self.best_cost <= max(forward_key, backward_key)
+
+    def expand(self, direction):
+        """
+        Expand the best node of one of the two searches
+
+        :param direction: FORWARD or BACKWARD
+        :return: None
+        """
+        pool = self.pool
+        environment = self.environment
+        node = self.frontiers[direction].pop()
+        x_pos, y_pos, cost_so_far = pool.x[node], pool.y[node], pool.g[node]
+        self.closed[direction].add(node, (x_pos, y_pos))
+        self.explored.append(node)
+        if (x_pos, y_pos) in self.closed[1 - direction]:
+            # the other search already settled this position: the best path through it was
+            # recorded when both searches labeled it, its successors cannot do better
+            return
+        elevation = environment.elevation(x_pos, y_pos)
+
+        for x_next, y_next, move in environment.successors(x_pos, y_pos):
+            position = (x_next, y_next)
+            if position in self.closed[direction]:
+                continue
+
+            next_elevation = environment.elevation(x_next, y_next)
+            if direction == FORWARD:
+                cost = cost_so_far + environment.elevation_cost(elevation, next_elevation)
+            else:
+                # reversed edge: the agent really moves from the successor to the expanded position
+                cost = cost_so_far + environment.elevation_cost(next_elevation, elevation)
+
+            if cost > environment.energy_budget or \
+                    (self.prune and cost + self.lower_bound(direction, position) > environment.energy_budget):
+                if self.stats is not None:
+                    self.stats.budget_prunes += 1
+                continue
+            self.label(direction, position, cost, node, move)
+
+    def lower_bound(self, direction, position):
+        """
+        --- HELPER METHOD ---
+        :param direction: FORWARD or BACKWARD
+        :param position: (x_pos, y_pos)
+        :return: (int) lower bound on the cost to the goal (FORWARD) or from the start (BACKWARD)
+        """
+        if self.heuristics is not None:
+            return self.heuristics[direction][position[0]][position[1]]
+        target = None if direction == FORWARD else self.init_state.position
+        return self.environment.lower_bound(position[0], position[1], target)
+
+    def label(self, direction, position, cost, parent=NO_PARENT, move=-1):
+        """
+        --- HELPER METHOD ---
+        Record a path to a position if it is cheaper than the known one, and update the best solution
+
+        :param direction: FORWARD or BACKWARD
+        :param position: (x_pos, y_pos): position reached
+        :param cost: (int) cost of the path to the position
+        :param parent: (int) node the position is reached from, NO_PARENT for the first node
+        :param move: (int) code of the move taken from the parent (grid direction of the step)
+        :return: None
+        """
+        labels = self.labels[direction]
+        known = labels.get(position)
+        if known is not None and cost >= self.pool.g[known]:
+            if self.stats is not None:
+                self.stats.duplicates += 1
+            return
+
+        key = cost
+        if self.heuristics is not None:
+            key += self.heuristics[direction][position[0]][position[1]]
+
+        node = self.pool.add(position[0], position[1], cost, key, parent, move)
+        labels[position] = node
+        self.frontiers[direction].push(node, position, key)
+
+        other = self.labels[1 - direction].get(position)
+        if other is not None:
+            total = cost + self.pool.g[other]
+            if self.best_cost is None or total < self.best_cost:
+                self.best_cost = total
+                self.meeting = (node, other) if direction == FORWARD else (other, node)
+
+    def statistics(self):
+        """
+        Counters and timers of the search (see instrument.SearchStats) and of its environment
+        (see Environment.statistics)
+
+        :return: {'search': {str: value}, 'environment': {str: value}}, None unless stats=True
+        """
+        if self.stats is None:
+            return None
+        return {'search': self.stats.as_dict(), 'environment': self.environment.statistics()}
+
+    def results(self):
+        """
+        --- HELPER METHOD ---
+        Build the values returned by search()
+
+        :return: same as search()
+        """
+        states = {0: self.init_state, 1: self.goal_state}
+        frontier = self.pool.to_states(self.frontiers[FORWARD].items() + self.frontiers[BACKWARD].items(), states)
+        explored = self.pool.to_states(self.explored, states)
+
+        if self.best_cost is None or self.best_cost > self.environment.energy_budget:
+            return None, frontier, explored
+
+        start, end = self.pool.to_states(self.meeting, states)
+        return self.environment.join_paths(start, end), frontier, explored
+
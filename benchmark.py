@@ -0,0 +1,508 @@
+#!/usr/bin/python
+"""
+File:           benchmark.py
+
+Author:         Alexander Adranly
+
+Description:    Benchmark suite: synthetic terrains from 10^2 to 10^8 cells, timed searches and a
+                regression check against a stored baseline
+
+    Terrains (see GENERATORS), all generated row by row so maps larger than memory can be written:
+        noise:   independent random elevations 0-9
+        fractal: smooth hills, octaves of value noise 0-40
+        maze:    corridors at elevation 0 between walls at elevation 99
+        plains:  flat map at elevation 0, every move costs 1 and many paths tie
+
+    Every case searches from the corner (0, 0) to the opposite corner in a fresh process, so the peak
+    resident memory belongs to that case alone. Maps up to TILED_CELLS cells are written as text maps,
+    larger ones as tiled maps (see tiledmap.py) searched with a hash closed set.
+
+    Each result records the wall time of the search (best of --repeat runs), the number of expansions
+    (states considered), expansions per second, the peak frontier size and the peak resident memory.
+
+    Usage:
+        python benchmark.py run --scales 2 3 4 --output results.json
+        python benchmark.py run --baseline benchmark-baseline.json --threshold 0.25
+        python benchmark.py compare results.json benchmark-baseline.json
+        python benchmark.py generate fractal 1000 1000 fractal.map
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import tiledmap
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# wall clock with the best resolution available
+timer = getattr(time, 'perf_counter', time.time)
+
+MASK = 0xFFFFFFFF
+
+# maps with more cells are written as tiled maps
+TILED_CELLS = 10 ** 7
+TILE_SIZE = 256
+
+# the elevation of maze walls
+WALL = 99
+
+# results whose baseline search is faster than this are too noisy to compare times
+MIN_TIME = 0.05
+
+ALGORITHMS = ('astar', 'bbfs')
+
+
+def lattice(seed, x_pos, y_pos):
+    """
+    Deterministic pseudo-random value of a lattice point, the same on every platform and python
+
+    :return: (int) value in [0, 2^32)
+    """
+    value = (x_pos * 0x27D4EB2D ^ y_pos * 0x165667B1 ^ seed * 0x9E3779B1) & MASK
+    value = ((value ^ (value >> 15)) * 0x85EBCA6B) & MASK
+    value = ((value ^ (value >> 13)) * 0xC2B2AE35) & MASK
+    return value ^ (value >> 16)
+
+
+def noise(width, height, seed):
+    """
+    :return: function y_pos -> [int, ...]: row of independent random elevations 0-9
+    """
+    def row(y_pos):
+        return [lattice(seed, x_pos, y_pos) % 10 for x_pos in range(0, width)]
+    return row
+
+
+def fractal(width, height, seed, octaves=5, high=40):
+    """
+    :return: function y_pos -> [int, ...]: row of smooth terrain 0-high, octaves of value noise whose
+        wavelength and amplitude halve at each octave
+    """
+    wavelength = max(2, max(width, height) // 4)
+    layers = []
+    for octave in range(0, octaves):
+        layers.append((max(1, wavelength >> octave), 1.0 / (1 << octave)))
+    total = sum(amplitude for step, amplitude in layers)
+
+    def row(y_pos):
+        values = [0.0] * width
+        for octave, (step, amplitude) in enumerate(layers):
+            j, fy = y_pos // step, float(y_pos % step) / step
+            octave_seed = seed * 31 + octave
+            # lattice values of the row interpolated once, then along the row
+            column = [amplitude * (lattice(octave_seed, i, j) * (1 - fy) + lattice(octave_seed, i, j + 1) * fy) / MASK
+                      for i in range(0, width // step + 2)]
+            for x_pos in range(0, width):
+                i, fx = x_pos // step, float(x_pos % step) / step
+                values[x_pos] += column[i] * (1 - fx) + column[i + 1] * fx
+        return [int(value * high / total) for value in values]
+    return row
+
+
+def maze(width, height, seed):
+    """
+    Binary tree maze: cells at even coordinates are open, every cell opens the wall to its north or
+    to its east neighbor (only east on the last cell row, only north on the last cell column)
+
+    :return: function y_pos -> [int, ...]: row of corridors at 0 and walls at WALL
+    """
+    last_x, last_y = (width - 1) // 2 * 2, (height - 1) // 2 * 2
+
+    def opens_north(x_pos, y_pos):
+        if y_pos == last_y:
+            return False
+        return x_pos == last_x or lattice(seed, x_pos, y_pos) & 1 == 1
+
+    def row(y_pos):
+        if y_pos % 2 == 0:
+            # cells and the walls between them, open when the cell on the left opens east
+            return [0 if x_pos % 2 == 0 or (x_pos <= last_x and not opens_north(x_pos - 1, y_pos)) else WALL
+                    for x_pos in range(0, width)]
+        # walls above the cells of the row below, open when that cell opens north
+        return [0 if x_pos % 2 == 0 and y_pos <= last_y and opens_north(x_pos, y_pos - 1) else WALL
+                for x_pos in range(0, width)]
+    return row
+
+
+def plains(width, height, seed):
+    """
+    :return: function y_pos -> [int, ...]: flat row
+    """
+    def row(y_pos):
+        return [0] * width
+    return row
+
+
+GENERATORS = {'noise': noise, 'fractal': fractal, 'maze': maze, 'plains': plains}
+
+
+def dimensions(exponent):
+    """
+    :param exponent: (int) the map has about 10^exponent cells
+    :return: (width, height): square map
+    """
+    side = int(round(10 ** (exponent / 2.0)))
+    return side, side
+
+
+def goal_of(terrain, width, height):
+    """
+    :return: (x_pos, y_pos): goal of the benchmark query, the last open cell for mazes
+    """
+    if terrain == 'maze':
+        return (width - 1) // 2 * 2, (height - 1) // 2 * 2
+    return width - 1, height - 1
+
+
+def write_map(terrain, width, height, seed, path):
+    """
+    Generate a terrain and write it as a text map, or as a tiled map if path ends with .tmap
+
+    :return: None
+    """
+    row = GENERATORS[terrain](width, height, seed)
+    temporary = path + '.tmp'
+    if path.endswith('.tmap'):
+        with open(temporary, 'wb') as out:
+            tiledmap.write_tiled_map(out, width, height, ((y_pos, row(y_pos)) for y_pos in range(0, height)),
+                                     TILE_SIZE, 'h')
+    else:
+        with open(temporary, 'w') as out:
+            for y_pos in range(height - 1, -1, -1):                     # top row first
+                out.write(' '.join([str(value) for value in row(y_pos)]) + '\n')
+    os.rename(temporary, path)
+
+
+def map_path(directory, terrain, exponent, seed):
+    """
+    :return: (str) path of the generated map of a case, written if it does not exist yet
+    """
+    width, height = dimensions(exponent)
+    suffix = '.tmap' if width * height > TILED_CELLS else '.map'
+    path = os.path.join(directory, '%s-%d-%d%s' % (terrain, exponent, seed, suffix))
+    if not os.path.exists(path):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        write_map(terrain, width, height, seed, path)
+    return path
+
+
+def peak_rss():
+    """
+    :return: (int) peak resident memory of this process in KiB, None where it cannot be measured
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak         # bytes on macOS
+
+
+def track_frontier(search):
+    """
+    Record the peak frontier size of a search by sampling the frontier before every pop
+
+    :param search: astar.Search or bbfs.Search, before search() is called
+    :return: function () -> int: peak frontier size, None if the search has no frontier to sample
+    """
+    if getattr(search, 'optimal', None) is not None:
+        return lambda: None                                             # bbfs delegated to a heap search
+    frontiers = [frontier for frontier in (getattr(search, 'frontier', None), getattr(search, 'front_frontier', None),
+                                           getattr(search, 'back_frontier', None)) if frontier is not None]
+    if not frontiers:
+        return lambda: None
+    peak = [0]
+
+    def sampled(pop):
+        def wrapper():
+            peak[0] = max(peak[0], sum(len(frontier) for frontier in frontiers))
+            return pop()
+        return wrapper
+
+    for frontier in frontiers:
+        name = 'popleft' if hasattr(frontier, 'popleft') else 'pop'
+        setattr(frontier, name, sampled(getattr(frontier, name)))
+    return lambda: max(peak[0], sum(len(frontier) for frontier in frontiers))
+
+
+def run_case(case):
+    """
+    Run one benchmark case, meant to run in a fresh process (see run_isolated)
+
+    :param case: {str: value}: terrain, exponent, seed, algorithm, options, repeat, path
+    :return: {str: value}: the case with its measurements added
+    """
+    import environment
+    from state import State
+
+    search_pkg = __import__(case['algorithm'])
+    options = dict(case['options'])
+    width, height = dimensions(case['exponent'])
+    if width * height > TILED_CELLS:
+        options.setdefault('closed', 'hash')
+    goal = goal_of(case['terrain'], width, height)
+
+    started = timer()
+    with open(case['path'], 'rb' if case['path'].endswith('.tmap') else 'r') as mapfile:
+        env = environment.Environment(mapfile, 2 ** 62, goal)
+    load_time = timer() - started
+
+    result = dict(case)
+    best = None
+    for attempt in range(0, case['repeat']):
+        search = search_pkg.Search(State(0, 0), env.derive(2 ** 62, goal), **options)
+        peak_frontier = track_frontier(search)
+        started = timer()
+        solution, frontier, visited = search.search()
+        elapsed = timer() - started
+        if best is None or elapsed < best:
+            best = elapsed
+            result['expansions'] = len(visited)
+            result['peak_frontier'] = peak_frontier()
+            result['cost'] = solution.cost_so_far if solution else None
+
+    result['load_time'] = load_time
+    result['wall_time'] = best
+    result['expansions_per_second'] = result['expansions'] / best if best > 0 else None
+    result['peak_rss_kb'] = peak_rss()
+    return result
+
+
+def _child(case, results):
+    """
+    --- HELPER METHOD ---
+    Process body of run_isolated
+    """
+    try:
+        results.put(run_case(case))
+    except Exception as error:
+        results.put({'error': repr(error)})
+
+
+def run_isolated(case, time_limit=None):
+    """
+    Run a case in a new process so its memory peak is its own
+
+    :param case: {str: value}: see run_case
+    :param time_limit: (float) seconds before the case is stopped, None for no limit
+    :return: {str: value}: see run_case, with 'error' set when the case failed or timed out
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(case, results))
+    process.start()
+    deadline = None if time_limit is None else timer() + time_limit
+    result = None
+    while result is None:
+        wait = 1 if deadline is None else max(0.01, min(1, deadline - timer()))
+        try:
+            result = results.get(timeout=wait)
+        except queue.Empty:
+            if not process.is_alive():
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    result = {'error': 'exited with status %s' % process.exitcode}
+            elif deadline is not None and timer() > deadline:
+                result = {'error': 'timed out after %s seconds' % time_limit}
+    process.join(1)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    if 'error' in result:
+        failed = dict(case)
+        failed['error'] = result['error']
+        return failed
+    return result
+
+
+def case_key(result):
+    """
+    :return: (str) name of a case, used to match results with the baseline
+    """
+    options = ','.join('%s=%s' % item for item in sorted(result['options'].items()))
+    return '%s/%s/1e%d/seed%d%s' % (result['algorithm'], result['terrain'], result['exponent'], result['seed'],
+                                    '/' + options if options else '')
+
+
+def compare(results, baseline, threshold=0.25, min_time=MIN_TIME):
+    """
+    Compare results with a baseline
+
+    A case regresses when its wall time or peak memory grows by more than threshold, when its
+    expansion count or cost changes (the searches are deterministic), or when it fails.
+    Wall times below min_time in the baseline are too noisy and are not compared.
+
+    :param results: [{str: value}, ...]: results of run_case
+    :param baseline: [{str: value}, ...]: stored results of run_case
+    :param threshold: (float) allowed relative growth, 0.25 for 25%
+    :param min_time: (float) seconds
+    :return: [str, ...]: one message per regression
+    """
+    stored = dict((case_key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        if 'error' in result:
+            regressions.append('%s: %s' % (key, result['error']))
+            continue
+        reference = stored.get(key)
+        if reference is None or 'error' in reference:
+            continue
+        for field in ('expansions', 'cost'):
+            if result[field] != reference[field]:
+                regressions.append('%s: %s changed from %s to %s' % (key, field, reference[field], result[field]))
+        if reference['wall_time'] >= min_time and result['wall_time'] > reference['wall_time'] * (1 + threshold):
+            regressions.append('%s: wall time %.3fs, baseline %.3fs (+%.0f%%)' % (
+                key, result['wall_time'], reference['wall_time'],
+                100.0 * (result['wall_time'] / reference['wall_time'] - 1)))
+        if reference.get('peak_rss_kb') and result.get('peak_rss_kb') and \
+                result['peak_rss_kb'] > reference['peak_rss_kb'] * (1 + threshold):
+            regressions.append('%s: peak memory %d KiB, baseline %d KiB' % (
+                key, result['peak_rss_kb'], reference['peak_rss_kb']))
+    return regressions
+
+
+def describe(result):
+    """
+    :return: (str) one line summary of a result
+    """
+    if 'error' in result:
+        return '%-40s %s' % (case_key(result), result['error'])
+    return '%-40s %9.3fs %10d exp %12.0f exp/s frontier %8s rss %8s KiB' % (
+        case_key(result), result['wall_time'], result['expansions'], result['expansions_per_second'] or 0,
+        result['peak_frontier'], result['peak_rss_kb'])
+
+
+def parse_option_value(value):
+    """
+    :return: value as an int or a float if it is a number, as a string otherwise (like main.py)
+    """
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_report(path):
+    """
+    :param path: (str) file written by the run command
+    :return: {str: value}: python, platform, date and results
+    """
+    with open(path, 'r') as source:
+        return json.load(source)
+
+
+def check(report, baseline, threshold):
+    """
+    --- HELPER METHOD ---
+    Print the regressions of a report against a baseline report
+
+    :return: (int) exit status, 1 on a regression
+    """
+    if report['python'] != baseline['python']:
+        sys.stdout.write('WARNING baseline was measured with python %s, these results with python %s\n'
+                         % (baseline['python'], report['python']))
+    regressions = compare(report['results'], baseline['results'], threshold)
+    for regression in regressions:
+        sys.stdout.write('REGRESSION ' + regression + '\n')
+    return 1 if regressions else 0
+
+
+def run_suite(args):
+    """
+    --- HELPER METHOD ---
+    run command
+
+    :return: (int) exit status, 1 on a regression
+    """
+    options = {}
+    for option in args.search_option:
+        key, value = option.split('=', 1)
+        options[key] = parse_option_value(value)
+
+    results = []
+    for exponent in args.scales:
+        for terrain in args.terrains:
+            path = map_path(args.map_dir, terrain, exponent, args.seed)
+            for algorithm in args.algorithms:
+                case = {'terrain': terrain, 'exponent': exponent, 'seed': args.seed, 'algorithm': algorithm,
+                        'options': options, 'repeat': args.repeat, 'path': path}
+                result = run_isolated(case, args.time_limit)
+                del result['path']
+                results.append(result)
+                sys.stdout.write(describe(result) + '\n')
+                sys.stdout.flush()
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(report, out, indent=1, sort_keys=True, separators=(',', ': '))
+            out.write('\n')
+
+    if args.baseline:
+        return check(report, read_report(args.baseline), args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the searches on synthetic terrains')
+    commands = parser.add_subparsers(dest='command')
+
+    run = commands.add_parser('run', help='Run the benchmark suite')
+    run.add_argument('--scales', type=int, nargs='+', default=[2, 3, 4],
+                     help='Map sizes as powers of ten of the number of cells (2 to 8), default is 2 3 4')
+    run.add_argument('--terrains', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS),
+                     help='Terrains to generate, default is all of them')
+    run.add_argument('--algorithms', nargs='+', choices=ALGORITHMS, default=list(ALGORITHMS),
+                     help='Search modules to run, default is all of them')
+    run.add_argument('--search-option', metavar='KEY=VALUE', action='append', default=[],
+                     help='Extra keyword argument for the Search classes, may be given more than once')
+    run.add_argument('--seed', type=int, default=1, help='Terrain seed, default is 1')
+    run.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is kept, default is 3')
+    run.add_argument('--time-limit', type=float, default=None, help='Seconds before a case is stopped')
+    run.add_argument('--map-dir', default=os.path.join(tempfile.gettempdir(), 'astar-benchmark-maps'),
+                     help='Directory of the generated maps, reused across runs')
+    run.add_argument('--output', help='Write the results to this JSON file')
+    run.add_argument('--baseline', help='Compare with the results stored in this JSON file')
+    run.add_argument('--threshold', type=float, default=0.25,
+                     help='Allowed relative growth of time and memory, default is 0.25')
+
+    comparison = commands.add_parser('compare', help='Compare a results file with a baseline file')
+    comparison.add_argument('results', help='Results written by run --output')
+    comparison.add_argument('baseline', help='Baseline written by run --output')
+    comparison.add_argument('--threshold', type=float, default=0.25,
+                       help='Allowed relative growth of time and memory, default is 0.25')
+
+    generate = commands.add_parser('generate', help='Write a synthetic map')
+    generate.add_argument('terrain', choices=sorted(GENERATORS))
+    generate.add_argument('width', type=int)
+    generate.add_argument('height', type=int)
+    generate.add_argument('destination', help='Map to write, a tiled map if it ends with .tmap')
+    generate.add_argument('--seed', type=int, default=1, help='Terrain seed, default is 1')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        if any(scale < 2 or scale > 8 for scale in args.scales):
+            parser.error('scales must be between 2 and 8')
+        sys.exit(run_suite(args))
+    elif args.command == 'compare':
+        sys.exit(check(read_report(args.results), read_report(args.baseline), args.threshold))
+    elif args.command == 'generate':
+        write_map(args.terrain, args.width, args.height, args.seed, args.destination)
+    else:
+        parser.print_help()
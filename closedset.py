@@ -0,0 +1,109 @@
+#!usr/bin/python
+"""
+File:           closedset.py
+
+Author:         Alexander Adranly
+
+Description:    Closed set (explored states) implementations used by the search algorithms
+
+"""
+
+
+class GridClosedSet(object):
+
+    def __init__(self, width, height):
+        """
+        GRID CLOSED SET
+
+            One byte per cell of the map, indexed by y * width + x.
+            Membership tests and insertions are O(1) and the memory is bounded by the map size.
+
+        --- INSTANCE VARIABLES ---
+        self.cells: bytearray: 1 if the position has been explored, 0 otherwise
+        self.order: [State, ...]: explored nodes in the order they were added
+        """
+        self.width = width
+        self.cells = bytearray(width * height)
+        self.order = []
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, position):
+        return self.cells[position[1] * self.width + position[0]] != 0
+
+    def add(self, item, position):
+        """
+        Mark a position as explored
+
+        :param item: the explored node (usually a State)
+        :param position: (x_pos, y_pos): position of the node
+        :return: None
+        """
+        self.cells[position[1] * self.width + position[0]] = 1
+        self.order.append(item)
+
+    def items(self):
+        """
+        :return: [State, ...]: explored nodes, ordered ex: [first_explored, second_explored, ...]
+        """
+        return list(self.order)
+
+
+class HashClosedSet(object):
+
+    def __init__(self, width, height):
+        """
+        HASH CLOSED SET
+
+            Set of explored positions, for maps where the search only touches a small part of the grid
+
+        --- INSTANCE VARIABLES ---
+        self.positions: {(x_pos, y_pos), ...}: explored positions
+        self.order: [State, ...]: explored nodes in the order they were added
+        """
+        self.positions = set()
+        self.order = []
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, position):
+        return position in self.positions
+
+    def add(self, item, position):
+        """
+        Mark a position as explored
+
+        :param item: the explored node (usually a State)
+        :param position: (x_pos, y_pos): position of the node
+        :return: None
+        """
+        self.positions.add(position)
+        self.order.append(item)
+
+    def items(self):
+        """
+        :return: [State, ...]: explored nodes, ordered ex: [first_explored, second_explored, ...]
+        """
+        return list(self.order)
+
+
+CLOSED_SETS = {
+    'grid': GridClosedSet,
+    'hash': HashClosedSet,
+}
+
+
+def make_closed_set(name, width, height):
+    """
+    Build an empty closed set for a map
+
+    :param name: (str) one of 'grid' or 'hash'
+    :param width: (int) width of the map
+    :param height: (int) height of the map
+    :return: new closed set instance
+    """
+    if name not in CLOSED_SETS:
+        raise ValueError("unknown closed set '" + str(name) + "', expected one of " + str(sorted(CLOSED_SETS)))
+    return CLOSED_SETS[name](width, height)
@@ -0,0 +1,495 @@
+#!usr/bin/python
+"""
+File:           contraction.py
+
+Author:         Alexander Adranly
+
+Description:    Contraction hierarchy over the directed grid graph of a map, for maps that are queried
+                many times and rarely change
+
+    Preprocessing removes (contracts) the cells one at a time, cheapest first, and adds a shortcut
+    u -> w through a removed cell v whenever u -> v -> w is the only cheapest way from u to w that
+    is left. The order of removal is the rank of a cell. A query then runs a bidirectional Dijkstra
+    search that only follows edges towards higher ranks (upward from the start, and from the goal
+    over reversed edges), which settles a tiny part of the map. Shortcuts remember the cell they
+    skip, so paths are unpacked back into moves.
+
+    The hierarchy is saved to a compact binary file that is memory-mapped by queries:
+
+        header: HEADER (magic, width, height, forward edge count, backward edge count, map content hash)
+        forward costs (int64), backward costs (int64),
+        forward offsets (uint32, one per cell + 1), forward targets (uint32), forward middles (int32),
+        backward offsets (uint32, one per cell + 1), backward sources (uint32), backward middles (int32)
+
+    Forward edges of a cell go to higher ranked cells, backward edges of a cell come from higher ranked
+    cells. The middle of an edge is the cell a shortcut skips, -1 for a move of the grid.
+    Cells are numbered y * width + x.
+
+    Usage:
+        python contraction.py build <map> <hierarchy>
+"""
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from path import move_between
+from state import State
+
+MAGIC = b'ACHX'
+HEADER = struct.Struct('<4sIIII40s4x')
+
+# values are written in chunks of this many values
+CHUNK = 4096
+
+# a witness search gives up after settling this many cells, the shortcut is then kept
+WITNESS_LIMIT = 64
+
+NO_MIDDLE = -1
+
+
+class ContractionHierarchy(object):
+
+    def __init__(self, width, height, digest, forward, backward):
+        """
+        CONTRACTION HIERARCHY
+
+            Upward graphs of a contracted map, see the module description
+
+        --- INSTANCE VARIABLES ---
+        self.digest: str: content hash of the map (see Environment.content_hash)
+        self.forward: (offsets, targets, costs, middles): edges to higher ranked cells, by source cell
+        self.backward: (offsets, sources, costs, middles): edges from higher ranked cells, by target cell
+
+            Each part is a sequence of integers: lists when built in memory, views of the mapped file
+            when loaded (see load)
+        """
+        self.width = width
+        self.height = height
+        self.digest = digest
+        self.forward = forward
+        self.backward = backward
+        self.buffer = None
+        self.settled = []                                   # cells settled by the last query, in order
+
+    def query(self, start, goal):
+        """
+        Cheapest path between two positions
+
+        :param start: (x_pos, y_pos)
+        :param goal: (x_pos, y_pos)
+        :return: (cost, [(x_pos, y_pos), ...]): cost and positions of the path, start and goal included
+        """
+        source = start[1] * self.width + start[0]
+        target = goal[1] * self.width + goal[0]
+        cost, meeting, parents = self.upward_search(source, target)
+
+        # walk both searches back to the endpoints, then unpack the shortcuts
+        up = []
+        node = meeting
+        while node != source:
+            parent, middle = parents[0][node]
+            up.append((parent, node, middle))
+            node = parent
+        up.reverse()
+        node = meeting
+        while node != target:
+            child, middle = parents[1][node]
+            up.append((node, child, middle))
+            node = child
+
+        cells = [source]
+        for tail, head, middle in up:
+            cells.extend(self.unpack(tail, head, middle))
+        return cost, [(cell % self.width, cell // self.width) for cell in cells]
+
+    def cost(self, start, goal):
+        """
+        :return: (int) cost of the cheapest path between two positions, without building the path
+        """
+        return self.upward_search(start[1] * self.width + start[0], goal[1] * self.width + goal[0])[0]
+
+    def upward_search(self, source, target):
+        """
+        Bidirectional Dijkstra search on the upward graphs
+
+        A direction stops once its smallest label is no better than the best meeting found,
+        the other direction may still improve it
+
+        :param source: (int) start cell
+        :param target: (int) goal cell
+        :return: (cost, meeting cell, [{cell: (parent, middle)}, {cell: (child, middle)}])
+        """
+        labels = ({source: 0}, {target: 0})
+        parents = ({}, {})
+        settled = (set(), set())
+        queues = ([(0, source)], [(0, target)])
+        graphs = (self.forward, self.backward)
+        best, meeting = (0, source) if source == target else (None, None)
+        self.settled = []
+
+        while queues[0] or queues[1]:
+            for direction in (0, 1):
+                queue = queues[direction]
+                if not queue:
+                    continue
+                if best is not None and queue[0][0] >= best:
+                    del queue[:]                                    # this side cannot improve the meeting
+                    continue
+
+                distance, node = heapq.heappop(queue)
+                if node in settled[direction]:
+                    continue
+                settled[direction].add(node)
+                self.settled.append(node)
+
+                other = labels[1 - direction].get(node)
+                if other is not None and (best is None or distance + other < best):
+                    best, meeting = distance + other, node
+
+                offsets, neighbors, costs, middles = graphs[direction]
+                label, parent = labels[direction], parents[direction]
+                for edge in range(offsets[node], offsets[node + 1]):
+                    neighbor = neighbors[edge]
+                    cost = distance + costs[edge]
+                    if neighbor not in label or cost < label[neighbor]:
+                        label[neighbor] = cost
+                        parent[neighbor] = (node, middles[edge])
+                        heapq.heappush(queue, (cost, neighbor))
+
+        return best, meeting, parents
+
+    def unpack(self, tail, head, middle):
+        """
+        --- HELPER METHOD ---
+        Cells of the grid path an edge stands for
+
+        The middle of a shortcut was contracted before both of its ends, so the edge tail -> middle is a
+        backward edge of the middle and the edge middle -> head is a forward edge of the middle
+
+        :return: [int, ...]: cells after tail, up to and including head
+        """
+        cells = []
+        stack = [(tail, head, middle)]
+        while stack:
+            tail, head, middle = stack.pop()
+            if middle == NO_MIDDLE:
+                cells.append(head)
+                continue
+            # pushed in reverse: the first half is unpacked first
+            stack.append((middle, head, self.edge_middle(self.forward, middle, head)))
+            stack.append((tail, middle, self.edge_middle(self.backward, middle, tail)))
+        return cells
+
+    @staticmethod
+    def edge_middle(graph, node, neighbor):
+        """
+        --- HELPER METHOD ---
+        :return: (int) middle of the edge between node and neighbor stored with node
+        """
+        offsets, neighbors, costs, middles = graph
+        for edge in range(offsets[node], offsets[node + 1]):
+            if neighbors[edge] == neighbor:
+                return middles[edge]
+        raise ValueError("corrupt contraction hierarchy: missing edge %d - %d" % (node, neighbor))
+
+    def save(self, path):
+        """
+        Save the hierarchy, written to a temporary file first so readers never see a partial file
+
+        :param path: (str) destination
+        :return: None
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, self.width, self.height, len(self.forward[1]), len(self.backward[1]),
+                                  self.digest.encode('ascii')))
+            write_values(out, 'q', self.forward[2])
+            write_values(out, 'q', self.backward[2])
+            for graph in (self.forward, self.backward):
+                write_values(out, 'I', graph[0])
+                write_values(out, 'I', graph[1])
+                write_values(out, 'i', graph[3])
+        os.rename(temporary, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Memory-map a saved hierarchy, the edges are not copied
+
+        :param path: (str) file written by save
+        :return: ContractionHierarchy
+        """
+        with open(path, 'rb') as source:
+            buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, width, height, forward_count, backward_count, digest = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("'" + str(path) + "' is not a contraction hierarchy")
+
+        offset = [HEADER.size]
+
+        def section(typecode, count):
+            values = mapped_array(buffer, offset[0], typecode, count)
+            offset[0] += count * struct.calcsize('<' + typecode)
+            return values
+
+        cells = width * height
+        forward_costs = section('q', forward_count)
+        backward_costs = section('q', backward_count)
+        forward = (section('I', cells + 1), section('I', forward_count), forward_costs, section('i', forward_count))
+        backward = (section('I', cells + 1), section('I', backward_count), backward_costs,
+                    section('i', backward_count))
+
+        hierarchy = ContractionHierarchy(width, height, digest.decode('ascii'), forward, backward)
+        hierarchy.buffer = buffer
+        return hierarchy
+
+
+class MappedArray(object):
+
+    def __init__(self, buffer, offset, typecode, count):
+        """
+        Mapped Array
+
+            Zero-copy view of little-endian integers in a buffer, decoded one element at a time
+        """
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+        self.item = struct.Struct('<' + typecode)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("index out of range")
+        return self.item.unpack_from(self.buffer, self.offset + index * self.item.size)[0]
+
+
+def mapped_array(buffer, offset, typecode, count):
+    """
+    :return: read-only sequence of count integers of a buffer, a memoryview when the platform allows it
+    """
+    size = struct.calcsize('<' + typecode)
+    if sys.byteorder == 'little' and hasattr(memoryview, 'cast') and struct.calcsize(typecode) == size:
+        return memoryview(buffer)[offset:offset + count * size].cast(typecode)
+    return MappedArray(buffer, offset, typecode, count)
+
+
+def write_values(out, typecode, values):
+    """
+    Write integers in little-endian order, in chunks
+
+    :return: None
+    """
+    for start in range(0, len(values), CHUNK):
+        chunk = values[start:start + CHUNK]
+        out.write(struct.pack('<' + str(len(chunk)) + typecode, *chunk))
+
+
+def build(environment):
+    """
+    Contract every cell of a map
+
+    Cells are contracted by increasing importance: the number of shortcuts their contraction adds minus
+    the edges it removes, plus the number of their neighbors already contracted (spreads the contraction
+    evenly over the map). Importance is updated lazily: a popped cell whose importance grew is pushed back.
+
+    :param environment: (Environment) map
+    :return: ContractionHierarchy
+    """
+    width, height = environment.width, environment.height
+    cells = width * height
+    elevations = environment.flat_elevations()
+    elevation_cost = environment.elevation_cost
+
+    # remaining graph: outgoing[v][w] = (cost, middle), incoming[w][v] = cost
+    outgoing = [dict() for cell in range(0, cells)]
+    incoming = [dict() for cell in range(0, cells)]
+    for cell in range(0, cells):
+        x_pos = cell % width
+        for neighbor in (cell + width if cell + width < cells else -1,
+                         cell + 1 if x_pos < width - 1 else -1,
+                         cell - width if cell >= width else -1,
+                         cell - 1 if x_pos > 0 else -1):
+            if neighbor >= 0:
+                cost = elevation_cost(elevations[cell], elevations[neighbor])
+                outgoing[cell][neighbor] = (cost, NO_MIDDLE)
+                incoming[neighbor][cell] = cost
+
+    contracted = bytearray(cells)
+    deleted_neighbors = [0] * cells
+    forward = [None] * cells
+    backward = [None] * cells
+
+    def witness(source, skipped, heads, limit):
+        # costs from source to the cells within limit, without going through skipped,
+        # until every head is settled
+        labels = {source: 0}
+        queue = [(0, source)]
+        settled = 0
+        remaining = len(heads)
+        while queue and settled < WITNESS_LIMIT and remaining > 0:
+            distance, node = heapq.heappop(queue)
+            if distance > labels[node]:
+                continue
+            settled += 1
+            if node in heads:
+                remaining -= 1
+            for neighbor, edge in outgoing[node].items():
+                cost = distance + edge[0]
+                if neighbor == skipped or cost > limit:
+                    continue
+                if neighbor not in labels or cost < labels[neighbor]:
+                    labels[neighbor] = cost
+                    heapq.heappush(queue, (cost, neighbor))
+        return labels
+
+    def shortcuts(node):
+        # shortcuts needed to contract node
+        needed = []
+        heads = outgoing[node]
+        if not heads:
+            return needed
+        longest = max(edge[0] for edge in heads.values())
+        for tail, tail_cost in incoming[node].items():
+            labels = witness(tail, node, heads, tail_cost + longest)
+            for head, edge in heads.items():
+                if head == tail:
+                    continue
+                cost = tail_cost + edge[0]
+                if labels.get(head, cost + 1) > cost:
+                    needed.append((tail, head, cost))
+        return needed
+
+    def importance(node, added):
+        return (len(added) - len(outgoing[node]) - len(incoming[node])) + deleted_neighbors[node]
+
+    queue = [(importance(cell, shortcuts(cell)), cell) for cell in range(0, cells)]
+    heapq.heapify(queue)
+
+    while queue:
+        priority, node = heapq.heappop(queue)
+        if contracted[node]:
+            continue
+        added = shortcuts(node)
+        current = importance(node, added)
+        if queue and current > queue[0][0]:
+            heapq.heappush(queue, (current, node))                  # lazy update
+            continue
+
+        # remaining neighbors are all ranked higher than node
+        forward[node] = [(head, edge[0], edge[1]) for head, edge in sorted(outgoing[node].items())]
+        backward[node] = [(tail, cost, outgoing[tail][node][1]) for tail, cost in sorted(incoming[node].items())]
+
+        contracted[node] = 1
+        for head in outgoing[node]:
+            del incoming[head][node]
+            deleted_neighbors[head] += 1
+        for tail in incoming[node]:
+            del outgoing[tail][node]
+            deleted_neighbors[tail] += 1
+        outgoing[node] = {}
+        incoming[node] = {}
+
+        for tail, head, cost in added:
+            existing = outgoing[tail].get(head)
+            if existing is None or cost < existing[0]:
+                outgoing[tail][head] = (cost, node)
+                incoming[head][tail] = cost
+
+    return ContractionHierarchy(width, height, environment.content_hash(), compress(forward), compress(backward))
+
+
+def compress(edges):
+    """
+    --- HELPER METHOD ---
+    :param edges: [[(neighbor, cost, middle), ...], ...]: edges of every cell
+    :return: (offsets, neighbors, costs, middles): the same edges in flat lists
+    """
+    offsets, neighbors, costs, middles = [0], [], [], []
+    for cell_edges in edges:
+        for neighbor, cost, middle in cell_edges:
+            neighbors.append(neighbor)
+            costs.append(cost)
+            middles.append(middle)
+        offsets.append(len(neighbors))
+    return offsets, neighbors, costs, middles
+
+
+def hierarchy_for(environment, ch_file=None):
+    """
+    Contraction hierarchy of a map: mapped from ch_file, or built once and kept on the environment
+
+    :return: ContractionHierarchy
+    """
+    key = ('contraction', ch_file)
+    if key not in environment.hierarchies:
+        if ch_file is None:
+            hierarchy = build(environment)
+        else:
+            hierarchy = ContractionHierarchy.load(ch_file)
+            if (hierarchy.width, hierarchy.height, hierarchy.digest) != \
+                    (environment.width, environment.height, environment.content_hash()):
+                raise ValueError("'" + str(ch_file) + "' was built for another map")
+        environment.hierarchies[key] = hierarchy
+    return environment.hierarchies[key]
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment, ch_file=None):
+        """
+        CONTRACTION HIERARCHY QUERY
+
+            Answers a query with a bidirectional upward search on a contraction hierarchy.
+            Costs are the same as the ones of astar.Search, a path over the energy budget is no solution.
+
+        --- PARAMETERS ---
+        ch_file: str: hierarchy built with 'python contraction.py build', None to build it in memory
+
+        --- INSTANCE VARIABLES ---
+        self.hierarchy: ContractionHierarchy: hierarchy of the map
+        """
+        self.init_state = init_state
+        self.environment = environment
+        self.hierarchy = hierarchy_for(environment, ch_file)
+
+    def search(self):
+        """
+        :return:
+        solution (State): goal state, its moves_so_far are the moves in order, or None
+        frontier ([State, ...]): always empty, the searches stop as soon as the path is proven
+        visited ([State, ...]): cells settled by both searches in order, without moves or costs
+        """
+        environment = self.environment
+        cost, positions = self.hierarchy.query(self.init_state.position, (environment.end_x, environment.end_y))
+        visited = [State(cell % self.hierarchy.width, cell // self.hierarchy.width) for cell in self.hierarchy.settled]
+
+        if self.init_state.cost_so_far + cost > environment.energy_budget:
+            return None, [], visited
+
+        current = self.init_state
+        for position in positions[1:]:
+            next_state = State(position[0], position[1])
+            next_state.parent = current
+            next_state.move = move_between(current.position, position)
+            next_state.cost_so_far = current.cost_so_far + environment.transition_cost(
+                current.position[0], current.position[1], position[0], position[1])
+            current = next_state
+        return current, [], visited
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        sys.stderr.write("usage: python contraction.py build <map> <hierarchy>\n")
+        sys.exit(1)
+
+    from environment import Environment
+    with open(sys.argv[2]) as map_file:
+        build(Environment(map_file, 0, (-1, -1))).save(sys.argv[3])
@@ -0,0 +1,247 @@
+#!usr/bin/python
+"""
+File:           costtogo.py
+
+Author:         Alexander Adranly
+
+Description:    Exact cost-to-go tables computed by a reverse Dijkstra search from a goal
+
+    The cost-to-go of a position is the cost of the cheapest path from that position to the goal.
+    Used as the heuristic of astar.Search (heuristic='exact') it is perfect: only states on optimal
+    paths are expanded, and a query whose start cost-to-go exceeds the energy budget is rejected
+    without searching.
+
+    Tables are kept in an LRU cache keyed by (map content hash, goal) and can be persisted to a
+    directory so that a restarted process does not pay for them again.
+"""
+import heapq
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+from environment import Environment
+
+# header of a persisted table: magic, width, height
+MAGIC = b'CTGO'
+HEADER = struct.Struct('<4sII')
+
+# rows are written in chunks of this many values
+CHUNK = 4096
+
+
+def dijkstra(width, height, elevations, source, reverse=False):
+    """
+    Dijkstra search over the whole map from a source position
+
+    With reverse=True the edges are reversed: relaxing the edge from a position to its neighbor
+    costs the move from the neighbor to the position, so the distances are costs to reach the
+    source rather than costs from it (the cost function is asymmetric)
+
+    :param width: (int) width of the map
+    :param height: (int) height of the map
+    :param elevations: [int, ...]: elevations in row-major order (see Environment.flat_elevations)
+    :param source: (x_pos, y_pos): source position
+    :param reverse: (bool) compute costs to the source instead of costs from it
+    :return: [int, ...]: cost of every position in row-major order, index y * width + x
+    """
+    size = width * height
+    elevation_cost = Environment.elevation_cost
+    distances = [-1] * size                                 # -1: not reached yet
+    settled = bytearray(size)
+
+    root = source[1] * width + source[0]
+    distances[root] = 0
+    queue = [(0, root)]
+
+    while queue:
+        distance, index = heapq.heappop(queue)
+        if settled[index]:
+            continue                                        # stale entry
+        settled[index] = 1
+        elevation = elevations[index]
+        x_pos = index % width
+
+        for neighbor in (index - width if index >= width else -1,
+                         index + 1 if x_pos < width - 1 else -1,
+                         index + width if index + width < size else -1,
+                         index - 1 if x_pos > 0 else -1):
+            if neighbor < 0 or settled[neighbor]:
+                continue
+            if reverse:
+                # the agent moves from the neighbor to this position
+                cost = distance + elevation_cost(elevations[neighbor], elevation)
+            else:
+                cost = distance + elevation_cost(elevation, elevations[neighbor])
+            if distances[neighbor] < 0 or cost < distances[neighbor]:
+                distances[neighbor] = cost
+                heapq.heappush(queue, (cost, neighbor))
+
+    return distances
+
+
+def reverse_dijkstra(width, height, elevations, goal):
+    """
+    :return: [int, ...]: cost-to-go of every position to the goal in row-major order, see dijkstra
+    """
+    return dijkstra(width, height, elevations, goal, reverse=True)
+
+
+def write_values(out, values):
+    """
+    Write integers as little-endian int64, in chunks
+
+    :param out: (file) binary output
+    :param values: [int, ...]
+    :return: None
+    """
+    for start in range(0, len(values), CHUNK):
+        chunk = values[start:start + CHUNK]
+        out.write(struct.pack('<' + str(len(chunk)) + 'q', *chunk))
+
+
+def read_values(source, count):
+    """
+    :param source: (file) binary input
+    :param count: (int) number of values to read
+    :return: [int, ...]: values written by write_values
+    """
+    values = []
+    while count > 0:
+        chunk = min(CHUNK, count)
+        values.extend(struct.unpack('<' + str(chunk) + 'q', source.read(chunk * 8)))
+        count -= chunk
+    return values
+
+
+def to_table(width, distances):
+    """
+    :param width: (int) width of the map
+    :param distances: [int, ...]: row-major values
+    :return: int[][]: the same values indexed [x][y], like Environment.heuristic_table
+    """
+    return [distances[x_pos::width] for x_pos in range(0, width)]
+
+
+class CostToGoCache(object):
+
+    def __init__(self, size=8, directory=None):
+        """
+        COST-TO-GO CACHE
+
+            LRU cache of cost-to-go tables keyed by (map content hash, goal)
+
+        --- INSTANCE VARIABLES ---
+        self.size: int: maximum number of tables kept in memory
+        self.directory: str: directory the tables are persisted to, None to keep them in memory only
+        self.tables: OrderedDict: (digest, goal) -> int[][], least recently used first
+        """
+        self.size = size
+        self.directory = directory
+        self.tables = OrderedDict()
+
+    def __len__(self):
+        return len(self.tables)
+
+    def table(self, environment, goal=None):
+        """
+        Cost-to-go table of a goal, computed on a miss
+
+        :param environment: (Environment) map
+        :param goal: (x_pos, y_pos): goal position, defaults to the goal of the environment
+        :return: int[][]: cost-to-go indexed [x][y]
+        """
+        goal = (environment.end_x, environment.end_y) if goal is None else tuple(goal)
+        key = (environment.content_hash(), goal)
+
+        table = self.tables.pop(key, None)
+        if table is None:
+            table = self.load(key)
+            if table is None:
+                distances = reverse_dijkstra(environment.width, environment.height,
+                                             environment.flat_elevations(), goal)
+                self.save(key, environment.width, environment.height, distances)
+                table = to_table(environment.width, distances)
+            while len(self.tables) >= self.size > 0:
+                self.tables.popitem(last=False)                         # least recently used
+        if self.size > 0:
+            self.tables[key] = table                                    # most recently used goes last
+        return table
+
+    def clear(self):
+        """
+        Drop the tables kept in memory, persisted tables are kept
+
+        :return: None
+        """
+        self.tables.clear()
+
+    def path(self, key):
+        """
+        :param key: (digest, (x_pos, y_pos))
+        :return: (str) file the table of key is persisted to, None without a directory
+        """
+        if self.directory is None:
+            return None
+        digest, goal = key
+        return os.path.join(self.directory, '%s-%d-%d.ctg' % (digest, goal[0], goal[1]))
+
+    def load(self, key):
+        """
+        :param key: (digest, (x_pos, y_pos))
+        :return: int[][]: persisted table of key, None if there is none
+        """
+        path = self.path(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as table_file:
+            magic, width, height = HEADER.unpack(table_file.read(HEADER.size))
+            if magic != MAGIC:
+                return None
+            distances = read_values(table_file, width * height)
+        return to_table(width, distances)
+
+    def save(self, key, width, height, distances):
+        """
+        Persist a table, written to a temporary file first so readers never see a partial table
+
+        :return: None
+        """
+        path = self.path(key)
+        if path is None:
+            return
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as table_file:
+            table_file.write(HEADER.pack(MAGIC, width, height))
+            write_values(table_file, distances)
+        os.rename(temporary, path)
+
+
+# cache used by astar.Search(heuristic='exact')
+cache = CostToGoCache()
+
+
+def configure(size=8, directory=None):
+    """
+    Replace the shared cache
+
+    :param size: (int) maximum number of tables kept in memory
+    :param directory: (str) directory the tables are persisted to, None to keep them in memory only
+    :return: CostToGoCache: the new shared cache
+    """
+    global cache
+    cache = CostToGoCache(size, directory)
+    return cache
+
+
+def cost_to_go_table(environment, goal=None):
+    """
+    :param environment: (Environment) map
+    :param goal: (x_pos, y_pos): goal position, defaults to the goal of the environment
+    :return: int[][]: cost-to-go indexed [x][y], from the shared cache
+    """
+    return cache.table(environment, goal)
@@ -0,0 +1,251 @@
+#!usr/bin/python
+"""
+File:           dstar.py
+
+Author:         Alexander Adranly
+
+Description:    Implementation of the Search class for D* Lite, an incremental search that repairs its
+                previous result when elevations change or when the agent moves
+
+    The search runs backwards from the goal: g(s) is the cost from s to the goal found so far and
+    rhs(s) = min over the neighbors s' of cost(s, s') + g(s') is its one-step lookahead. A state is
+    consistent when g(s) == rhs(s); only inconsistent states are queued. When elevations change,
+    only the states next to the changed cells get a new rhs, and the search expands the states whose
+    cost to the goal actually changed instead of starting over.
+
+    The heuristic is the manhattan distance: unlike the default heuristic it does not depend on the
+    elevations, so the keys of queued states stay valid when the map changes.
+
+    Usage:
+        search = dstar.Search(State(0, 0), environment)
+        solution, frontier, visited = search.search()
+        environment.set_elevation(4, 2, 9)                  # or environment.patch(...)
+        solution, frontier, visited = search.replan()       # optionally replan(new_start)
+"""
+import heapq
+
+from path import move_between
+from state import State
+
+INFINITY = float('inf')
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment):
+        """
+        D* LITE SEARCH ALGORITHM
+
+        --- INSTANCE VARIABLES ---
+        self.g, self.rhs: {(x_pos, y_pos): int}: cost to the goal and its lookahead, infinite when missing
+
+        self.queue: [(k1, k2, counter, position), ...]: heap of inconsistent states
+            Entries are not removed from the heap, self.keys holds the (k1, k2, counter) of the one valid
+            entry of every queued state and any other entry of the state is skipped when popped
+
+        self.km: int: sum of the heuristic distances the start moved, added to new keys so old keys
+            stay lower bounds without reordering the heap
+
+        self.revision: int: number of environment changes already repaired (see Environment.changes)
+
+        self.expanded: [(x_pos, y_pos), ...]: states expanded by the last search() or replan()
+        """
+        self.environment = environment
+        self.start = init_state.position
+        self.init_state = init_state
+        self.goal = (environment.end_x, environment.end_y)
+        self.last = self.start
+        self.km = 0
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.queue = []
+        self.keys = {}
+        self.counter = 0
+        self.revision = len(environment.changes)
+        self.expanded = []
+        self.push(self.goal)
+
+    def search(self):
+        """
+        Function driver for the first search
+
+        :return:
+        solution (State): state at the goal, its moves_so_far are the moves in order, or None
+        frontier ([State, ...]): inconsistent states left in the queue, cost_so_far is their cost to the goal
+        visited ([State, ...]): states expanded by this search, in order, cost_so_far is their cost to the goal
+        """
+        self.expanded = []
+        self.compute_shortest_path()
+        return self.results()
+
+    def replan(self, start=None):
+        """
+        Repair the previous search after elevations changed and / or the agent moved
+
+        :param start: (x_pos, y_pos): new position of the agent, None if it did not move
+        :return: same as search(), visited only holds the states expanded by the repair
+        """
+        if start is not None and tuple(start) != self.start:
+            self.start = tuple(start)
+            self.init_state = State(self.start[0], self.start[1])
+            self.km += self.heuristic(self.last, self.start)
+            self.last = self.start
+
+        changed = set()
+        for x_min, y_min, x_max, y_max in self.environment.changes[self.revision:]:
+            for y_pos in range(y_min, y_max + 1):
+                for x_pos in range(x_min, x_max + 1):
+                    # the costs of the moves into and out of the cell changed
+                    changed.add((x_pos, y_pos))
+                    for x_next, y_next, move in self.environment.successors(x_pos, y_pos):
+                        changed.add((x_next, y_next))
+        self.revision = len(self.environment.changes)
+
+        self.expanded = []
+        for position in changed:
+            self.update_vertex(position)
+        self.compute_shortest_path()
+        return self.results()
+
+    def compute_shortest_path(self):
+        """
+        Expand inconsistent states until the start is consistent and no queued state can lower its cost
+
+        :return: None
+        """
+        while True:
+            top = self.top()
+            start_key = self.key(self.start)
+            g_start, rhs_start = self.g.get(self.start, INFINITY), self.rhs.get(self.start, INFINITY)
+            if top is None or (top[:2] >= start_key and rhs_start == g_start):
+                return
+
+            old_key = top[:2]
+            position = top[3]
+            heapq.heappop(self.queue)
+            del self.keys[position]
+
+            new_key = self.key(position)
+            if old_key < new_key:
+                self.push(position)                                 # the start moved since it was queued
+                continue
+
+            self.expanded.append(position)
+            g_value, rhs_value = self.g.get(position, INFINITY), self.rhs.get(position, INFINITY)
+            if g_value > rhs_value:
+                # overconsistent: the cost to the goal went down
+                self.g[position] = rhs_value
+                for x_next, y_next, move in self.environment.successors(position[0], position[1]):
+                    self.update_vertex((x_next, y_next))
+            else:
+                # underconsistent: the cost to the goal went up, recompute the state and its neighbors
+                self.g[position] = INFINITY
+                self.update_vertex(position)
+                for x_next, y_next, move in self.environment.successors(position[0], position[1]):
+                    self.update_vertex((x_next, y_next))
+
+    def update_vertex(self, position):
+        """
+        Recompute the lookahead of a state and (re)queue it if it is inconsistent
+
+        :return: None
+        """
+        if position != self.goal:
+            x_pos, y_pos = position
+            best = INFINITY
+            for x_next, y_next, move in self.environment.successors(x_pos, y_pos):
+                g_next = self.g.get((x_next, y_next), INFINITY)
+                if g_next != INFINITY:
+                    best = min(best, self.environment.transition_cost(x_pos, y_pos, x_next, y_next) + g_next)
+            self.rhs[position] = best
+
+        if self.g.get(position, INFINITY) != self.rhs.get(position, INFINITY):
+            self.push(position)
+        else:
+            self.keys.pop(position, None)
+
+    def key(self, position):
+        """
+        :return: (k1, k2): priority of a state, compared lexicographically
+        """
+        value = min(self.g.get(position, INFINITY), self.rhs.get(position, INFINITY))
+        return value + self.heuristic(self.start, position) + self.km, value
+
+    @staticmethod
+    def heuristic(source, target):
+        """
+        Manhattan distance: every move costs at least 1, whatever the elevations
+
+        :return: (int) lower bound on the cost between two positions
+        """
+        return abs(source[0] - target[0]) + abs(source[1] - target[1])
+
+    def push(self, position):
+        """
+        --- HELPER METHOD ---
+        Queue a state with its current key, nothing is pushed if it is already queued with that key
+        """
+        key = self.key(position)
+        queued = self.keys.get(position)
+        if queued is not None and queued[:2] == key:
+            return
+        self.counter += 1
+        self.keys[position] = (key[0], key[1], self.counter)
+        heapq.heappush(self.queue, (key[0], key[1], self.counter, position))
+
+    def top(self):
+        """
+        --- HELPER METHOD ---
+        :return: the smallest valid heap entry, None when no state is queued
+        """
+        while self.queue:
+            k1, k2, counter, position = self.queue[0]
+            if self.keys.get(position) == (k1, k2, counter):
+                return self.queue[0]
+            heapq.heappop(self.queue)                               # stale entry
+        return None
+
+    def results(self):
+        """
+        --- HELPER METHOD ---
+        Follow the cheapest moves from the start to the goal
+
+        :return: same as search()
+        """
+        frontier = [self.cost_state(entry[3]) for entry in sorted(self.queue)
+                    if self.keys.get(entry[3]) == entry[:3]]
+        visited = [self.cost_state(position) for position in self.expanded]
+
+        environment = self.environment
+        remaining = self.g.get(self.start, INFINITY)
+        if remaining == INFINITY or self.init_state.cost_so_far + remaining > environment.energy_budget:
+            return None, frontier, visited
+
+        current = self.init_state
+        while current.position != self.goal:
+            x_pos, y_pos = current.position
+            best, best_position = INFINITY, None
+            # N, E, S, W: the first of equally cheap moves is taken
+            for x_next, y_next, move in environment.successors(x_pos, y_pos):
+                cost = environment.transition_cost(x_pos, y_pos, x_next, y_next) + \
+                    self.g.get((x_next, y_next), INFINITY)
+                if cost < best:
+                    best, best_position = cost, (x_next, y_next)
+
+            next_state = State(best_position[0], best_position[1])
+            next_state.parent = current
+            next_state.move = move_between(current.position, best_position)
+            next_state.cost_so_far = current.cost_so_far + environment.transition_cost(
+                x_pos, y_pos, best_position[0], best_position[1])
+            current = next_state
+
+        return current, frontier, visited
+
+    def cost_state(self, position):
+        """
+        --- HELPER METHOD ---
+        :return: State: state at position whose cost_so_far is its cost to the goal
+        """
+        cost_state = State(position[0], position[1])
+        cost_state.cost_so_far = min(self.g.get(position, INFINITY), self.rhs.get(position, INFINITY))
+        return cost_state
@@ -1,8 +1,22 @@
 #!/usr/bin/python
 
 # import state
+import copy
+import hashlib
+import mapformat
+from path import MOVE_N, MOVE_E, MOVE_S, MOVE_W, opposite_moves
 from state import State
+import struct
 import sys
+import tiledmap
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+STORAGE_MODES = ('auto', 'list', 'numpy')
 
 
 class Environment:
@@ -11,37 +25,139 @@ class Environment:
     # Member data
     # elevations: raw data for each position, stored in a list of lists
     #             (each outer list represents a single row)
+    #             or in a 2D numpy array indexed [row, column]
+    #             binary maps are memory-mapped instead of copied (see mapformat.py)
+    #             tiled maps are read tile by tile through an LRU cache (see tiledmap.py)
+    # storage: 'list', 'numpy' or 'tiled', how elevations are stored
     # height: number of rows
     # width: number of elements in each row
     # end_x, end_y: location of goal
-
-    def __init__(self, mapfile, energy_budget, end_coords):
+    # heuristic_cache: recently used heuristic tables by goal, None when caching is off
+    # digests: {revision: hash} of the map content (see content_hash), shared with derived environments
+    # changes: regions changed since the map was loaded, shared with derived environments;
+    #          its length is the revision of the map (see region_changed)
+    # map_path: path of the map file, None when the map was not read from a named file
+    # hierarchies: abstract graphs of the map by (cluster size, entrance width), see hierarchy.py
+
+    def __init__(self, mapfile, energy_budget, end_coords, storage='auto'):
+        if storage not in STORAGE_MODES:
+            raise ValueError("unknown storage '" + str(storage) + "', expected one of " + str(STORAGE_MODES))
+        if storage == 'numpy' and numpy is None:
+            raise ValueError("storage 'numpy' requires numpy to be installed")
+        if storage == 'auto':
+            storage = 'list' if numpy is None else 'numpy'
+
+        self.storage = storage
         self.elevations = []
         self.height = 0
         self.width = -1
         self.end_x, self.end_y = end_coords
         self.energy_budget = energy_budget
+        self.heuristic_cache = None
+        self.digests = {}
+        self.changes = []
+        self.hierarchies = {}
+        self.map_path = mapfile if isinstance(mapfile, str) else getattr(mapfile, 'name', None)
         # Read in the data
+        if tiledmap.is_tiled_map(mapfile):
+            self.open_tiled_map(self.map_path)
+        elif mapformat.is_binary_map(mapfile):
+            self.open_binary_map(self.map_path)
+        elif isinstance(mapfile, str):
+            with open(mapfile, 'r') as opened:
+                self.read_text_map(opened)
+        else:
+            self.read_text_map(mapfile)
+        if self.end_x == -1:
+            self.end_x = self.width - 1
+        if self.end_y == -1:
+            self.end_y = self.height - 1
+
+    def read_text_map(self, mapfile):
+        """
+        Parse a text map, one row of whitespace separated elevations per line, top row first
+        
+        Rows are appended while streaming through the file and flipped once at the end,
+        so loading is linear in the size of the map
+        
+        :param mapfile: (file) text map
+        :return: None
+        """
+        rows = []
         for line in mapfile:
-            nextline = [ int(x) for x in line.split()]
+            nextline = [int(x) for x in line.split()]
             if self.width == -1:
                 self.width = len(nextline)
             elif len(nextline) == 0:
                 sys.stderr.write("No data (or parse error) on line %d\n"
-                                 % (len(self.elevations) + 1))
+                                 % (len(rows) + 1))
                 sys.exit(1)
             elif self.width != len(nextline):
                 sys.stderr.write("Inconsistent map width in row %d\n"
-                                 % (len(self.elevations) + 1))
+                                 % (len(rows) + 1))
                 sys.stderr.write("Expected %d elements, saw %d\n"
                                  % (self.width, len(nextline)))
                 sys.exit(1)
-            self.elevations.insert(0, nextline)
-        self.height = len(self.elevations)
-        if self.end_x == -1:
-            self.end_x = self.width - 1
-        if self.end_y == -1:
-            self.end_y = self.height - 1
+            rows.append(nextline)
+        rows.reverse()                                          # last line of the file is y = 0
+        self.height = len(rows)
+        if self.storage == 'numpy':
+            self.elevations = numpy.array(rows, dtype=numpy.int64)
+        else:
+            self.elevations = rows
+
+    def open_binary_map(self, path):
+        """
+        Memory-map a binary map (see mapformat.py), the elevations are not copied
+        
+        :param path: (str) path of the binary map
+        :return: None
+        """
+        self.width, self.height, self.elevations = mapformat.open_binary_map(path,
+                                                                            use_numpy=self.storage == 'numpy')
+
+    def open_tiled_map(self, path):
+        """
+        Open a tiled map (see tiledmap.py), tiles are read when a search first touches them
+        
+        Heuristic tables are computed lazily for tiled maps, see LazyHeuristicTable
+        
+        :param path: (str) path of the tiled map
+        :return: None
+        """
+        self.storage = 'tiled'
+        self.width, self.height, self.elevations = tiledmap.open_tiled_map(path)
+
+    def derive(self, energy_budget, end_coords):
+        """
+        Environment for another query on the same map
+        
+        The elevations (and the heuristic cache, if any) are shared with this environment, not copied
+        
+        :param energy_budget: (int) energy budget of the query
+        :param end_coords: (x_pos, y_pos): goal of the query, -1 for the last column / row
+        :return: Environment: shallow copy with the new goal and budget
+        """
+        derived = copy.copy(self)
+        derived.energy_budget = energy_budget
+        derived.end_x, derived.end_y = end_coords
+        if derived.end_x == -1:
+            derived.end_x = self.width - 1
+        if derived.end_y == -1:
+            derived.end_y = self.height - 1
+        return derived
+
+    def enable_heuristic_cache(self, size):
+        """
+        Keep the heuristic tables of the most recently used goals, so queries that share a goal
+        only pay for the table once
+        
+        :param size: (int) maximum number of tables kept
+        :return: None
+        """
+        self.heuristic_cache = OrderedDict()
+        self.heuristic_cache_size = size
+        self.heuristic_cache_counts = {'hits': 0, 'misses': 0}             # shared with derived environments
 
     def is_valid_position(self, x_pos, y_pos):
         """
@@ -64,11 +180,236 @@ class Environment:
         :return: int: elevation of coordinate space
         """
         if self.is_valid_position(x_pos=x_pos, y_pos=y_pos):
+            if self.storage == 'numpy':
+                return self.elevations.item(y_pos, x_pos)       # item() hands back a python int
+            if self.storage == 'tiled':
+                return self.elevations.elevation(x_pos, y_pos)
             return self.elevations[y_pos][x_pos]                # column-major ordering of elevations
 
         # not a valid position, raise an error (something must be wrong with code)
         raise Exception("error: invalid position (" + str(x_pos) + ", " + str(y_pos) + ")")
 
+    def elevations_at(self, positions):
+        """
+        Bulk version of elevation()
+        
+        :param positions: [(x_pos, y_pos), ...]: coordinates you want the elevation of
+        :return: [int, ...]: elevation of each coordinate, in the same order
+        """
+        if self.storage == 'numpy':
+            coords = numpy.asarray(positions, dtype=numpy.int64).reshape(-1, 2)
+            xs, ys = coords[:, 0], coords[:, 1]
+            invalid = (xs < 0) | (xs >= self.width) | (ys < 0) | (ys >= self.height)
+            if invalid.any():
+                bad = coords[invalid.argmax()]
+                raise Exception("error: invalid position (" + str(bad[0]) + ", " + str(bad[1]) + ")")
+            return self.elevations[ys, xs].tolist()
+
+        return [self.elevation(x_pos, y_pos) for x_pos, y_pos in positions]
+
+    def set_elevation(self, x_pos, y_pos, elevation):
+        """
+        Change the elevation of a single position
+        
+        :param x_pos: (int) x coordinate
+        :param y_pos: (int) y coordinate
+        :param elevation: (int) new elevation
+        :return: None
+        """
+        self.patch(x_pos, y_pos, [[elevation]])
+
+    def patch(self, x_min, y_min, rows):
+        """
+        Change the elevations of a rectangle of the map at once
+        
+        A memory-mapped binary map is copied into memory on its first change, the file is never written.
+        The copy is not shared with the environments derived from the same map (see detach)
+        
+        :param x_min: (int) x coordinate of the first column of the rectangle
+        :param y_min: (int) y coordinate of the first row of the rectangle
+        :param rows: int[][]: new elevations indexed [y - y_min][x - x_min], all rows of the same length
+        :return: None
+        """
+        height = len(rows)
+        width = len(rows[0]) if height else 0
+        if width == 0 or any(len(row) != width for row in rows):
+            raise ValueError("patch rows must be non-empty and of the same length")
+        if not (self.is_valid_position(x_min, y_min) and
+                self.is_valid_position(x_min + width - 1, y_min + height - 1)):
+            raise ValueError("patch of %dx%d at (%d, %d) is outside of the map" % (width, height, x_min, y_min))
+
+        if self.storage == 'numpy':
+            if not self.elevations.flags.writeable:
+                self.elevations = numpy.array(self.elevations, dtype=numpy.int64)
+                self.detach()
+            self.elevations[y_min:y_min + height, x_min:x_min + width] = rows
+        elif self.storage == 'tiled':
+            self.elevations.write(x_min, y_min, rows)
+        else:
+            if isinstance(self.elevations, mapformat.MappedRows):
+                self.elevations = [row.tolist() for row in self.elevations]
+                self.detach()
+            for offset, row in enumerate(rows):
+                self.elevations[y_min + offset][x_min:x_min + width] = [int(value) for value in row]
+
+        self.region_changed(x_min, y_min, x_min + width - 1, y_min + height - 1)
+
+    def detach(self):
+        """
+        --- HELPER METHOD ---
+        Stop sharing what is computed from the elevations with the environments derived from the same map,
+        once this environment holds a copy of the elevations of its own (see derive and patch)
+        """
+        self.digests = {}
+        self.changes = list(self.changes)
+        self.hierarchies = {}
+        if self.heuristic_cache is not None:
+            self.heuristic_cache = OrderedDict()
+
+    def region_changed(self, x_min, y_min, x_max, y_max):
+        """
+        Record a changed region and drop what was computed from its elevations
+        
+        The content hash and cached heuristic tables are reset, hierarchies only rebuild the clusters
+        that overlap the region and the ones that cannot be updated in place are dropped.
+        Incremental searches read self.changes to repair their previous result (see dstar.py).
+        
+        :param x_min, y_min, x_max, y_max: (int) changed cells, inclusive
+        :return: None
+        """
+        self.changes.append((x_min, y_min, x_max, y_max))
+        self.digests.clear()
+        if self.heuristic_cache is not None:
+            self.heuristic_cache.clear()
+        for key, hierarchy in list(self.hierarchies.items()):
+            if hasattr(hierarchy, 'invalidate'):
+                hierarchy.invalidate(x_min, y_min, x_max, y_max)
+            else:
+                del self.hierarchies[key]
+
+    def flat_elevations(self):
+        """
+        :return: [int, ...]: copy of the elevations in row-major order, index y * width + x
+        """
+        if self.storage == 'numpy':
+            return self.elevations.ravel().tolist()
+
+        flat = []
+        for row in self.elevations:
+            flat.extend(row.tolist() if hasattr(row, 'tolist') else row)
+        return flat
+
+    def content_hash(self):
+        """
+        Hash of the map content, the same for a text and a binary copy of a map
+        
+        Used to key tables and results that were computed for this map (see costtogo.py)
+        
+        A tiled map is not read to be hashed, that would load every tile through the tile cache: its hash
+        covers the file (see TiledGrid.fingerprint) and the changed tiles, so it differs from the hash of
+        a text or binary copy of the map, and from the hash of a copy of the tiled file
+        
+        :return: (str) hex digest
+        """
+        revision = len(self.changes)
+        if revision not in self.digests:
+            digest = hashlib.sha1(('%d %d\n' % (self.width, self.height)).encode('ascii'))
+            if self.storage == 'tiled':
+                digest.update(self.elevations.fingerprint())
+            elif self.storage == 'numpy':
+                digest.update(numpy.ascontiguousarray(self.elevations, dtype='<i8').tobytes())
+            else:
+                row_struct = struct.Struct('<' + str(self.width) + 'q')
+                for row in self.elevations:
+                    digest.update(row_struct.pack(*(row.tolist() if hasattr(row, 'tolist') else row)))
+            self.digests.clear()
+            self.digests[revision] = digest.hexdigest()
+        return self.digests[revision]
+
+    def heuristic_table(self, goal=None):
+        """
+        Pre-compute the heuristic value of every position for a goal
+        
+        h(x) = |x_goal - x_current| + |y_goal - y_current| + |elevation(goal) - elevation(current)|
+        
+        Tables come from the heuristic cache when enable_heuristic_cache() was called
+        
+        :param goal: (x_pos, y_pos): goal position, defaults to (end_x, end_y)
+        :return: int[][]: heuristic values indexed [x][y]
+        """
+        x_goal, y_goal = (self.end_x, self.end_y) if goal is None else goal
+        if self.heuristic_cache is None:
+            return self.compute_heuristic_table(x_goal, y_goal)
+
+        key = (x_goal, y_goal)
+        table = self.heuristic_cache.pop(key, None)
+        self.heuristic_cache_counts['misses' if table is None else 'hits'] += 1
+        if table is None:
+            table = self.compute_heuristic_table(x_goal, y_goal)
+            while len(self.heuristic_cache) >= self.heuristic_cache_size > 0:
+                self.heuristic_cache.popitem(last=False)                # least recently used
+        if self.heuristic_cache_size > 0:
+            self.heuristic_cache[key] = table                           # most recently used goes last
+        return table
+
+    def statistics(self):
+        """
+        Description of the map and counters of its caches, see the stats option of astar.Search
+        
+        :return: {str: value}: storage, width, height, revision (number of changes), heuristic_cache
+            (size, hits, misses) and tiles (see tiledmap.TiledGrid.stats), None for caches that are off
+        """
+        values = {'storage': self.storage, 'width': self.width, 'height': self.height,
+                  'revision': len(self.changes), 'heuristic_cache': None, 'tiles': None}
+        if self.heuristic_cache is not None:
+            values['heuristic_cache'] = dict(self.heuristic_cache_counts, size=len(self.heuristic_cache))
+        if self.storage == 'tiled':
+            values['tiles'] = self.elevations.stats()
+        return values
+
+    def lower_bound(self, x_pos, y_pos, target=None):
+        """
+        Heuristic value of a single position, without building a table
+        
+        |dx| + |dy| + |delta elevation| never exceeds the cost of a path in either direction:
+        every move costs 1 plus at least the elevation it climbs or descends
+        
+        :param x_pos: (int) x coordinate
+        :param y_pos: (int) y coordinate
+        :param target: (x_pos, y_pos): other end of the path, defaults to (end_x, end_y)
+        :return: (int) lower bound on the cost of a path between the position and the target
+        """
+        x_target, y_target = (self.end_x, self.end_y) if target is None else target
+        return (abs(x_target - x_pos) + abs(y_target - y_pos) +
+                abs(self.elevation(x_target, y_target) - self.elevation(x_pos, y_pos)))
+
+    def compute_heuristic_table(self, x_goal, y_goal):
+        """
+        --- HELPER METHOD ---
+        Heuristic table of a goal, without the cache (see heuristic_table)
+        """
+        goal_elevation = self.elevation(x_goal, y_goal)
+
+        if self.storage == 'tiled':
+            # a table of the whole map would not fit in memory
+            return LazyHeuristicTable(self, x_goal, y_goal)
+
+        if self.storage == 'numpy':
+            # computed on the whole grid at once, then transposed from [row, column] to [x][y]
+            xs = numpy.abs(numpy.arange(self.width, dtype=numpy.int64) - x_goal)
+            ys = numpy.abs(numpy.arange(self.height, dtype=numpy.int64) - y_goal)
+            elevations = self.elevations.astype(numpy.int64)
+            table = ys[:, numpy.newaxis] + xs[numpy.newaxis, :] + numpy.abs(elevations - goal_elevation)
+            return table.T.tolist()
+
+        y_distances = [abs(y_goal - c) for c in range(0, self.height)]
+        table = []
+        for r in range(0, self.width):
+            x_distance = abs(x_goal - r)
+            table.append([x_distance + y_distances[c] + abs(goal_elevation - self.elevations[c][r])
+                          for c in range(0, self.height)])
+        return table
+
     def is_goal_state(self, state):
         """
         --- GOAL EVALUATION ---
@@ -93,45 +434,42 @@ class Environment:
         :return: State: list of states that have paths that are solutions, ordered from
                                 smallest cost to greatest cost. Pick the smallest one as the goal
         """
+        # index the back frontier by position (hash join instead of a nested loop)
+        back_positions = {}
+        for end in back:
+            back_positions.setdefault(end.position, []).append(end)
+
         overlap = []
         # search for similar positions in the front and back frontiers
         for start in front:
-            for end in back:
+            for end in back_positions.get(start.position, ()):
                 # if there are states in the front and back positions lets format them as a solution
-                if start.position == end.position:
-                    # create a new state that combines the qualities of the front and back node
-                    sol = State(start.position[0], start.position[1])
-                    sol.cost_so_far = start.cost_so_far + end.cost_so_far
-                    sol.moves_so_far.extend(start.moves_so_far)
-
-                    # reverse moves so far from the end so we can attach the front and end solution
-                    end.moves_so_far.reverse()
-
-                    # to get the solution from front to back
-                    # reverse the directions of the matching back node to backtrace your steps
-                    for move in end.moves_so_far:
-                        opp = ''
-                        if move == 'N':
-                            opp = 'S'
-                        elif move == 'S':
-                            opp = 'N'
-                        elif move == 'E':
-                            opp = 'W'
-                        else:
-                            opp = 'E'
-
-                        # building up backtrace
-                        sol.moves_so_far.append(opp)
-
-                    # add the total solution to overlap list
-                    overlap.append(sol)
-                    # undo the reverse of the end node
-                    end.moves_so_far.reverse()
+                overlap.append(Environment.join_paths(start, end))
 
         # get the solution with the smallest state first
         overlap.sort(key=lambda node: node.cost_so_far)
         return overlap
 
+    @staticmethod
+    def join_paths(start, end):
+        """
+        Combine a state reached from the start and a state reached from the goal at the same position
+        
+        :param start: State: state whose moves lead from the starting position to the meeting position
+        :param end: State: state whose moves lead from the ending position to the meeting position
+        :return: State: state at the meeting position holding the whole path from start to end
+        """
+        # create a new state that combines the qualities of the front and back node
+        sol = State(start.position[0], start.position[1])
+        sol.cost_so_far = start.cost_so_far + end.cost_so_far
+
+        # to get the solution from front to back
+        # reverse the directions of the matching back node to backtrace your steps
+        moves = start.moves_so_far
+        moves.extend(opposite_moves(end.moves_so_far))
+        sol.moves_so_far = moves
+        return sol
+
     def get_goal_state(self):
         """
         Returns a state with the position of the goal
@@ -170,8 +508,9 @@ class Environment:
             north_state = State(position[0], position[1]+1)
 
             # update the solution if you take this path
-            north_state.moves_so_far.extend(state.moves_so_far)
-            north_state.moves_so_far.append('N')
+            # only the move is stored, the rest of the path is reached through the parent
+            north_state.parent = state
+            north_state.move = MOVE_N
 
             # get cost so far from current state ** will get updated to cost so far in search function
             # not complete cost so far! finished by search.expand()
@@ -187,8 +526,9 @@ class Environment:
             east_state = State(position[0]+1, position[1])
 
             # update the solution if you take this path
-            east_state.moves_so_far.extend(state.moves_so_far)
-            east_state.moves_so_far.append('E')
+            # only the move is stored, the rest of the path is reached through the parent
+            east_state.parent = state
+            east_state.move = MOVE_E
 
             # get cost so far from current state ** will get updated to cost so far in search function
             # not complete cost so far! finished by search.expand()
@@ -204,8 +544,9 @@ class Environment:
             south_state = State(position[0], position[1]-1)
 
             # update the solution if you take this path
-            south_state.moves_so_far.extend(state.moves_so_far)
-            south_state.moves_so_far.append('S')
+            # only the move is stored, the rest of the path is reached through the parent
+            south_state.parent = state
+            south_state.move = MOVE_S
 
             # get cost so far from current state ** will get updated to cost so far in search function
             # not complete cost so far! finished by search.expand()
@@ -221,8 +562,9 @@ class Environment:
             west_state = State(position[0]-1, position[1])
 
             # update the solution if you take this path
-            west_state.moves_so_far.extend(state.moves_so_far)
-            west_state.moves_so_far.append('W')
+            # only the move is stored, the rest of the path is reached through the parent
+            west_state.parent = state
+            west_state.move = MOVE_W
 
             # get cost so far from current state ** will get updated to cost so far in search function
             # not complete cost so far! finished by search.expand()
@@ -232,3 +574,92 @@ class Environment:
             possible_moves.append(west_state)
 
         return possible_moves
+
+    def successors(self, x_pos, y_pos):
+        """
+        --- LAZY TRANSITION MODEL ---
+        Same moves as get_available_moves, without allocating a State for each one,
+        so the caller can skip closed neighbors for free
+        
+        :param x_pos: (int) x coordinate of the expanded position
+        :param y_pos: (int) y coordinate of the expanded position
+        :return: generator of (x_pos, y_pos, move code) in N, E, S, W order
+        """
+        if y_pos < self.height-1:
+            yield x_pos, y_pos+1, MOVE_N
+        if x_pos < self.width-1:
+            yield x_pos+1, y_pos, MOVE_E
+        if y_pos > 0:
+            yield x_pos, y_pos-1, MOVE_S
+        if x_pos > 0:
+            yield x_pos-1, y_pos, MOVE_W
+
+    @staticmethod
+    def elevation_cost(src_elevation, dest_elevation):
+        """
+        Cost of a single move between two elevations
+        
+            move is Downhill: 1 + (elevation_old - elevation_new)
+            move is Uphill:   1 + (elevation_new - elevation_old)^2
+            move is Flat:     1
+        
+        :param src_elevation: (int) elevation the agent leaves
+        :param dest_elevation: (int) elevation the agent arrives at
+        :return: (int) cost of the move
+        """
+        if src_elevation > dest_elevation:
+            return 1 + (src_elevation - dest_elevation)
+        elif src_elevation < dest_elevation:
+            return 1 + (dest_elevation - src_elevation)**2
+        return 1
+
+    def transition_cost(self, x_src, y_src, x_dest, y_dest):
+        """
+        Cost to move from one position to a neighboring position
+        
+        :return: (int) resultant cost to travel from the source to the destination
+        """
+        return self.elevation_cost(self.elevation(x_src, y_src), self.elevation(x_dest, y_dest))
+
+
+class LazyHeuristicTable(object):
+
+    def __init__(self, environment, x_goal, y_goal):
+        """
+        Lazy Heuristic Table
+
+            Heuristic table that reads like Environment.heuristic_table, table[x][y], but computes
+            each value when it is read, so only the elevations of the positions searched are loaded
+
+        --- INSTANCE VARIABLES ---
+        self.goal: (x_pos, y_pos, elevation): goal of the table and its elevation
+        """
+        self.environment = environment
+        self.goal = (x_goal, y_goal, environment.elevation(x_goal, y_goal))
+
+    def __len__(self):
+        return self.environment.width
+
+    def __getitem__(self, x_pos):
+        return LazyHeuristicColumn(self.environment, x_pos, self.goal)
+
+
+class LazyHeuristicColumn(object):
+
+    def __init__(self, environment, x_pos, goal):
+        """
+        Lazy Heuristic Column
+
+            Single column of a LazyHeuristicTable
+        """
+        self.environment = environment
+        self.x_pos = x_pos
+        self.goal = goal
+
+    def __len__(self):
+        return self.environment.height
+
+    def __getitem__(self, y_pos):
+        x_goal, y_goal, goal_elevation = self.goal
+        return (abs(x_goal - self.x_pos) + abs(y_goal - y_pos) +
+                abs(goal_elevation - self.environment.elevation(self.x_pos, y_pos)))
@@ -0,0 +1,334 @@
+#!usr/bin/python
+"""
+File:           frontier.py
+
+Author:         Alexander Adranly
+
+Description:    Frontier (open list) implementations used by the A* Algorithm
+
+"""
+import heapq
+
+# marker for entries that lost a position clash
+_REMOVED = object()
+
+
+class ListFrontier(object):
+
+    def __init__(self):
+        """
+        SORTED LIST FRONTIER
+
+            Reference implementation: the frontier is a python list sorted from the highest priority value
+            in the front to the lowest priority value in the back, so the best entry can be popped from the back.
+            Every insertion is O(n) because of the duplicate scan and the bubble into place.
+
+        Every frontier keeps the same ordering rules:
+            Rule 1: the entry with the lowest priority (A* value) is popped first
+
+            Rule 2: when two entries have the same priority, the one that has been in the frontier
+            the longest is popped first (entries pushed in NESW order are therefore popped in NESW order)
+
+            Rule 3: only one entry per position is kept. The one with the lower priority wins,
+            if both have the same priority the newer one is discarded
+
+        --- INSTANCE VARIABLES ---
+        self.entries: [[priority, counter, position, item], ...]: entries ordered front to back
+        """
+        self.entries = []
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def push(self, item, position, priority):
+        """
+        Insert an item into the frontier, following the position rule (Rule 3)
+
+        :param item: the object stored in the frontier (usually a State)
+        :param position: (x_pos, y_pos): position used to detect duplicate entries
+        :param priority: (int) A* value of the item
+        :return: (bool) True if the item was inserted, False if it was rejected
+        """
+        remove_marker = []
+        move_rejected = False
+
+        for entry in self.entries:
+            if entry[2] == position:
+                if priority < entry[0]:
+                    # new entry is better, the older one leaves the frontier
+                    remove_marker.append(entry)
+                else:
+                    # same or higher A* value: discard the newer one
+                    move_rejected = True
+
+        for marker in remove_marker:
+            self.entries.remove(marker)
+
+        if move_rejected:
+            return False
+
+        self.counter += 1
+        self.entries.append([priority, self.counter, position, item])
+
+        # shuffle from the back towards the front as long as the entry in front of it is not worse,
+        # that way entries waiting longer stay closer to the back
+        select = len(self.entries) - 1
+        while select > 0 and self.entries[select][0] >= self.entries[select-1][0]:
+            self.entries[select], self.entries[select-1] = self.entries[select-1], self.entries[select]
+            select -= 1
+
+        return True
+
+    def pop(self):
+        """
+        Remove and return the item that should be expanded next
+
+        :return: the item with the lowest priority (oldest first on ties)
+        """
+        return self.entries.pop()[3]
+
+    def get(self, position):
+        """
+        :param position: (x_pos, y_pos): position in question
+        :return: the item stored for the position, or None
+        """
+        for entry in self.entries:
+            if entry[2] == position:
+                return entry[3]
+        return None
+
+    def min_priority(self):
+        """
+        :return: (int) priority of the next item to be popped, or None if the frontier is empty
+        """
+        return self.entries[-1][0] if self.entries else None
+
+    def items(self):
+        """
+        :return: [item, ...]: items in frontier order (front of the list first, next to be popped last)
+        """
+        return [entry[3] for entry in self.entries]
+
+
+class HeapFrontier(object):
+
+    def __init__(self):
+        """
+        BINARY HEAP FRONTIER
+
+            Same ordering rules as ListFrontier, in O(log n) per operation.
+            Entries are ordered on (priority, counter) where the counter increases on every insertion,
+            so ties are resolved oldest first. A position -> entry index finds duplicates in O(1);
+            entries that lose a position clash are marked removed and skipped when they surface.
+
+        --- INSTANCE VARIABLES ---
+        self.heap: [[priority, counter, position, item], ...]: heap of entries, removed entries included
+        self.index: {(x_pos, y_pos): entry}: live entry for each position in the frontier
+        """
+        self.heap = []
+        self.index = {}
+        self.counter = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def push(self, item, position, priority):
+        """
+        Insert an item into the frontier, following the position rule
+
+        :param item: the object stored in the frontier (usually a State)
+        :param position: (x_pos, y_pos): position used to detect duplicate entries
+        :param priority: (int) A* value of the item
+        :return: (bool) True if the item was inserted, False if it was rejected
+        """
+        entry = self.index.get(position)
+        if entry is not None:
+            if priority >= entry[0]:
+                return False
+            entry[3] = _REMOVED
+
+        self.counter += 1
+        entry = [priority, self.counter, position, item]
+        self.index[position] = entry
+        heapq.heappush(self.heap, entry)
+        return True
+
+    def pop(self):
+        """
+        Remove and return the item that should be expanded next
+
+        :return: the item with the lowest priority (oldest first on ties)
+        """
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry[3] is not _REMOVED:
+                del self.index[entry[2]]
+                return entry[3]
+        raise IndexError("pop from an empty frontier")
+
+    def get(self, position):
+        """
+        :param position: (x_pos, y_pos): position in question
+        :return: the item stored for the position, or None
+        """
+        entry = self.index.get(position)
+        return None if entry is None else entry[3]
+
+    def min_priority(self):
+        """
+        :return: (int) priority of the next item to be popped, or None if the frontier is empty
+        """
+        while self.heap and self.heap[0][3] is _REMOVED:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def items(self):
+        """
+        :return: [item, ...]: items in the same order ListFrontier would hold them
+        """
+        return [entry[3] for entry in sorted(self.index.values(), reverse=True)]
+
+
+class BucketFrontier(object):
+
+    def __init__(self):
+        """
+        BUCKET (DIAL) FRONTIER
+
+            Same ordering rules as ListFrontier, for integer priorities.
+            Entries are kept in FIFO buckets, one bucket per priority value, so ties are naturally
+            resolved oldest first. A cursor remembers the lowest bucket that may hold entries;
+            with a consistent heuristic the A* values only grow, so the cursor mostly moves forward.
+
+        --- INSTANCE VARIABLES ---
+        self.buckets: {priority: [entry, ...]}: entries for each priority, oldest first
+        self.heads: {priority: int}: index of the next entry to pop in each bucket
+        self.index: {(x_pos, y_pos): entry}: live entry for each position in the frontier
+        self.cursor: int: lowest priority that may still hold entries
+        """
+        self.buckets = {}
+        self.heads = {}
+        self.index = {}
+        self.counter = 0
+        self.cursor = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def push(self, item, position, priority):
+        """
+        Insert an item into the frontier, following the position rule
+
+        :param item: the object stored in the frontier (usually a State)
+        :param position: (x_pos, y_pos): position used to detect duplicate entries
+        :param priority: (int) A* value of the item
+        :return: (bool) True if the item was inserted, False if it was rejected
+        """
+        if int(priority) != priority:
+            raise ValueError("bucket frontier requires integer priorities, got " + str(priority))
+        priority = int(priority)
+
+        entry = self.index.get(position)
+        if entry is not None:
+            if priority >= entry[0]:
+                return False
+            entry[3] = _REMOVED
+
+        self.counter += 1
+        entry = [priority, self.counter, position, item]
+        self.index[position] = entry
+
+        bucket = self.buckets.get(priority)
+        if bucket is None:
+            bucket = self.buckets[priority] = []
+            self.heads[priority] = 0
+        bucket.append(entry)
+
+        if self.cursor is None or priority < self.cursor:
+            self.cursor = priority
+        return True
+
+    def pop(self):
+        """
+        Remove and return the item that should be expanded next
+
+        :return: the item with the lowest priority (oldest first on ties)
+        """
+        entry = self._first()
+        if entry is None:
+            raise IndexError("pop from an empty frontier")
+        self.heads[self.cursor] += 1
+        del self.index[entry[2]]
+        return entry[3]
+
+    def get(self, position):
+        """
+        :param position: (x_pos, y_pos): position in question
+        :return: the item stored for the position, or None
+        """
+        entry = self.index.get(position)
+        return None if entry is None else entry[3]
+
+    def min_priority(self):
+        """
+        :return: (int) priority of the next item to be popped, or None if the frontier is empty
+        """
+        entry = self._first()
+        return None if entry is None else entry[0]
+
+    def items(self):
+        """
+        :return: [item, ...]: items in the same order ListFrontier would hold them
+        """
+        return [entry[3] for entry in sorted(self.index.values(), reverse=True)]
+
+    def _first(self):
+        """
+        --- HELPER METHOD ---
+        Move the cursor to the first live entry, dropping exhausted buckets on the way
+
+        :return: the entry that would be popped next, or None if the frontier is empty
+        """
+        if not self.index:
+            self.buckets.clear()
+            self.heads.clear()
+            self.cursor = None
+            return None
+
+        while True:
+            bucket = self.buckets.get(self.cursor)
+            if bucket is None:
+                # jump straight to the next priority that holds entries instead of scanning empty values
+                self.cursor = min(self.buckets)
+                continue
+
+            head = self.heads[self.cursor]
+            while head < len(bucket) and bucket[head][3] is _REMOVED:
+                head += 1
+            self.heads[self.cursor] = head
+
+            if head < len(bucket):
+                return bucket[head]
+
+            del self.buckets[self.cursor]
+            del self.heads[self.cursor]
+
+
+FRONTIERS = {
+    'list': ListFrontier,
+    'heap': HeapFrontier,
+    'bucket': BucketFrontier,
+}
+
+
+def make_frontier(name):
+    """
+    Build an empty frontier
+
+    :param name: (str) one of 'list', 'heap' or 'bucket'
+    :return: new frontier instance
+    """
+    if name not in FRONTIERS:
+        raise ValueError("unknown frontier '" + str(name) + "', expected one of " + str(sorted(FRONTIERS)))
+    return FRONTIERS[name]()
@@ -0,0 +1,432 @@
+#!usr/bin/python
+"""
+File:           hierarchy.py
+
+Author:         Alexander Adranly
+
+Description:    Implementation of the Search class for hierarchical path finding (HPA*)
+
+    The map is split into square clusters. Cells on both sides of a cluster border are transitions,
+    the nodes of an abstract graph whose edges are:
+        - crossings: the single move from a transition to its partner in the next cluster
+        - intra-cluster edges: the cost of the cheapest path between two transitions of a cluster
+          that stays inside the cluster
+    The abstract graph is searched first, then only the chosen intra-cluster edges are refined
+    into moves.
+
+    With every border cell as a transition (entrance_width=1) the abstract graph preserves the
+    cost of every path, so the search is exact. With wider entrances it is much smaller, and the
+    paths it finds can be slightly more expensive than the optimum.
+
+    Cluster edges are built lazily, the first time a search reaches a cluster, and dropped when
+    part of the cluster changes (see Hierarchy.invalidate), so only the clusters touched by a change
+    are rebuilt.
+"""
+import heapq
+
+from path import move_between
+from state import State
+
+
+class Hierarchy(object):
+
+    def __init__(self, environment, cluster_size=16, entrance_width=4):
+        """
+        HIERARCHY
+
+            Abstract graph of a map, see the module description
+
+        --- PARAMETERS ---
+        cluster_size: int: width and height of a cluster, in cells
+        entrance_width: int: one transition per entrance_width cells of a cluster border,
+            1 makes every border cell a transition and the search exact
+
+        --- INSTANCE VARIABLES ---
+        self.crossings: {(column, row): {position: [position, ...]}}: for each cluster, its transitions and
+            their partners in the neighboring clusters (the geometry never changes, kept once computed)
+        self.edges: {(column, row): {position: [(position, cost), ...]}}: intra-cluster edges of the
+            clusters built so far
+        self.builds: int: number of cluster builds, a changed cluster is built again
+        """
+        if cluster_size < 1 or entrance_width < 1:
+            raise ValueError("cluster_size and entrance_width must be positive")
+
+        self.environment = environment
+        self.cluster_size = cluster_size
+        self.entrance_width = entrance_width
+        self.crossings = {}
+        self.edges = {}
+        self.builds = 0
+
+    def cluster_of(self, position):
+        """
+        :param position: (x_pos, y_pos)
+        :return: (column, row): cluster holding the position
+        """
+        return position[0] // self.cluster_size, position[1] // self.cluster_size
+
+    def bounds(self, cluster):
+        """
+        :param cluster: (column, row)
+        :return: (x_min, y_min, x_end, y_end): cells of the cluster, the ends are exclusive
+        """
+        x_min = cluster[0] * self.cluster_size
+        y_min = cluster[1] * self.cluster_size
+        return (x_min, y_min,
+                min(x_min + self.cluster_size, self.environment.width),
+                min(y_min + self.cluster_size, self.environment.height))
+
+    def transitions(self, cluster):
+        """
+        Transitions of a cluster: one per entrance_width cells of each border, in the middle of its
+        entrance. Both clusters of a border split it the same way, so their transitions pair up.
+
+        :param cluster: (column, row)
+        :return: {position: [position, ...]}: transitions and their partners in the neighboring clusters
+        """
+        if cluster in self.crossings:
+            return self.crossings[cluster]
+
+        x_min, y_min, x_end, y_end = self.bounds(cluster)
+        crossings = {}
+
+        def entrances(start, end):
+            for first in range(start, end, self.entrance_width):
+                yield (first + min(first + self.entrance_width, end) - 1) // 2
+
+        for y_pos in entrances(y_min, y_end):
+            if x_min > 0:
+                crossings.setdefault((x_min, y_pos), []).append((x_min - 1, y_pos))
+            if x_end < self.environment.width:
+                crossings.setdefault((x_end - 1, y_pos), []).append((x_end, y_pos))
+        for x_pos in entrances(x_min, x_end):
+            if y_min > 0:
+                crossings.setdefault((x_pos, y_min), []).append((x_pos, y_min - 1))
+            if y_end < self.environment.height:
+                crossings.setdefault((x_pos, y_end - 1), []).append((x_pos, y_end))
+
+        self.crossings[cluster] = crossings
+        return crossings
+
+    def intra_edges(self, cluster):
+        """
+        Intra-cluster edges between the transitions of a cluster, built on first use
+
+        :param cluster: (column, row)
+        :return: {position: [(position, cost), ...]}
+        """
+        if cluster in self.edges:
+            return self.edges[cluster]
+
+        nodes = sorted(self.transitions(cluster))
+        box = self.bounds(cluster)
+        elevations = self.local_elevations(box)
+        edges = {}
+        for node in nodes:
+            distances = self.local_dijkstra(box, elevations, node)[0]
+            edges[node] = [(other, distances[self.local_index(box, other)]) for other in nodes if other != node]
+
+        self.edges[cluster] = edges
+        self.builds += 1
+        return edges
+
+    def invalidate(self, x_min, y_min, x_max, y_max):
+        """
+        Drop the edges of the clusters overlapping a changed region, they are rebuilt on next use
+
+        :param x_min, y_min, x_max, y_max: (int) changed cells, inclusive
+        :return: None
+        """
+        first_column, first_row = self.cluster_of((x_min, y_min))
+        last_column, last_row = self.cluster_of((x_max, y_max))
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                self.edges.pop((column, row), None)
+
+    def local_elevations(self, box):
+        """
+        --- HELPER METHOD ---
+        :param box: (x_min, y_min, x_end, y_end)
+        :return: [int, ...]: elevations of the box in row-major order
+        """
+        elevation = self.environment.elevation
+        x_min, y_min, x_end, y_end = box
+        return [elevation(x_pos, y_pos) for y_pos in range(y_min, y_end) for x_pos in range(x_min, x_end)]
+
+    @staticmethod
+    def local_index(box, position):
+        """
+        --- HELPER METHOD ---
+        :return: (int) index of a position in the row-major arrays of a box
+        """
+        return (position[1] - box[1]) * (box[2] - box[0]) + position[0] - box[0]
+
+    def local_dijkstra(self, box, elevations, source, reverse=False, target=None):
+        """
+        Dijkstra search that stays inside a box
+
+        :param box: (x_min, y_min, x_end, y_end)
+        :param elevations: [int, ...]: elevations of the box (see local_elevations)
+        :param source: (x_pos, y_pos): position to search from
+        :param reverse: (bool) compute costs to the source instead of costs from it
+        :param target: (x_pos, y_pos): stop once this position is settled, None to settle the whole box
+        :return: ([int, ...], [int, ...]): costs and parent indexes of the box cells in row-major order
+        """
+        elevation_cost = self.environment.elevation_cost
+        width = box[2] - box[0]
+        size = width * (box[3] - box[1])
+        distances = [-1] * size
+        parents = [-1] * size
+        settled = bytearray(size)
+        goal = -1 if target is None else self.local_index(box, target)
+
+        root = self.local_index(box, source)
+        distances[root] = 0
+        queue = [(0, root)]
+        while queue:
+            distance, index = heapq.heappop(queue)
+            if settled[index]:
+                continue
+            settled[index] = 1
+            if index == goal:
+                break
+
+            x_pos = index % width
+            for neighbor in (index + width if index + width < size else -1,
+                             index + 1 if x_pos < width - 1 else -1,
+                             index - width if index >= width else -1,
+                             index - 1 if x_pos > 0 else -1):
+                if neighbor < 0 or settled[neighbor]:
+                    continue
+                if reverse:
+                    cost = distance + elevation_cost(elevations[neighbor], elevations[index])
+                else:
+                    cost = distance + elevation_cost(elevations[index], elevations[neighbor])
+                if distances[neighbor] < 0 or cost < distances[neighbor]:
+                    distances[neighbor] = cost
+                    parents[neighbor] = index
+                    heapq.heappush(queue, (cost, neighbor))
+
+        return distances, parents
+
+    def refine(self, source, target):
+        """
+        Cheapest path between two positions of the same cluster that stays inside the cluster
+
+        :return: [(x_pos, y_pos), ...]: positions after source, up to and including target
+        """
+        box = self.bounds(self.cluster_of(source))
+        parents = self.local_dijkstra(box, self.local_elevations(box), source, target=target)[1]
+
+        width = box[2] - box[0]
+        positions = []
+        index = self.local_index(box, target)
+        root = self.local_index(box, source)
+        while index != root:
+            positions.append((box[0] + index % width, box[1] + index // width))
+            index = parents[index]
+        positions.reverse()
+        return positions
+
+
+def hierarchy_for(environment, cluster_size=16, entrance_width=4):
+    """
+    Hierarchy of a map, kept on the environment (and shared with its derived environments)
+
+    :return: Hierarchy
+    """
+    key = (cluster_size, entrance_width)
+    if key not in environment.hierarchies:
+        environment.hierarchies[key] = Hierarchy(environment, cluster_size, entrance_width)
+    return environment.hierarchies[key]
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment, cluster_size=16, entrance_width=4, exact=False, epsilon=None):
+        """
+        HIERARCHICAL SEARCH ALGORITHM
+
+            Searches the abstract graph of a Hierarchy with A*, then refines the abstract path into moves
+            (see the module description)
+
+        --- PARAMETERS ---
+        cluster_size: int: width and height of a cluster, in cells
+
+        entrance_width: int: one transition per entrance_width cells of a cluster border
+
+        exact: bool: search the exact graph (every border cell is a transition), the path is optimal
+
+        epsilon: float: accept the path of the sparse graph only if its cost is at most epsilon times a lower
+            bound on the optimal cost, otherwise search the exact graph. None accepts any path.
+            A path over the energy budget is never accepted: the exact graph decides if there is a solution.
+
+        --- INSTANCE VARIABLES ---
+        self.bound: float: proven ratio between the cost of the solution and the optimal cost,
+            1 for the exact graph, None when there is no solution or no lower bound
+
+        self.frontier, self.visited: [(x_pos, y_pos), ...]: abstract nodes of the last graph searched
+        """
+        self.init_state = init_state
+        self.environment = environment
+        self.cluster_size = cluster_size
+        self.entrance_width = 1 if exact else entrance_width
+        self.epsilon = epsilon
+        self.bound = None
+        self.frontier = []
+        self.visited = []
+        self.goal = (environment.end_x, environment.end_y)
+
+    def search(self):
+        """
+        Function driver for the hierarchical search
+
+        :return:
+        solution (State): goal state, its moves_so_far are the moves in order, or None
+        frontier ([State, ...]): abstract nodes left in the frontier, with their cost so far
+        visited ([State, ...]): abstract nodes expanded during the search, in order, with their cost so far
+        """
+        start = self.init_state.position
+        lower_bound = self.heuristic(start)
+
+        path, cost = self.abstract_search(hierarchy_for(self.environment, self.cluster_size, self.entrance_width))
+        if self.entrance_width > 1:
+            accepted = path is not None and (self.epsilon is None or cost <= self.epsilon * lower_bound)
+            if not accepted:
+                path, cost = self.abstract_search(hierarchy_for(self.environment, self.cluster_size, 1))
+                self.entrance_width = 1
+
+        if path is None:
+            return None, self.node_states(self.frontier), self.node_states(self.visited)
+
+        if self.entrance_width == 1:
+            self.bound = 1.0
+        elif lower_bound > 0:
+            self.bound = float(cost) / lower_bound
+
+        solution = self.build_solution(path)
+        return solution, self.node_states(self.frontier), self.node_states(self.visited)
+
+    def heuristic(self, position):
+        """
+        Default A* heuristic (see Environment.lower_bound)
+
+        :return: (int) lower bound on the cost from position to the goal
+        """
+        return self.environment.lower_bound(position[0], position[1])
+
+    def abstract_search(self, hierarchy):
+        """
+        A* over the abstract graph of a hierarchy, with the start and the goal inserted
+
+        :param hierarchy: (Hierarchy)
+        :return: ([(x_pos, y_pos), ...], int): abstract path from start to goal and its cost, (None, None)
+            if there is no path within the energy budget
+        """
+        environment = self.environment
+        start, goal = self.init_state.position, self.goal
+        start_cluster, goal_cluster = hierarchy.cluster_of(start), hierarchy.cluster_of(goal)
+
+        # the start reaches the transitions of its cluster (and the goal when it shares the cluster)
+        box = hierarchy.bounds(start_cluster)
+        distances = hierarchy.local_dijkstra(box, hierarchy.local_elevations(box), start)[0]
+        targets = list(hierarchy.transitions(start_cluster))
+        if goal_cluster == start_cluster:
+            targets.append(goal)
+        start_edges = [(node, distances[hierarchy.local_index(box, node)]) for node in targets if node != start]
+
+        # every transition of the goal cluster reaches the goal
+        box = hierarchy.bounds(goal_cluster)
+        distances = hierarchy.local_dijkstra(box, hierarchy.local_elevations(box), goal, reverse=True)[0]
+        to_goal = dict((node, distances[hierarchy.local_index(box, node)])
+                       for node in hierarchy.transitions(goal_cluster))
+
+        costs = {start: self.init_state.cost_so_far}
+        parents = {start: None}
+        closed = set()
+        self.visited = []
+        counter = 0
+        queue = [(costs[start] + self.heuristic(start), counter, start)]
+
+        while queue:
+            a_star, order, node = heapq.heappop(queue)
+            if node in closed:
+                continue                                            # stale entry
+            closed.add(node)
+            self.visited.append((node, costs[node], a_star))
+            if node == goal:
+                self.frontier = [(position, costs[position], f) for f, order, position in sorted(queue)
+                                 if position not in closed]
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path, costs[goal]
+
+            cluster = hierarchy.cluster_of(node)
+            if node == start:
+                edges = list(start_edges)
+            else:
+                edges = list(hierarchy.intra_edges(cluster).get(node, ()))
+                if node in to_goal:
+                    edges.append((goal, to_goal[node]))
+            elevation = environment.elevation(node[0], node[1])
+            for partner in hierarchy.transitions(cluster).get(node, ()):
+                edges.append((partner, environment.elevation_cost(elevation, environment.elevation(partner[0],
+                                                                                                   partner[1]))))
+
+            for neighbor, edge_cost in edges:
+                cost = costs[node] + edge_cost
+                if neighbor in closed or cost > environment.energy_budget:
+                    continue
+                if neighbor not in costs or cost < costs[neighbor]:
+                    costs[neighbor] = cost
+                    parents[neighbor] = node
+                    counter += 1
+                    heapq.heappush(queue, (cost + self.heuristic(neighbor), counter, neighbor))
+
+        self.frontier = []
+        return None, None
+
+    def build_solution(self, path):
+        """
+        --- HELPER METHOD ---
+        Refine an abstract path into a chain of states
+
+        :param path: [(x_pos, y_pos), ...]: abstract path from start to goal
+        :return: State: goal state
+        """
+        hierarchy = hierarchy_for(self.environment, self.cluster_size, self.entrance_width)
+        environment = self.environment
+        current = self.init_state
+
+        for source, target in zip(path, path[1:]):
+            if hierarchy.cluster_of(source) != hierarchy.cluster_of(target):
+                positions = [target]                                # crossing: a single move
+            else:
+                positions = hierarchy.refine(source, target)
+            for position in positions:
+                next_state = State(position[0], position[1])
+                next_state.parent = current
+                next_state.move = move_between(current.position, position)
+                next_state.cost_so_far = current.cost_so_far + environment.transition_cost(
+                    current.position[0], current.position[1], position[0], position[1])
+                current = next_state
+
+        return current
+
+    @staticmethod
+    def node_states(nodes):
+        """
+        --- HELPER METHOD ---
+        :param nodes: [((x_pos, y_pos), cost, a_star), ...]: abstract nodes
+        :return: [State, ...]: one state per abstract node, without moves
+        """
+        states = []
+        for position, cost, a_star in nodes:
+            node_state = State(position[0], position[1])
+            node_state.cost_so_far = cost
+            node_state.a_star = a_star
+            states.append(node_state)
+        return states
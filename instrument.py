@@ -0,0 +1,197 @@
+#!usr/bin/python
+"""
+File:           instrument.py
+
+Author:         Alexander Adranly
+
+Description:    Counters and timers of a search, see the stats option of astar.Search and bbfs.Search
+
+    Instrumentation is installed by wrapping the frontier, the closed set and the environment of a
+    search in the proxies below, so a search without it runs the same objects and code as before.
+    The few events only the search loop sees (budget prunes, duplicates rejected before reaching the
+    frontier) are counted behind a single 'stats is not None' test.
+
+    Timers include the cost of reading the clock, so they overstate very short operations.
+"""
+import copy
+import time
+
+# wall clock with the best resolution available
+timer = getattr(time, 'perf_counter', time.time)
+
+COUNTERS = ('expansions', 'generated', 'duplicates', 'replacements', 'closed_hits', 'budget_prunes',
+            'peak_frontier')
+TIMERS = ('heuristic', 'successors', 'frontier')
+
+
+class SearchStats(object):
+
+    def __init__(self):
+        """
+        SEARCH STATISTICS
+
+        --- INSTANCE VARIABLES ---
+        self.expansions: int: states taken off the frontier and closed
+        self.generated: int: successors generated
+        self.duplicates: int: successors rejected because the frontier already holds their position
+            at a lower or equal priority (or a cheaper path to it is known)
+        self.replacements: int: frontier entries replaced by a cheaper successor
+        self.closed_hits: int: lookups that found a position in a closed set
+        self.budget_prunes: int: successors dropped because they are (or are bound to end) over budget
+        self.peak_frontier: int: largest number of states in the frontier(s) at once
+        self.times: {str: float}: seconds spent computing heuristic tables, generating successors and
+            maintaining the frontier, see TIMERS
+        self.frontiers: [TimedFrontier, ...]: frontiers whose sizes add up to the frontier size
+        """
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.times = dict((name, 0.0) for name in TIMERS)
+        self.frontiers = []
+
+    def frontier_grew(self):
+        """
+        Update the peak frontier size after an insertion
+
+        :return: None
+        """
+        size = sum(len(frontier) for frontier in self.frontiers)
+        if size > self.peak_frontier:
+            self.peak_frontier = size
+
+    def as_dict(self):
+        """
+        :return: {str: value}: every counter, and the timers in seconds under 'times'
+        """
+        values = dict((name, getattr(self, name)) for name in COUNTERS)
+        values['times'] = dict(self.times)
+        return values
+
+
+class TimedFrontier(object):
+
+    def __init__(self, frontier, stats):
+        """
+        TIMED FRONTIER
+
+            Proxy of a frontier (see frontier.py, bbfs.BreadthFrontier) that times every operation,
+            tells duplicates from replacements and records the peak size. Other attributes are read
+            from the wrapped frontier.
+        """
+        self.frontier = frontier
+        self.stats = stats
+        stats.frontiers.append(frontier)
+
+    def __len__(self):
+        return len(self.frontier)
+
+    def __getattr__(self, name):
+        return getattr(self.frontier, name)
+
+    def push(self, item, position, priority):
+        started = timer()
+        existing = self.frontier.get(position)
+        inserted = self.frontier.push(item, position, priority)
+        self.stats.times['frontier'] += timer() - started
+        if not inserted:
+            self.stats.duplicates += 1
+        else:
+            if existing is not None:
+                self.stats.replacements += 1
+            self.stats.frontier_grew()
+        return inserted
+
+    def append(self, item, position, cost):
+        started = timer()
+        entry = self.frontier.append(item, position, cost)
+        self.stats.times['frontier'] += timer() - started
+        self.stats.frontier_grew()
+        return entry
+
+    def filter(self, position, cost):
+        started = timer()
+        existing = self.frontier.get(position)
+        rejected = self.frontier.filter(position, cost)
+        self.stats.times['frontier'] += timer() - started
+        if rejected:
+            self.stats.duplicates += 1
+        elif existing is not None:
+            self.stats.replacements += 1
+        return rejected
+
+    def pop(self):
+        started = timer()
+        item = self.frontier.pop()
+        self.stats.times['frontier'] += timer() - started
+        return item
+
+    def popleft(self):
+        started = timer()
+        item = self.frontier.popleft()
+        self.stats.times['frontier'] += timer() - started
+        return item
+
+    def min_priority(self):
+        started = timer()
+        priority = self.frontier.min_priority()
+        self.stats.times['frontier'] += timer() - started
+        return priority
+
+
+class CountingClosedSet(object):
+
+    def __init__(self, closed, stats):
+        """
+        COUNTING CLOSED SET
+
+            Proxy of a closed set (see closedset.py) that counts expansions and hits
+        """
+        self.closed = closed
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.closed)
+
+    def __contains__(self, position):
+        if position in self.closed:
+            self.stats.closed_hits += 1
+            return True
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.closed, name)
+
+    def add(self, item, position):
+        self.stats.expansions += 1
+        self.closed.add(item, position)
+
+
+def instrument_environment(environment, stats):
+    """
+    Copy of an environment whose successor generation is timed and counted
+
+    The copy shares the elevations and caches of the environment (see Environment.derive)
+
+    :param environment: (Environment) environment of the search
+    :param stats: (SearchStats) statistics to update
+    :return: Environment: instrumented copy
+    """
+    instrumented = copy.copy(environment)
+    get_available_moves, successors = environment.get_available_moves, environment.successors
+
+    def timed_moves(state):
+        started = timer()
+        moves = get_available_moves(state)
+        stats.times['successors'] += timer() - started
+        stats.generated += len(moves)
+        return moves
+
+    def timed_successors(x_pos, y_pos):
+        started = timer()
+        moves = list(successors(x_pos, y_pos))
+        stats.times['successors'] += timer() - started
+        stats.generated += len(moves)
+        return moves
+
+    instrumented.get_available_moves = timed_moves
+    instrumented.successors = timed_successors
+    return instrumented
@@ -0,0 +1,292 @@
+#!usr/bin/python
+"""
+File:           landmarks.py
+
+Author:         Alexander Adranly
+
+Description:    ALT heuristic: A* guided by Landmarks and the Triangle inequality
+
+    For a landmark L, with d(a, b) the cost of the cheapest path from a to b
+    (the cost function is asymmetric, so both directions are stored):
+        d(v, goal) >= d(L, goal) - d(L, v)
+        d(v, goal) >= d(v, L) - d(goal, L)
+    The heuristic of a position is the largest of these bounds over all the landmarks and of the
+    default heuristic (see Environment.heuristic_table). Each bound is consistent, so their maximum
+    is consistent as well and astar.Search stays optimal.
+
+    Landmark tables cost two Dijkstra searches over the whole map per landmark. They can be saved
+    next to the map file (<map>.landmarks) so the preprocessing is paid once per map.
+"""
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+from costtogo import dijkstra, read_values, to_table, write_values
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+METHODS = ('farthest', 'edges')
+
+# header of a saved landmark file: magic, width, height, requested landmark count, landmark count,
+# method, map content hash
+MAGIC = b'ALMK'
+HEADER = struct.Struct('<4sIIIIB3x40s')
+
+# suffix of the landmark file saved next to a map
+SUFFIX = '.landmarks'
+
+
+class Landmarks(object):
+
+    def __init__(self, width, height, digest, count, method, positions, forward, backward):
+        """
+        LANDMARKS
+
+            Directed distances between a few landmark positions and every position of a map
+
+        --- INSTANCE VARIABLES ---
+        self.digest: str: content hash of the map (see Environment.content_hash)
+        self.count: int: number of landmarks requested, small maps may have fewer
+        self.method: str: how the landmarks were selected, one of METHODS
+        self.positions: [(x_pos, y_pos), ...]: landmark positions
+        self.forward: [[int, ...], ...]: per landmark, d(landmark, v) in row-major order
+        self.backward: [[int, ...], ...]: per landmark, d(v, landmark) in row-major order
+
+            With numpy installed the distances are stored as int64 arrays
+        """
+        self.width = width
+        self.height = height
+        self.digest = digest
+        self.count = count
+        self.method = method
+        self.positions = positions
+        if numpy is not None:
+            forward = [numpy.asarray(distances, dtype=numpy.int64) for distances in forward]
+            backward = [numpy.asarray(distances, dtype=numpy.int64) for distances in backward]
+        self.forward = forward
+        self.backward = backward
+
+    def __len__(self):
+        return len(self.positions)
+
+    def bounds(self, goal):
+        """
+        Landmark lower bounds on the cost to reach a goal
+
+        :param goal: (x_pos, y_pos): goal position
+        :return: [int, ...]: largest bound of every position in row-major order (at least 0)
+        """
+        target = goal[1] * self.width + goal[0]
+
+        if numpy is not None:
+            best = numpy.zeros(self.width * self.height, dtype=numpy.int64)
+            for forward, backward in zip(self.forward, self.backward):
+                numpy.maximum(best, forward[target] - forward, out=best)
+                numpy.maximum(best, backward - backward[target], out=best)
+            return best
+
+        best = [0] * (self.width * self.height)
+        for forward, backward in zip(self.forward, self.backward):
+            to_goal, from_goal = forward[target], backward[target]
+            best = [max(bound, to_goal - from_landmark, to_landmark - from_goal)
+                    for bound, from_landmark, to_landmark in zip(best, forward, backward)]
+        return best
+
+    def heuristic_table(self, environment, goal=None):
+        """
+        ALT heuristic of every position for a goal
+
+        :param environment: (Environment) map the landmarks were built for
+        :param goal: (x_pos, y_pos): goal position, defaults to the goal of the environment
+        :return: int[][]: heuristic values indexed [x][y], like Environment.heuristic_table
+        """
+        goal = (environment.end_x, environment.end_y) if goal is None else goal
+        base = environment.heuristic_table(goal)
+        bounds = self.bounds(goal)
+
+        if numpy is not None:
+            # bounds are [row, column], the tables are [x][y]
+            grid = bounds.reshape(self.height, self.width).T
+            return numpy.maximum(grid, numpy.asarray(base, dtype=numpy.int64)).tolist()
+
+        table = to_table(self.width, bounds)
+        return [[max(bound, value) for bound, value in zip(bound_column, base_column)]
+                for bound_column, base_column in zip(table, base)]
+
+    def save(self, path):
+        """
+        Save the landmark tables, written to a temporary file first so readers never see a partial file
+
+        :param path: (str) destination, usually the map path followed by SUFFIX
+        :return: None
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, self.width, self.height, self.count, len(self.positions),
+                                  METHODS.index(self.method), self.digest.encode('ascii')))
+            write_values(out, [coordinate for position in self.positions for coordinate in position])
+            for forward, backward in zip(self.forward, self.backward):
+                for distances in (forward, backward):
+                    if numpy is not None:
+                        out.write(distances.astype('<i8').tobytes())
+                    else:
+                        write_values(out, distances)
+        os.rename(temporary, path)
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: (str) file written by save
+        :return: Landmarks: the saved tables, None if path is not a landmark file
+        """
+        with open(path, 'rb') as source:
+            header = source.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, width, height, requested, count, method, digest = HEADER.unpack(header)
+            if magic != MAGIC or method >= len(METHODS):
+                return None
+
+            coordinates = read_values(source, 2 * count)
+            positions = [(coordinates[i], coordinates[i + 1]) for i in range(0, len(coordinates), 2)]
+            size = width * height
+            tables = []
+            for i in range(0, 2 * count):
+                if numpy is not None:
+                    tables.append(numpy.frombuffer(source.read(size * 8), dtype='<i8'))
+                else:
+                    tables.append(read_values(source, size))
+
+        return Landmarks(width, height, digest.decode('ascii'), requested, METHODS[method], positions,
+                         tables[0::2], tables[1::2])
+
+
+def edge_positions(width, height, count):
+    """
+    :return: [(x_pos, y_pos), ...]: up to count positions spread evenly along the border of the map
+    """
+    border = [(x_pos, 0) for x_pos in range(0, width)]
+    border += [(width - 1, y_pos) for y_pos in range(1, height)]
+    border += [(x_pos, height - 1) for x_pos in range(width - 2, -1, -1)]
+    border += [(0, y_pos) for y_pos in range(height - 2, 0, -1)]
+
+    positions = []
+    for i in range(0, count):
+        position = border[i * len(border) // count]
+        if position not in positions:
+            positions.append(position)
+    return positions
+
+
+def build(environment, count=8, method='farthest'):
+    """
+    Select landmarks and compute their distance tables
+
+        'farthest': each landmark is the position farthest (round trip) from the landmarks
+                    already selected, starting from the position farthest from the center
+        'edges': landmarks spread evenly along the border of the map
+
+    :param environment: (Environment) map
+    :param count: (int) number of landmarks
+    :param method: (str) one of METHODS
+    :return: Landmarks
+    """
+    if method not in METHODS:
+        raise ValueError("unknown landmark method '" + str(method) + "', expected one of " + str(METHODS))
+
+    width, height = environment.width, environment.height
+    elevations = environment.flat_elevations()
+    size = width * height
+
+    def round_trip(position):
+        forward = dijkstra(width, height, elevations, position)
+        backward = dijkstra(width, height, elevations, position, reverse=True)
+        return forward, backward
+
+    positions, forwards, backwards = [], [], []
+    if method == 'edges':
+        for position in edge_positions(width, height, count):
+            forward, backward = round_trip(position)
+            positions.append(position)
+            forwards.append(forward)
+            backwards.append(backward)
+    else:
+        # round trip distance to the closest landmark selected so far
+        forward, backward = round_trip((width // 2, height // 2))
+        closest = [f + b for f, b in zip(forward, backward)]
+        for i in range(0, min(count, size)):
+            index = max(range(0, size), key=closest.__getitem__)
+            position = (index % width, index // width)
+            forward, backward = round_trip(position)
+            positions.append(position)
+            forwards.append(forward)
+            backwards.append(backward)
+            closest = [min(c, f + b) for c, f, b in zip(closest, forward, backward)]
+
+    return Landmarks(width, height, environment.content_hash(), count, method, positions, forwards, backwards)
+
+
+# settings used by astar.Search(heuristic='alt'), see configure
+settings = {'count': 8, 'method': 'farthest', 'save': False}
+
+# landmarks of the most recently used maps: (digest, count, method) -> Landmarks
+loaded = OrderedDict()
+LOADED_SIZE = 4
+
+
+def configure(count=8, method='farthest', save=False):
+    """
+    :param count: (int) number of landmarks
+    :param method: (str) one of METHODS
+    :param save: (bool) save newly built tables next to the map file
+    :return: None
+    """
+    if method not in METHODS:
+        raise ValueError("unknown landmark method '" + str(method) + "', expected one of " + str(METHODS))
+    settings['count'] = count
+    settings['method'] = method
+    settings['save'] = save
+
+
+def landmarks_for(environment):
+    """
+    Landmarks of a map with the current settings: kept in memory, read from the file next to
+    the map if it matches, built otherwise
+
+    :param environment: (Environment) map
+    :return: Landmarks
+    """
+    key = (environment.content_hash(), settings['count'], settings['method'])
+    landmarks = loaded.pop(key, None)
+
+    if landmarks is None:
+        path = None
+        if environment.map_path is not None and os.path.isfile(environment.map_path):
+            path = environment.map_path + SUFFIX
+        if path is not None and os.path.isfile(path):
+            landmarks = Landmarks.load(path)
+            if landmarks is not None and (landmarks.digest, landmarks.count, landmarks.method) != key:
+                landmarks = None                                # stale or built with other settings
+        if landmarks is None:
+            landmarks = build(environment, settings['count'], settings['method'])
+            if path is not None and settings['save']:
+                landmarks.save(path)
+        while len(loaded) >= LOADED_SIZE:
+            loaded.popitem(last=False)
+
+    loaded[key] = landmarks
+    return landmarks
+
+
+def alt_table(environment, goal=None):
+    """
+    :param environment: (Environment) map
+    :param goal: (x_pos, y_pos): goal position, defaults to the goal of the environment
+    :return: int[][]: ALT heuristic indexed [x][y]
+    """
+    return landmarks_for(environment).heuristic_table(environment, goal)
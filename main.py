@@ -4,8 +4,12 @@
 
 import argparse
 import environment
+import instrument
+import json
+import output
 import state
 import sys
+import tiledmap
 
 parser = argparse.ArgumentParser(description='Run a single search')
 parser.add_argument('search_module', metavar='search-module',
@@ -26,8 +30,74 @@ parser.add_argument('--end-y', type=int, default=-1,
 parser.add_argument('--minimal-display', action='store_true',
                     help='Hide display of things that may change with a different heuristic.\n' + \
                          'Useful for alternate-heuristic tests.')
+parser.add_argument('--search-option', metavar='KEY=VALUE', action='append', default=[],
+                    help='Extra keyword argument for the Search class, e.g. frontier=bucket.\n' + \
+                         'May be given more than once.')
+parser.add_argument('--cost-to-go-dir', metavar='DIR',
+                    help='Persist the cost-to-go tables of --search-option heuristic=exact in DIR')
+parser.add_argument('--result-cache-dir', metavar='DIR',
+                    help='Persist the results of --search-option cache=1 in DIR, see resultcache.py')
+parser.add_argument('--result-cache-bytes', type=int, default=64 << 20,
+                    help='Memory taken by the results of --search-option cache=1, default is 64 MiB')
+parser.add_argument('--landmarks', type=int, default=8,
+                    help='Number of landmarks of --search-option heuristic=alt, default is 8')
+parser.add_argument('--landmark-method', choices=('farthest', 'edges'), default='farthest',
+                    help='How landmarks are selected, default is farthest')
+parser.add_argument('--save-landmarks', action='store_true',
+                    help='Save the landmark tables next to the map file (<map>.landmarks)')
+parser.add_argument('--tile-cache', type=int, default=64,
+                    help='Number of tiles of a tiled map (see tiledmap.py) kept in memory, default is 64')
+parser.add_argument('--prefetch-tiles', action='store_true',
+                    help='Read the next tile of a tiled map in the background while searching')
+parser.add_argument('--output-format', choices=output.FORMATS, default='text',
+                    help='text (default), jsonl (JSON Lines) or binary, see output.py')
+parser.add_argument('--summary-only', action='store_true',
+                    help='Only print the solution and the number of closed and frontier states')
+parser.add_argument('--stats', action='store_true',
+                    help='Print the counters and timers of the search as JSON on stderr\n' + \
+                         '(astar, bbfs, multigoal and parallel, see instrument.py).')
+parser.add_argument('--stats-counters', action='store_true',
+                    help='Like --stats without the timers, so the output is the same on every run')
+parser.add_argument('--batch', metavar='QUERY-FILE', type=argparse.FileType('r'),
+                    help='Run every "start_x start_y end_x end_y energy" line of QUERY-FILE\n' + \
+                         '(- for stdin) against the map and print one result line per query.')
+parser.add_argument('--processes', type=int, default=1,
+                    help='Number of worker processes used by --batch, default is 1')
 args = parser.parse_args()
 
+
+def parse_option_value(value):
+    # numbers are passed as numbers, everything else as a string
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+search_options = {}
+for option in args.search_option:
+    if '=' not in option:
+        parser.error("--search-option expects KEY=VALUE, got '%s'" % option)
+    key, value = option.split('=', 1)
+    search_options[key] = parse_option_value(value)
+
+if args.cost_to_go_dir:
+    import costtogo
+    costtogo.configure(directory=args.cost_to_go_dir)
+
+if search_options.get('cache'):
+    import resultcache
+    resultcache.configure(args.result_cache_bytes, args.result_cache_dir)
+
+# the tile cache only applies to tiled maps, see tiledmap.py
+if tiledmap.is_tiled_map(args.map_name):
+    tiledmap.configure(args.tile_cache, args.prefetch_tiles)
+
+if search_options.get('heuristic') == 'alt':
+    import landmarks
+    landmarks.configure(args.landmarks, args.landmark_method, args.save_landmarks)
+
 # Import the search algo module, removing the .py extension if found.
 if args.search_module.endswith('.py') and len(args.search_module) > 3:
     search_pkg = __import__(args.search_module[:-3])
@@ -36,24 +106,43 @@ else:
 
 env = environment.Environment(args.map_name, args.energy,
                               (args.end_x, args.end_y))
+
+if args.stats or args.stats_counters:
+    if args.batch:
+        parser.error("--stats applies to a single search, not to --batch")
+    if not hasattr(search_pkg.Search, 'statistics'):
+        parser.error("--stats is not supported by " + search_pkg.__name__)
+    search_options['stats'] = True
+
+if args.batch and args.output_format != 'text':
+    parser.error("--batch only writes text results")
+
+if args.batch:
+    import batch
+    for result in batch.run_batch(env, batch.read_queries(args.batch), search_pkg.__name__,
+                                  search_options, args.processes):
+        sys.stdout.write(batch.format_result(result) + '\n')
+    sys.exit(0)
+
 initial_state = state.State(args.start_x, args.start_y)
-search = search_pkg.Search(initial_state, env)
+search = search_pkg.Search(initial_state, env, **search_options)
+started = instrument.timer()
 (solution, frontier, visited) = search.search()
+elapsed = instrument.timer() - started
 
-if solution:
-    print "Solution steps: " + str(solution.moves_so_far)
-    print "Solution cost: %d" % solution.cost_so_far
-else:
-    print "No solution found"
-
-if not args.minimal_display:
-    print "Number of states considered: %d" % len(visited)
-    print
-    print "Frontier:"
-    for state in frontier:
-        print state
-    print
-    print "Closed List:"
-    for state in visited:
-        print state
+# bounded-suboptimal searches report how far from the optimum the cost can be
+output.write_results(sys.stdout, args.output_format, solution, frontier, visited,
+                     getattr(search, 'bound', None), args.minimal_display, args.summary_only)
+
+# multi-goal searches report the path to each goal
+if hasattr(search, 'goal_results') and args.output_format == 'text':
+    sys.stdout.write("\nGoals:\n" + ''.join(line + "\n" for line in search.report()))
 
+if args.stats or args.stats_counters:
+    statistics = search.statistics()
+    if args.stats:
+        statistics['search']['times']['total'] = elapsed
+    else:
+        del statistics['search']['times']                   # timers differ from run to run
+    sys.stdout.flush()
+    sys.stderr.write(json.dumps(statistics, sort_keys=True) + '\n')
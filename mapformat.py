@@ -0,0 +1,220 @@
+#!/usr/bin/python
+"""
+File:           mapformat.py
+
+Author:         Alexander Adranly
+
+Description:    Binary elevation map format and converters between the text and binary formats
+
+    Binary layout (little-endian):
+        header: 4s magic 'AMAP', B version, c typecode ('h' int16 or 'i' int32), 2 pad bytes,
+                I width, I height
+        grid:   width * height elevations, row by row starting at y = 0 (the last line of a text map)
+
+    The grid is opened with mmap, so a map of any size is ready as soon as the header is read.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'AMAP'
+VERSION = 1
+HEADER = struct.Struct('<4sBc2xII')
+TYPECODES = {'h': 2, 'i': 4}
+NUMPY_DTYPES = {'h': '<i2', 'i': '<i4'}
+
+
+def is_binary_map(mapfile):
+    """
+    Checks if an opened map file is in the binary format, without consuming the file
+
+    :param mapfile: (file) map file opened by the caller, or a path
+    :return: (bool) True if the file starts with the binary map magic
+    """
+    path = mapfile if isinstance(mapfile, str) else getattr(mapfile, 'name', None)
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def pick_typecode(rows):
+    """
+    :param rows: [[int, ...], ...]: elevations row by row
+    :return: (char) smallest typecode that holds every elevation
+    """
+    low = min(min(row) for row in rows) if rows else 0
+    high = max(max(row) for row in rows) if rows else 0
+    return 'h' if -2**15 <= low and high < 2**15 else 'i'
+
+
+def write_binary_map(rows, out, typecode=None):
+    """
+    Write elevations in the binary map format
+
+    :param rows: [[int, ...], ...]: elevations, rows[y][x] with y = 0 first
+    :param out: (file) destination opened in binary mode
+    :param typecode: (char) 'h' or 'i', picked from the data when None
+    :return: None
+    """
+    if typecode is None:
+        typecode = pick_typecode(rows)
+    if typecode not in TYPECODES:
+        raise ValueError("unknown typecode '" + str(typecode) + "', expected one of " + str(sorted(TYPECODES)))
+
+    height = len(rows)
+    width = len(rows[0]) if height else 0
+    out.write(HEADER.pack(MAGIC, VERSION, typecode.encode('ascii'), width, height))
+    for row in rows:
+        data = array(typecode, row)
+        if sys.byteorder == 'big':
+            data.byteswap()
+        data.tofile(out)
+
+
+class MappedRows(object):
+
+    def __init__(self, buffer, offset, width, height, typecode):
+        """
+        Mapped Rows
+
+            Zero-copy view of a mapped grid that reads like a list of lists: rows[y][x]
+
+        --- INSTANCE VARIABLES ---
+        self.buffer: mmap: mapped file
+        self.offset: int: byte offset of the first row
+        self.row_struct: struct.Struct: decoder of a single row
+        """
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.height = height
+        self.item_size = TYPECODES[typecode]
+        self.item_format = '<' + typecode
+        self.row_struct = struct.Struct('<' + str(width) + typecode)
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y_pos):
+        if not 0 <= y_pos < self.height:
+            raise IndexError("row index out of range")
+        return MappedRow(self, self.offset + y_pos * self.width * self.item_size)
+
+    def __iter__(self):
+        for y_pos in range(0, self.height):
+            yield self[y_pos]
+
+
+class MappedRow(object):
+
+    def __init__(self, rows, offset):
+        """
+        Mapped Row
+
+            Single row of a MappedRows grid, decoded one element at a time
+        """
+        self.rows = rows
+        self.offset = offset
+
+    def __len__(self):
+        return self.rows.width
+
+    def __getitem__(self, x_pos):
+        if not 0 <= x_pos < self.rows.width:
+            raise IndexError("column index out of range")
+        return struct.unpack_from(self.rows.item_format, self.rows.buffer,
+                                  self.offset + x_pos * self.rows.item_size)[0]
+
+    def tolist(self):
+        """
+        :return: [int, ...]: copy of the row
+        """
+        return list(self.rows.row_struct.unpack_from(self.rows.buffer, self.offset))
+
+
+def open_binary_map(path, use_numpy=True):
+    """
+    Map a binary map file into memory
+
+    :param path: (str) path of the binary map
+    :param use_numpy: (bool) return a numpy array view when numpy is installed
+    :return: (width, height, grid): grid is a read-only numpy array indexed [y, x] or a MappedRows
+    """
+    with open(path, 'rb') as handle:
+        header = handle.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(path + ": truncated binary map header")
+        magic, version, typecode, width, height = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(path + ": not a binary map file")
+        if version != VERSION:
+            raise ValueError(path + ": unsupported binary map version %d" % version)
+        typecode = str(typecode.decode('ascii'))
+        if typecode not in TYPECODES:
+            raise ValueError(path + ": unknown typecode '" + typecode + "'")
+
+        expected = HEADER.size + width * height * TYPECODES[typecode]
+        if os.fstat(handle.fileno()).st_size < expected:
+            raise ValueError(path + ": grid is truncated, expected %d bytes" % expected)
+        buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if use_numpy and numpy is not None:
+        grid = numpy.frombuffer(buffer, dtype=NUMPY_DTYPES[typecode], count=width * height, offset=HEADER.size)
+        return width, height, grid.reshape(height, width)
+    return width, height, MappedRows(buffer, HEADER.size, width, height, typecode)
+
+
+def text_to_binary(text_path, binary_path, typecode=None):
+    """
+    Convert a text map into a binary map
+
+    :param text_path: (str) source text map
+    :param binary_path: (str) destination binary map
+    :param typecode: (char) 'h' or 'i', picked from the data when None
+    :return: None
+    """
+    from environment import Environment
+
+    with open(text_path, 'r') as mapfile:
+        env = Environment(mapfile, 0, (0, 0), storage='list')
+    with open(binary_path, 'wb') as out:
+        write_binary_map(env.elevations, out, typecode)
+
+
+def binary_to_text(binary_path, text_path):
+    """
+    Convert a binary map into a text map (top row first, like the maps in tests/)
+
+    :param binary_path: (str) source binary map
+    :param text_path: (str) destination text map
+    :return: None
+    """
+    width, height, grid = open_binary_map(binary_path, use_numpy=False)
+    with open(text_path, 'w') as out:
+        for y_pos in range(height - 1, -1, -1):
+            out.write(' '.join([str(elevation) for elevation in grid[y_pos].tolist()]) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert elevation maps between the text and binary formats')
+    parser.add_argument('direction', choices=['to-binary', 'to-text'],
+                        help='to-binary: text map -> binary map, to-text: binary map -> text map')
+    parser.add_argument('source', help='Map to read')
+    parser.add_argument('destination', help='Map to write')
+    parser.add_argument('--typecode', choices=sorted(TYPECODES), default=None,
+                        help='Element type of the binary grid: h (int16) or i (int32), default is the smallest that fits')
+    args = parser.parse_args()
+
+    if args.direction == 'to-binary':
+        text_to_binary(args.source, args.destination, args.typecode)
+    else:
+        binary_to_text(args.source, args.destination)
@@ -0,0 +1,321 @@
+#!usr/bin/python
+"""
+File:           multigoal.py
+
+Author:         Alexander Adranly
+
+Description:    Search for the cheapest paths from one start to a set of goals in a single sweep
+
+    A single A* search is guided by the smallest default heuristic over the goal set:
+
+        h(n) = min over goals g of |x_g - x_n| + |y_g - y_n| + |elevation(g) - elevation(n)|
+
+    Each term is consistent, so their minimum is too: it never overestimates the cost to the nearest
+    goal, hence to any goal, and states are closed with their optimal cost. The heuristic is 0 on
+    every goal, so goals are closed in order of their cost and each one is closed with its cheapest
+    path. The heuristic stays the same when goals are settled: lowering it to the remaining goals
+    would make closed states inconsistent.
+
+    The sweep stops when every goal is settled (the first one with mode='nearest'), or when the
+    lowest A* value of the frontier is over the energy budget: the goals left are not reachable
+    within budget.
+
+    Goal file format, one goal per line (blank lines and lines starting with '#' are skipped):
+        x_pos y_pos
+
+    Usage:
+        python main.py multigoal.py map --energy 300 --search-option goals=goals.txt
+        python multigoal.py map goals.txt --energy 300 [--nearest]
+"""
+import argparse
+from collections import OrderedDict
+
+from closedset import make_closed_set
+from frontier import make_frontier
+from instrument import CountingClosedSet, SearchStats, TimedFrontier, instrument_environment, timer
+from nodepool import NodePool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MODES = ('all', 'nearest')
+# number of goals from which the heuristic is computed with numpy
+VECTOR_GOALS = 16
+
+
+def parse_goal(line):
+    """
+    :param line: (str) line of a goal file
+    :return: (x_pos, y_pos), or None for a blank or comment line
+    """
+    line = line.strip()
+    if len(line) == 0 or line.startswith('#'):
+        return None
+    fields = line.split()
+    if len(fields) != 2:
+        raise ValueError("expected 'x_pos y_pos', got '" + line + "'")
+    return int(fields[0]), int(fields[1])
+
+
+def read_goals(lines):
+    """
+    :param lines: iterable of goal lines (e.g. an open file)
+    :return: [(x_pos, y_pos), ...]: goals in file order
+    """
+    goals = []
+    for line in lines:
+        goal = parse_goal(line)
+        if goal is not None:
+            goals.append(goal)
+    return goals
+
+
+class GoalSetHeuristic(object):
+
+    def __init__(self, environment, goals):
+        """
+        GOAL SET HEURISTIC
+
+            Smallest default heuristic over a set of goals, see the module description
+
+        --- INSTANCE VARIABLES ---
+        self.goals: [(x_pos, y_pos, elevation), ...]: goals with their elevation
+        self.vectors: (xs, ys, elevations) numpy arrays of the goals, None when there are few goals
+            or numpy is not installed
+        self.values: {(x_pos, y_pos): int}: heuristic of the positions already asked for
+        """
+        elevations = environment.elevations_at(goals)
+        self.goals = [(x_pos, y_pos, elevation) for (x_pos, y_pos), elevation in zip(goals, elevations)]
+        self.vectors = None
+        if numpy is not None and len(goals) >= VECTOR_GOALS:
+            coords = numpy.asarray(self.goals, dtype=numpy.int64)
+            self.vectors = coords[:, 0], coords[:, 1], coords[:, 2]
+        self.values = {}
+
+    def __call__(self, x_pos, y_pos, elevation):
+        """
+        :param x_pos: (int)
+        :param y_pos: (int)
+        :param elevation: (int) elevation of the position
+        :return: (int) lower bound on the cost from the position to any goal
+        """
+        position = (x_pos, y_pos)
+        value = self.values.get(position)
+        if value is None:
+            if self.vectors is not None:
+                xs, ys, elevations = self.vectors
+                value = int((numpy.abs(xs - x_pos) + numpy.abs(ys - y_pos) +
+                             numpy.abs(elevations - elevation)).min())
+            else:
+                value = min(abs(x_goal - x_pos) + abs(y_goal - y_pos) + abs(goal_elevation - elevation)
+                            for x_goal, y_goal, goal_elevation in self.goals)
+            self.values[position] = value
+        return value
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment, goals=None, mode='all', frontier='heap', closed='grid',
+                 stats=False):
+        """
+        MULTI-GOAL SEARCH
+
+            Cheapest paths from the start to every goal of a set, or to the cheapest one, in a single A* sweep
+            (see the module description)
+
+        --- PARAMETERS ---
+        goals: [(x_pos, y_pos), ...] or str: goals, or the path of a goal file. None for the goal of the
+            environment alone.
+        mode: str: 'all' to settle every goal, 'nearest' to stop at the cheapest one
+        frontier: str: frontier backend to use, see frontier.py
+        closed: str: closed set backend to use, see closedset.py
+        stats: bool: count and time what the search does, see statistics() and instrument.py
+
+        --- INSTANCE VARIABLES ---
+        self.goals: [(x_pos, y_pos), ...]: goals without duplicates, in the order given
+        self.heuristic: GoalSetHeuristic: heuristic of the goal set
+        self.pool: NodePool: search nodes, the frontier and the closed set hold node indexes
+        self.settled: {(x_pos, y_pos): int}: node of each goal closed so far
+        self.goal_results: OrderedDict: (x_pos, y_pos) -> State of the cheapest path, or None when the goal is
+            not reachable within budget (or was not settled with mode='nearest'). Filled in by search().
+        """
+        if mode not in MODES:
+            raise ValueError("unknown mode '" + str(mode) + "', expected one of " + str(MODES))
+        if goals is None:
+            goals = [(environment.end_x, environment.end_y)]
+        elif isinstance(goals, str):
+            with open(goals, 'r') as goal_file:
+                goals = read_goals(goal_file)
+        self.goals = list(OrderedDict.fromkeys(tuple(goal) for goal in goals))
+        if len(self.goals) == 0:
+            raise ValueError("at least one goal is required")
+        for x_pos, y_pos in self.goals:
+            if not environment.is_valid_position(x_pos, y_pos):
+                raise ValueError("goal (" + str(x_pos) + ", " + str(y_pos) + ") is not on the map")
+
+        self.stats = None
+        if stats:
+            self.stats = SearchStats()
+            environment = instrument_environment(environment, self.stats)
+        self.environment = environment
+        self.mode = mode
+        self.frontier = make_frontier(frontier)
+        self.visited = make_closed_set(closed, environment.width, environment.height)
+        if self.stats is not None:
+            self.frontier = TimedFrontier(self.frontier, self.stats)
+            self.visited = CountingClosedSet(self.visited, self.stats)
+
+        started = timer()
+        self.heuristic = GoalSetHeuristic(environment, self.goals)
+        x_start, y_start = init_state.position
+        init_state.a_star = init_state.cost_so_far + self.heuristic(x_start, y_start,
+                                                                    environment.elevation(x_start, y_start))
+        if self.stats is not None:
+            self.stats.times['heuristic'] += timer() - started
+
+        self.current_state = init_state
+        self.pool = NodePool()
+        self.settled = {}
+        self.goal_results = None
+        root = self.pool.add(x_start, y_start, init_state.cost_so_far, init_state.a_star)
+        self.frontier.push(root, init_state.position, init_state.a_star)
+
+    def search(self):
+        """
+        Function driver of the multi-goal search
+
+        :return:
+        solution (State): state of the cheapest goal reached within budget, or None
+        frontier ([State, ...]): an array of states which are in the frontier at the end of the search
+        visited ([State, ...]): an array of states that have been expanded during the search
+
+        The path to every goal is in self.goal_results
+        """
+        pool = self.pool
+        budget = self.environment.energy_budget
+        remaining = set(self.goals)
+        first = None
+
+        while len(self.frontier) != 0 and self.frontier.min_priority() <= budget:
+            node = self.frontier.pop()
+            position = pool.position(node)
+            self.visited.add(node, position)
+
+            if position in remaining:
+                # goals are closed in order of cost, each with its cheapest path
+                remaining.discard(position)
+                self.settled[position] = node
+                if first is None:
+                    first = node
+                if self.mode == 'nearest' or len(remaining) == 0:
+                    break
+
+            self.explore(node)
+
+        return self.results(first)
+
+    def explore(self, node):
+        """
+        Expand a node, successors in NESW order
+
+        A successor over budget, or whose A* value is over budget, cannot lead to a goal within
+        budget and is dropped
+
+        :param node: (int) index of the node to expand
+        :return: None
+        """
+        pool = self.pool
+        environment = self.environment
+        heuristic = self.heuristic
+        budget = environment.energy_budget
+        x_pos, y_pos, cost_so_far = pool.x[node], pool.y[node], pool.g[node]
+        src_elevation = environment.elevation(x_pos, y_pos)
+
+        for x_next, y_next, move in environment.successors(x_pos, y_pos):
+            position = (x_next, y_next)
+            if position in self.visited:
+                continue
+
+            elevation = environment.elevation(x_next, y_next)
+            cost = cost_so_far + environment.elevation_cost(src_elevation, elevation)
+            a_star = cost + heuristic(x_next, y_next, elevation)
+            if a_star > budget:
+                if self.stats is not None:
+                    self.stats.budget_prunes += 1
+                continue
+
+            existing = self.frontier.get(position)
+            if existing is not None and a_star >= pool.f[existing]:
+                # the older node keeps its place in the frontier
+                if self.stats is not None:
+                    self.stats.duplicates += 1
+                continue
+
+            self.frontier.push(pool.add(x_next, y_next, cost, a_star, node, move), position, a_star)
+
+    def results(self, first):
+        """
+        --- HELPER METHOD ---
+        Build the State objects of the results and fill in self.goal_results
+
+        :param first: (int) node of the cheapest goal, or None
+        :return: same as search()
+        """
+        states = {0: self.current_state}                                          # the root is the initial state
+        frontier = self.pool.to_states(self.frontier.items(), states)
+        visited = self.pool.to_states(self.visited.items(), states)
+        self.goal_results = OrderedDict((goal, None) for goal in self.goals)
+        for goal, node in self.settled.items():
+            self.goal_results[goal] = states[node]
+        return None if first is None else states[first], frontier, visited
+
+    def report(self):
+        """
+        :return: [str, ...]: one line per goal, in the order given: position, then the cost and moves of
+            its cheapest path, 'No solution found', or 'Not settled' for the goals left with mode='nearest'
+        """
+        lines = []
+        for goal, solution in self.goal_results.items():
+            if solution is None and self.mode == 'nearest':
+                lines.append("Goal " + str(goal) + ": Not settled")
+            elif solution is None:
+                lines.append("Goal " + str(goal) + ": No solution found")
+            else:
+                lines.append("Goal " + str(goal) + ": Cost=" + str(solution.cost_so_far) +
+                             " Moves=" + str(solution.moves_so_far))
+        return lines
+
+    def statistics(self):
+        """
+        Counters and timers of the search (see instrument.SearchStats) and of its environment
+
+        :return: {'search': {str: value}, 'environment': {str: value}}, None unless stats=True
+        """
+        if self.stats is None:
+            return None
+        return {'search': self.stats.as_dict(), 'environment': self.environment.statistics()}
+
+
+if __name__ == '__main__':
+    import environment
+    from state import State
+
+    parser = argparse.ArgumentParser(description='Cheapest paths from one start to several goals')
+    parser.add_argument('map_name', metavar='map-name', type=argparse.FileType('r'), help='Name of map file')
+    parser.add_argument('goals', help='Goal file, one "x_pos y_pos" line per goal')
+    parser.add_argument('--energy', type=int, default=100, help='Starting energy level, default is 100')
+    parser.add_argument('--start-x', type=int, default=0, help='Starting X position, default is 0')
+    parser.add_argument('--start-y', type=int, default=0, help='Starting Y position, default is 0')
+    parser.add_argument('--nearest', action='store_true', help='Stop at the cheapest goal')
+    args = parser.parse_args()
+
+    env = environment.Environment(args.map_name, args.energy, (-1, -1))
+    search = Search(State(args.start_x, args.start_y), env, args.goals, 'nearest' if args.nearest else 'all')
+    started = timer()
+    solution, frontier, visited = search.search()
+    elapsed = timer() - started
+    for line in search.report():
+        print(line)
+    print("Number of states considered: %d (%.3f s)" % (len(visited), elapsed))
@@ -0,0 +1,98 @@
+#!usr/bin/python
+"""
+File:           nodepool.py
+
+Author:         Alexander Adranly
+
+Description:    Array-backed storage for search nodes
+
+"""
+from array import array
+
+from state import State
+
+# parent index of the first node of a path
+NO_PARENT = -1
+
+
+class NodePool(object):
+
+    def __init__(self):
+        """
+        NODE POOL
+
+            Struct-of-arrays storage for search nodes: a node is an index into parallel arrays,
+            so generating a successor costs a few machine integers instead of a State object.
+            State objects are only built at the API boundary (see to_states).
+
+        --- INSTANCE VARIABLES ---
+        self.x, self.y: array('i'): position of each node
+        self.g: array('i'): cost so far of each node
+        self.f: array('i'): A* value of each node (0 when the search has no heuristic)
+        self.parent: array('i'): index of the node the agent came from, NO_PARENT for the first node
+        self.move: array('b'): code of the move taken from the parent (see path.MOVES), -1 for the first node
+        """
+        self.x = array('i')
+        self.y = array('i')
+        self.g = array('i')
+        self.f = array('i')
+        self.parent = array('i')
+        self.move = array('b')
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, x_pos, y_pos, g, f, parent=NO_PARENT, move=-1):
+        """
+        Allocate a node
+
+        :return: (int) index of the new node
+        """
+        self.x.append(x_pos)
+        self.y.append(y_pos)
+        self.g.append(g)
+        self.f.append(f)
+        self.parent.append(parent)
+        self.move.append(move)
+        return len(self.x) - 1
+
+    def position(self, node):
+        """
+        :param node: (int) index of the node
+        :return: (x_pos, y_pos): position of the node
+        """
+        return self.x[node], self.y[node]
+
+    def to_states(self, nodes, states=None):
+        """
+        Build State objects for nodes, sharing the State of any common ancestor
+
+        :param nodes: [int, ...]: indexes of the nodes
+        :param states: {int: State}: states already built for this pool, updated in place
+        :return: [State, ...]: one state per node, in the same order
+        """
+        if states is None:
+            states = {}
+
+        result = []
+        for node in nodes:
+            # walk up until a node that already has a State, then build the chain downwards
+            chain = []
+            current = node
+            while current != NO_PARENT and current not in states:
+                chain.append(current)
+                current = self.parent[current]
+
+            parent_state = None if current == NO_PARENT else states[current]
+            for current in reversed(chain):
+                new_state = State(self.x[current], self.y[current])
+                if parent_state is not None:
+                    new_state.parent = parent_state
+                    new_state.move = self.move[current]
+                new_state.cost_so_far = self.g[current]
+                new_state.a_star = self.f[current]
+                states[current] = new_state
+                parent_state = new_state
+
+            result.append(states[node])
+        return result
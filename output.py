@@ -0,0 +1,313 @@
+#!usr/bin/python
+"""
+File:           output.py
+
+Author:         Alexander Adranly
+
+Description:    Output formats of main.py, written through a buffer as the states are formatted
+
+    text:   the original report, byte for byte: solution, number of states considered, then every
+            frontier and closed state with its full move list
+    jsonl:  one JSON object per line: a summary, then one record per closed and frontier state
+    binary: a summary header, then one fixed-size record per state
+
+    The jsonl and binary records do not repeat move lists. Records are numbered in the order they are
+    written (closed states first, then the frontier), and each one holds the index of its parent record
+    and the move taken from it, so a move list is rebuilt by walking the parents (see record_moves).
+    A parent that is in neither list is written first as an 'ancestor' record.
+
+    jsonl summary: {"solution": {"cost", "moves", "bound"} or null, "considered": int, "frontier": int}
+    jsonl record:  {"list": "closed" | "frontier" | "ancestor", "x", "y", "cost", "parent", "move"},
+                   with "prefix" (moves before the first state of the path) when not empty
+
+    binary layout (little-endian):
+        header:   4s magic 'ARES', B version, B flags (1: solution found, 2: bound set), 2 pad bytes,
+                  q solution cost, d suboptimality bound, I solution moves, I states considered,
+                  I frontier states, then the solution moves packed 2 bits each (see path.PackedPath)
+        records:  B list (0 closed, 1 frontier, 2 ancestor), i x, i y, q cost (-1 when infinite),
+                  i parent record (-1 for none), B move code (255 for none)
+        Prefix moves are not stored in binary records.
+
+    Usage:
+        python main.py astar.py huge.map --output-format binary > results.bin
+        python output.py to-text results.bin
+"""
+import argparse
+import json
+import struct
+import sys
+
+from path import MOVES, PackedPath
+
+FORMATS = ('text', 'jsonl', 'binary')
+LISTS = ('closed', 'frontier', 'ancestor')
+
+MAGIC = b'ARES'
+VERSION = 1
+HEADER = struct.Struct('<4sBB2xqdIII')
+RECORD = struct.Struct('<BiiqiB')
+FOUND, BOUNDED = 1, 2
+NO_MOVE = 255
+
+# characters (or bytes) gathered before a write to the output
+BUFFER_SIZE = 1 << 16
+
+
+class BufferedWriter(object):
+
+    def __init__(self, out, size=BUFFER_SIZE):
+        """
+        Buffered Writer
+
+            Gathers small writes and hands them to the output in large chunks
+
+        --- INSTANCE VARIABLES ---
+        self.chunks: [str, ...]: data not written yet
+        self.pending: int: length of the data not written yet
+        """
+        self.out = out
+        self.size = size
+        self.chunks = []
+        self.pending = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.pending += len(data)
+        if self.pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.out.write(self.chunks[0][:0].join(self.chunks))
+            self.chunks = []
+            self.pending = 0
+        if hasattr(self.out, 'flush'):
+            self.out.flush()
+
+
+def finite_cost(cost):
+    """
+    :return: (int) cost, None when it is infinite (e.g. unreachable states of dstar.py)
+    """
+    return None if cost == float('inf') else int(cost)
+
+
+def numbered(visited, frontier):
+    """
+    Number the states of the closed list and the frontier, parents first
+
+    :param visited: [State, ...]: closed list
+    :param frontier: [State, ...]: frontier
+    :return: generator of (list, state, parent record index or -1), records numbered from 0 in that order
+    """
+    indexes = {}                                                        # id(state) -> first record
+    count = 0
+    for list_id, states in ((0, visited), (1, frontier)):
+        for state in states:
+            # ancestors not written yet come first
+            chain = []
+            parent = state.parent
+            while parent is not None and id(parent) not in indexes:
+                chain.append(parent)
+                parent = parent.parent
+            for ancestor in reversed(chain):
+                yield 2, ancestor, -1 if ancestor.parent is None else indexes[id(ancestor.parent)]
+                indexes[id(ancestor)] = count
+                count += 1
+            yield list_id, state, -1 if state.parent is None else indexes[id(state.parent)]
+            indexes.setdefault(id(state), count)
+            count += 1
+
+
+def write_text(out, solution, frontier, visited, bound=None, minimal=False, summary_only=False):
+    """
+    The original main.py report, see the module description
+
+    :param out: (BufferedWriter) output
+    :param solution: (State) goal state, None when there is no solution
+    :param frontier: [State, ...]: frontier at the end of the search
+    :param visited: [State, ...]: states expanded by the search
+    :param bound: (float) suboptimality bound of the solution, None when the search does not report one
+    :param minimal: (bool) only the solution lines (--minimal-display)
+    :param summary_only: (bool) the solution lines and the state counts, without the states
+    :return: None
+    """
+    if solution:
+        out.write("Solution steps: " + str(solution.moves_so_far) + "\n")
+        out.write("Solution cost: %d\n" % solution.cost_so_far)
+        if bound is not None:
+            out.write("Suboptimality bound: %.3f\n" % bound)
+    else:
+        out.write("No solution found\n")
+
+    if minimal:
+        return
+    out.write("Number of states considered: %d\n" % len(visited))
+    if summary_only:
+        out.write("Number of frontier states: %d\n" % len(frontier))
+        return
+    out.write("\nFrontier:\n")
+    for state in frontier:
+        out.write(str(state) + "\n")
+    out.write("\nClosed List:\n")
+    for state in visited:
+        out.write(str(state) + "\n")
+
+
+def write_jsonl(out, solution, frontier, visited, bound=None, minimal=False, summary_only=False):
+    """
+    JSON Lines report, see the module description
+
+    :return: None
+    """
+    summary = {'solution': None, 'considered': len(visited), 'frontier': len(frontier)}
+    if solution:
+        summary['solution'] = {'cost': finite_cost(solution.cost_so_far), 'moves': ''.join(solution.moves_so_far),
+                               'bound': bound}
+    out.write(json.dumps(summary, sort_keys=True) + '\n')
+    if minimal or summary_only:
+        return
+
+    for list_id, state, parent in numbered(visited, frontier):
+        record = {'list': LISTS[list_id], 'x': state.position[0], 'y': state.position[1],
+                  'cost': finite_cost(state.cost_so_far), 'parent': parent,
+                  'move': None if state.parent is None else MOVES[state.move]}
+        if state.parent is None and state.prefix_moves:
+            record['prefix'] = ''.join(state.prefix_moves)
+        out.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def write_binary(out, solution, frontier, visited, bound=None, minimal=False, summary_only=False):
+    """
+    Binary report, see the module description
+
+    :param out: (BufferedWriter) output taking bytes
+    :return: None
+    """
+    flags, cost, path = 0, -1, PackedPath()
+    if solution:
+        flags |= FOUND
+        cost = finite_cost(solution.cost_so_far)
+        path = solution.packed_moves()
+    if bound is not None:
+        flags |= BOUNDED
+    out.write(HEADER.pack(MAGIC, VERSION, flags, cost, bound if bound is not None else 0.0,
+                          len(path), len(visited), len(frontier)))
+    out.write(path.to_bytes())
+    if minimal or summary_only:
+        return
+
+    pack = RECORD.pack
+    for list_id, state, parent in numbered(visited, frontier):
+        state_cost = finite_cost(state.cost_so_far)
+        out.write(pack(list_id, state.position[0], state.position[1], -1 if state_cost is None else state_cost,
+                       parent, NO_MOVE if state.parent is None else state.move))
+
+
+WRITERS = {'text': write_text, 'jsonl': write_jsonl, 'binary': write_binary}
+
+
+def write_results(stream, output_format, solution, frontier, visited, bound=None, minimal=False,
+                  summary_only=False):
+    """
+    Write the results of a search in one of FORMATS
+
+    :param stream: (file) output, binary output goes to its underlying byte stream when it has one
+    :param output_format: (str) one of FORMATS
+    :return: None
+    """
+    if output_format not in WRITERS:
+        raise ValueError("unknown output format '" + str(output_format) + "', expected one of " + str(FORMATS))
+    if output_format == 'binary':
+        stream = getattr(stream, 'buffer', stream)
+    out = BufferedWriter(stream)
+    WRITERS[output_format](out, solution, frontier, visited, bound, minimal, summary_only)
+    out.flush()
+
+
+def read_binary(source):
+    """
+    :param source: (file) binary report opened in binary mode
+    :return: {str: value}: solution ({'cost', 'moves', 'bound'} or None), considered, frontier and
+        records [(list, x_pos, y_pos, cost, parent, move code), ...]
+    """
+    header = source.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("truncated binary report header")
+    magic, version, flags, cost, bound, length, considered, frontier = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a binary report, or an unsupported version")
+
+    path = PackedPath.from_bytes(source.read((length + 3) // 4), length)
+    solution = None
+    if flags & FOUND:
+        solution = {'cost': cost, 'moves': path.moves(), 'bound': bound if flags & BOUNDED else None}
+
+    records = []
+    data = source.read(RECORD.size)
+    while len(data) == RECORD.size:
+        records.append(RECORD.unpack(data))
+        data = source.read(RECORD.size)
+    return {'solution': solution, 'considered': considered, 'frontier': frontier, 'records': records}
+
+
+def record_moves(records, index):
+    """
+    :param records: [(list, x_pos, y_pos, cost, parent, move code), ...]: see read_binary
+    :param index: (int) record index
+    :return: [char, ...]: moves of the state of a record
+    """
+    codes = []
+    while records[index][4] != -1:
+        codes.append(records[index][5])
+        index = records[index][4]
+    return [MOVES[code] for code in reversed(codes)]
+
+
+def binary_to_text(source, out):
+    """
+    Rebuild the text report from a binary report
+
+    :param source: (file) binary report opened in binary mode
+    :param out: (file) text output
+    :return: None
+    """
+    report = read_binary(source)
+    solution, records = report['solution'], report['records']
+    writer = BufferedWriter(out)
+    if solution:
+        writer.write("Solution steps: " + str(solution['moves']) + "\n")
+        writer.write("Solution cost: %d\n" % solution['cost'])
+        if solution['bound'] is not None:
+            writer.write("Suboptimality bound: %.3f\n" % solution['bound'])
+    else:
+        writer.write("No solution found\n")
+    writer.write("Number of states considered: %d\n" % report['considered'])
+    if not records:
+        writer.flush()
+        return
+
+    def line(index):
+        list_id, x_pos, y_pos, cost, parent, move = records[index]
+        return "Pos=" + str((x_pos, y_pos)) + " Moves=" + str(record_moves(records, index)) + \
+            " Cost=" + (str(cost) if cost != -1 else 'inf') + "\n"
+
+    writer.write("\nFrontier:\n")
+    for index in range(0, len(records)):
+        if records[index][0] == 1:
+            writer.write(line(index))
+    writer.write("\nClosed List:\n")
+    for index in range(0, len(records)):
+        if records[index][0] == 0:
+            writer.write(line(index))
+    writer.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read a binary report written by main.py --output-format binary')
+    parser.add_argument('command', choices=['to-text'], help='to-text: print the report in the text format')
+    parser.add_argument('report', help='Binary report')
+    args = parser.parse_args()
+
+    with open(args.report, 'rb') as report_file:
+        binary_to_text(report_file, sys.stdout)
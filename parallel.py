@@ -0,0 +1,664 @@
+#!usr/bin/python
+"""
+File:           parallel.py
+
+Author:         Alexander Adranly
+
+Description:    Hash-distributed A* (HDA*) over several worker processes
+
+    Every position is owned by one worker, picked by a hash of its index (see owner_of). A worker keeps
+    the open and closed states of the positions it owns: it expands its best open states and sends each
+    successor to the owner of its position. Successors going to the same worker are gathered and sent
+    as one message of up to batch_size states.
+
+    The elevations are copied once into shared memory (see shared_grid); with the fork start method the
+    workers attach to that copy instead of each loading the map.
+
+    The owner of the goal keeps the cost of the cheapest path found so far (the incumbent), shared by
+    all the workers. A worker is idle when its messages are handled and none of its open states has an
+    A* value below the incumbent. The search is over when every worker is idle and every message sent
+    was received: no state left anywhere can lead to a cheaper path, so the incumbent is optimal.
+    This is detected with per-worker counters read twice in a row (see Search.terminated).
+
+    The solution cost is the same as astar.Search; on ties the path can differ from the one astar.Search
+    returns, as the order in which the workers expand states is not fixed.
+
+    Usage:
+        python main.py parallel.py huge.map --search-option processes=8 --summary-only
+        python parallel.py huge.map --processes 1 2 4 8 16 32
+"""
+import argparse
+import heapq
+import multiprocessing
+import sys
+import time
+
+from environment import Environment
+from instrument import timer
+from path import MOVE_N, MOVE_E, MOVE_S, MOVE_W, MOVES
+from state import State
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+COUNTERS = ('expansions', 'generated', 'duplicates', 'budget_prunes', 'messages', 'states_sent')
+
+# seconds an idle worker waits for a message before checking whether the search is over
+IDLE_WAIT = 0.002
+# seconds between two termination checks of the coordinator
+POLL_INTERVAL = 0.0005
+
+
+def owner_of(index, processes):
+    """
+    :param index: (int) position index, y * width + x
+    :param processes: (int) number of workers
+    :return: (int) worker owning the position
+    """
+    # multiplicative hash: neighbouring cells go to different workers
+    return (((index * 2654435761) & 0xffffffff) >> 8) % processes
+
+
+def fork_context():
+    """
+    :return: multiprocessing context starting workers with fork when the platform has it, so they inherit
+        the shared grid and main.py is not imported again
+    """
+    if hasattr(multiprocessing, 'get_context') and 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing
+
+
+def shared_grid(environment):
+    """
+    Copy the elevations of a map into shared memory, row by row
+
+    :param environment: (Environment) map, in any storage
+    :return: RawArray: elevations in row-major order, index y * width + x
+    """
+    width = environment.width
+    grid = fork_context().RawArray('l', width * environment.height)
+    for y_pos in range(0, environment.height):
+        row = environment.elevations[y_pos]
+        grid[y_pos * width:(y_pos + 1) * width] = row.tolist() if hasattr(row, 'tolist') else list(row)
+    return grid
+
+
+class Incumbent(object):
+
+    def __init__(self, cost, context=multiprocessing):
+        """
+        Incumbent
+
+            Cost of the cheapest path to the goal found so far, shared by the workers.
+            Read without the lock: it only ever goes down.
+        """
+        self.shared = context.RawValue('l', cost)
+        self.lock = context.Lock()
+
+    @property
+    def value(self):
+        return self.shared.value
+
+    def offer(self, cost):
+        """
+        :param cost: (int) cost of a path to the goal
+        :return: (bool) True if it is the cheapest path so far
+        """
+        with self.lock:
+            if cost < self.shared.value:
+                self.shared.value = cost
+                return True
+        return False
+
+
+class Worker(object):
+
+    def __init__(self, index, processes, grid, width, height, goal, batch_size, incumbent):
+        """
+        HDA* WORKER
+
+            Open and closed states of the positions owned by one worker
+
+        --- INSTANCE VARIABLES ---
+        self.info: {int: (g, parent index, move code)}: cheapest known path to each owned position,
+            parent -1 for the start
+        self.open: [(f, sequence, index, g), ...]: heap of open states, entries whose g is no longer the
+            one in self.info are stale and skipped
+        self.closed: {int: (f, order)}: expanded positions, the A* value they were expanded with and
+            the number of positions this worker expanded before
+        self.outboxes: [[int, ...], ...]: successors waiting to be sent to each worker, 4 ints per state
+            (index, g, parent index, move code)
+        self.send: function(worker, states): hands a batch to another worker, set by the process running
+            the worker
+        """
+        self.index = index
+        self.processes = processes
+        self.grid = grid
+        self.width = width
+        self.height = height
+        self.goal = goal[1] * width + goal[0]
+        self.goal_position = goal
+        self.goal_elevation = grid[self.goal]
+        self.batch_size = batch_size
+        self.incumbent = incumbent
+
+        self.info = {}
+        self.open = []
+        self.closed = {}
+        self.sequence = 0
+        self.outboxes = [[] for _ in range(0, processes)]
+        self.send = None
+        self.counts = dict((name, 0) for name in COUNTERS)
+
+    def heuristic(self, index):
+        """
+        :return: (int) |dx| + |dy| + |delta elevation| to the goal, see Environment.heuristic_table
+        """
+        x_goal, y_goal = self.goal_position
+        return (abs(index % self.width - x_goal) + abs(index // self.width - y_goal) +
+                abs(self.grid[index] - self.goal_elevation))
+
+    def receive(self, states):
+        """
+        :param states: [int, ...]: 4 ints per state, see self.outboxes
+        :return: None
+        """
+        for offset in range(0, len(states), 4):
+            self.relax(states[offset], states[offset + 1], states[offset + 2], states[offset + 3])
+
+    def relax(self, index, cost, parent, move):
+        """
+        Record a path to an owned position if it is the cheapest one known, and open the position
+
+        :return: None
+        """
+        known = self.info.get(index)
+        if known is not None and known[0] <= cost:
+            self.counts['duplicates'] += 1
+            return
+        self.info[index] = (cost, parent, move)
+        if index == self.goal:
+            # f = g at the goal: nothing to expand, the path is a candidate solution
+            self.incumbent.offer(cost)
+            if index not in self.closed:
+                self.counts['expansions'] += 1                          # closed like astar.Search closes it
+            self.closed[index] = (cost, len(self.closed))
+            return
+        self.sequence += 1
+        heapq.heappush(self.open, (cost + self.heuristic(index), self.sequence, index, cost))
+
+    def expand(self, limit):
+        """
+        Expand up to limit open states whose A* value is below the incumbent
+
+        :param limit: (int) maximum number of expansions
+        :return: (bool) True if no open state is left below the incumbent
+        """
+        grid, width, height = self.grid, self.width, self.height
+        x_goal, y_goal = self.goal_position
+        goal_elevation = self.goal_elevation
+        elevation_cost = Environment.elevation_cost
+        open_states, info, counts = self.open, self.info, self.counts
+        processes, outboxes = self.processes, self.outboxes
+
+        expanded = 0
+        while open_states and expanded < limit:
+            bound = self.incumbent.value
+            if open_states[0][0] >= bound:
+                return True
+            f_value, _, index, cost = heapq.heappop(open_states)
+            if info[index][0] != cost:
+                continue                                                # a cheaper path was found since
+            self.closed[index] = (f_value, len(self.closed))
+            expanded += 1
+            counts['expansions'] += 1
+
+            x_pos, y_pos = index % width, index // width
+            elevation = grid[index]
+            for successor, move, x_next, y_next in ((index + width, MOVE_N, x_pos, y_pos + 1),
+                                                    (index + 1, MOVE_E, x_pos + 1, y_pos),
+                                                    (index - width, MOVE_S, x_pos, y_pos - 1),
+                                                    (index - 1, MOVE_W, x_pos - 1, y_pos)):
+                if not (0 <= x_next < width and 0 <= y_next < height):
+                    continue
+                counts['generated'] += 1
+                next_elevation = grid[successor]
+                next_cost = cost + elevation_cost(elevation, next_elevation)
+                if (next_cost + abs(x_next - x_goal) + abs(y_next - y_goal) +
+                        abs(next_elevation - goal_elevation)) >= bound:
+                    # over budget, or cannot beat the incumbent
+                    counts['budget_prunes'] += 1
+                    continue
+                owner = owner_of(successor, processes)
+                if owner == self.index:
+                    self.relax(successor, next_cost, index, move)
+                else:
+                    outbox = outboxes[owner]
+                    outbox.extend((successor, next_cost, index, move))
+                    if len(outbox) >= 4 * self.batch_size:
+                        self.flush_to(owner)
+
+        return not open_states or open_states[0][0] >= self.incumbent.value
+
+    def flush(self):
+        """
+        Send every waiting successor
+
+        :return: None
+        """
+        for owner in range(0, self.processes):
+            if self.outboxes[owner]:
+                self.flush_to(owner)
+
+    def flush_to(self, owner):
+        """
+        --- HELPER METHOD ---
+        """
+        states = self.outboxes[owner]
+        self.outboxes[owner] = []
+        self.counts['messages'] += 1
+        self.counts['states_sent'] += len(states) // 4
+        self.send(owner, states)
+
+    def trace(self, index):
+        """
+        Follow the parents of a position while they are owned by this worker
+
+        :param index: (int) owned position
+        :return: ([int, ...], int): move codes from the position backwards, and the first parent owned by
+            another worker (-1 when the start was reached)
+        """
+        codes = []
+        while index != -1 and owner_of(index, self.processes) == self.index:
+            cost, index, move = self.info[index]
+            if index != -1:
+                codes.append(move)
+        return codes, index
+
+    def records(self):
+        """
+        :return: ([record, ...], [record, ...]): closed and open positions, each record
+            (index, g, parent index, move code, f, order): order is the expansion order of a closed
+            position, the insertion order of an open one
+        """
+        frontier = {}
+        for f_value, sequence, index, cost in self.open:
+            if self.info[index][0] == cost:
+                frontier[index] = (f_value, sequence)
+        closed = [(index,) + self.info[index] + rank for index, rank in self.closed.items() if index not in frontier]
+        return closed, [(index,) + self.info[index] + rank for index, rank in frontier.items()]
+
+
+def run_worker(index, processes, grid, width, height, goal, batch_size, incumbent, inboxes, results, shared):
+    """
+    Process running a Worker until the search is over, then answering the trace, collect and stats
+    commands of the coordinator (see Search.search) until 'exit'
+
+    :param shared: (sent, received, generations, idle, over): RawArrays of the counters of every worker
+        (sent has an extra slot for the coordinator) and a RawValue set when the search is over
+    :return: None
+    """
+    sent, received, generations, idle, over = shared
+    inbox = inboxes[index]
+    worker = Worker(index, processes, grid, width, height, goal, batch_size, incumbent)
+
+    def send(owner, states):
+        sent[index] += 1                                                # counted before it can be received
+        inboxes[owner].put(states)
+    worker.send = send
+
+    def handle(message):
+        if isinstance(message, tuple):
+            # a command: the coordinator found the search over before this worker read the flag
+            commands.append(message)
+            return
+        if idle[index]:
+            generations[index] += 1
+            idle[index] = 0
+        received[index] += 1
+        worker.receive(message)
+
+    commands = []
+    while not over.value and not commands:
+        try:
+            while not commands:
+                handle(inbox.get(block=False))
+        except queue.Empty:
+            pass
+
+        if worker.expand(batch_size):
+            worker.flush()
+            idle[index] = 1
+            try:
+                handle(inbox.get(timeout=IDLE_WAIT))
+            except queue.Empty:
+                pass
+        else:
+            worker.flush()
+
+    while True:
+        command = commands.pop(0) if commands else inbox.get()
+        if command[0] == 'trace':
+            results.put(worker.trace(command[1]))
+        elif command[0] == 'collect':
+            results.put((index, worker.records()))
+        elif command[0] == 'stats':
+            results.put((index, worker.counts))
+        else:
+            break
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment, processes=None, batch_size=256, grid=None, collect=True,
+                 stats=False):
+        """
+        HASH DISTRIBUTED A* SEARCH
+
+            Optimal like astar.Search, the expansions are spread over several processes
+
+        --- PARAMETERS ---
+        processes: int: number of worker processes, defaults to the number of CPUs.
+            With 1 the search runs in this process, without messages.
+        batch_size: int: most successors sent to a worker in one message, also the number of states a
+            worker expands between two checks of its messages
+        grid: RawArray: elevations already copied by shared_grid, to share between searches of the same map
+        collect: bool: build the closed list and the frontier at the end of the search. Without it both are
+            empty lists and only the solution is returned, see self.counts for the number of expansions
+        stats: bool: keep the counters of every worker, see statistics()
+
+        --- INSTANCE VARIABLES ---
+        self.counts: {str: int}: counters of all the workers added up (see COUNTERS)
+        self.worker_counts: [{str: int}, ...]: counters of each worker
+        self.times: {str: float}: seconds spent copying the grid, starting the workers, searching and
+            gathering the results
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1 or batch_size < 1:
+            raise ValueError("processes and batch_size must be at least 1")
+
+        self.current_state = init_state
+        self.environment = environment
+        self.processes = processes
+        self.batch_size = batch_size
+        self.collect = collect
+        self.stats = stats
+        self.counts = dict((name, 0) for name in COUNTERS)
+        self.worker_counts = []
+        self.times = {'grid': 0.0, 'start': 0.0, 'search': 0.0, 'results': 0.0}
+
+        started = timer()
+        self.grid = shared_grid(environment) if grid is None else grid
+        self.times['grid'] = timer() - started
+
+    def search(self):
+        """
+        Function driver for the HDA* search algorithm
+
+        :return: same as astar.Search.search: solution (State or None), frontier and visited ([State, ...],
+            empty unless collect=True)
+        """
+        environment = self.environment
+        start = self.current_state.position
+        goal = (environment.end_x, environment.end_y)
+        if self.current_state.cost_so_far + environment.lower_bound(start[0], start[1]) > environment.energy_budget:
+            # even a lower bound on the cost to the goal is over budget
+            return None, [], []
+
+        context = fork_context()
+        incumbent = Incumbent(environment.energy_budget + 1, context)
+        root = (start[1] * environment.width + start[0], self.current_state.cost_so_far, -1, -1)
+        if self.processes == 1:
+            return self.search_here(goal, incumbent, root)
+
+        processes = self.processes
+        inboxes = [context.Queue() for _ in range(0, processes)]
+        results = context.Queue()
+        shared = (context.RawArray('l', processes + 1), context.RawArray('l', processes),
+                  context.RawArray('l', processes), context.RawArray('l', processes), context.RawValue('b', 0))
+        workers = [context.Process(target=run_worker,
+                                   args=(index, processes, self.grid, environment.width, environment.height, goal,
+                                         self.batch_size, incumbent, inboxes, results, shared))
+                   for index in range(0, processes)]
+        started = timer()
+        try:
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            self.times['start'] = timer() - started
+
+            started = timer()
+            shared[0][processes] += 1                                   # the coordinator sends the start
+            inboxes[owner_of(root[0], processes)].put(list(root))
+            while not self.terminated(shared[:4]):
+                if not all(worker.is_alive() for worker in workers):
+                    raise RuntimeError("an HDA* worker exited before the end of the search")
+                time.sleep(POLL_INTERVAL)
+            shared[4].value = 1
+            self.times['search'] = timer() - started
+
+            started = timer()
+            cost = incumbent.value
+            solution = None
+            if cost <= environment.energy_budget:
+                solution = self.solution_state(cost, lambda index: self.ask(inboxes, results, index))
+            for inbox in inboxes:
+                inbox.put(('stats',))
+            self.worker_counts = [counts for _, counts in sorted([results.get() for _ in workers])]
+            self.add_counts()
+            frontier, visited = [], []
+            if self.collect:
+                for inbox in inboxes:
+                    inbox.put(('collect',))
+                frontier, visited = self.build_states([records for _, records in
+                                                       sorted([results.get() for _ in workers])])
+            self.times['results'] = timer() - started
+            for inbox in inboxes:
+                inbox.put(('exit',))
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+        return solution, frontier, visited
+
+    def search_here(self, goal, incumbent, root):
+        """
+        --- HELPER METHOD ---
+        Single worker run in this process (processes=1)
+        """
+        environment = self.environment
+        worker = Worker(0, 1, self.grid, environment.width, environment.height, goal, self.batch_size, incumbent)
+        started = timer()
+        worker.relax(*root)
+        while not worker.expand(self.batch_size):
+            pass
+        self.times['search'] = timer() - started
+
+        started = timer()
+        self.worker_counts = [worker.counts]
+        self.add_counts()
+        solution = None
+        if incumbent.value <= environment.energy_budget:
+            solution = self.solution_state(incumbent.value, worker.trace)
+        frontier, visited = self.build_states([worker.records()]) if self.collect else ([], [])
+        self.times['results'] = timer() - started
+        return solution, frontier, visited
+
+    @staticmethod
+    def terminated(shared):
+        """
+        Two reads of the counters of every worker: the search is over when every worker was idle in both,
+        no worker became busy in between (same generations) and every message sent was received.
+        Every worker was then idle at once between the two reads, with no message in flight.
+
+        :param shared: (sent, received, generations, idle): counters, see run_worker
+        :return: (bool) True if the search is over
+        """
+        sent, received, generations, idle = shared
+        first = (list(idle), list(generations), list(sent), list(received))
+        if not all(first[0]):
+            return False
+        second = (list(idle), list(generations), list(sent), list(received))
+        return first == second and sum(first[2]) == sum(first[3])
+
+    @staticmethod
+    def ask(inboxes, results, index):
+        """
+        --- HELPER METHOD ---
+        Worker.trace run by the owner of a position
+        """
+        inboxes[owner_of(index, len(inboxes))].put(('trace', index))
+        return results.get()
+
+    def solution_state(self, cost, trace):
+        """
+        --- HELPER METHOD ---
+        Follow the parents of the goal from worker to worker back to the start
+
+        :param cost: (int) cost of the solution
+        :param trace: function(index): Worker.trace of the owner of the position
+        :return: State: goal state holding the whole path
+        """
+        environment = self.environment
+        codes = []
+        index = environment.end_y * environment.width + environment.end_x
+        while index != -1:
+            part, index = trace(index)
+            codes.extend(part)
+        codes.reverse()
+
+        solution = State(environment.end_x, environment.end_y)
+        solution.moves_so_far = list(self.current_state.moves_so_far) + [MOVES[code] for code in codes]
+        solution.cost_so_far = cost
+        return solution
+
+    def build_states(self, records):
+        """
+        --- HELPER METHOD ---
+        States of the closed lists and the frontiers of the workers, ordered by A* value, then by the
+        order each worker expanded (or opened) them in
+
+        :param records: [(closed, open), ...]: Worker.records of every worker
+        :return: (frontier, visited): [State, ...] each
+        """
+        width = self.environment.width
+        states = {}
+        entries = []
+        for closed, frontier in records:
+            for in_frontier, worker_records in ((False, closed), (True, frontier)):
+                for index, cost, parent, move, f_value, order in worker_records:
+                    if parent == -1:
+                        state = self.current_state
+                    else:
+                        state = State(index % width, index // width)
+                        state.move = move
+                    state.cost_so_far = cost
+                    state.a_star = f_value
+                    states[index] = state
+                    entries.append((f_value, order, index, in_frontier, parent))
+
+        for _, _, index, _, parent in entries:
+            if parent != -1:
+                states[index].parent = states[parent]
+        entries.sort()
+        frontier = [states[entry[2]] for entry in entries if entry[3]]
+        visited = [states[entry[2]] for entry in entries if not entry[3]]
+        return frontier, visited
+
+    def add_counts(self):
+        """
+        --- HELPER METHOD ---
+        """
+        for name in COUNTERS:
+            self.counts[name] = sum(counts[name] for counts in self.worker_counts)
+
+    def statistics(self):
+        """
+        Counters of the workers, added up and one by one, and the times of each step of the search
+
+        :return: {'search': {str: value}, 'environment': {str: value}}, None unless stats=True
+        """
+        if not self.stats:
+            return None
+        values = dict(self.counts)
+        values['processes'] = self.processes
+        values['workers'] = self.worker_counts
+        values['times'] = dict(self.times)
+        return {'search': values, 'environment': self.environment.statistics()}
+
+
+def measure_speedup(environment, start, process_counts, batch_size=256, repeat=1):
+    """
+    Time astar.Search and this search with each number of processes on one query
+
+    The grid is copied into shared memory once, before the timings; the times include starting the workers
+
+    :param environment: (Environment) map, goal and energy budget of the query
+    :param start: (x_pos, y_pos): start of the query
+    :param process_counts: [int, ...]: numbers of processes to time
+    :param batch_size: (int) see Search
+    :param repeat: (int) number of runs of each search, the fastest one is kept
+    :return: [(processes, seconds, expansions, cost), ...]: astar.Search first, with processes 0
+    """
+    import astar
+
+    def best_of(run):
+        times = []
+        for _ in range(0, repeat):
+            started = timer()
+            result = run()
+            times.append(timer() - started)
+        return min(times), result
+
+    def run_astar():
+        search = astar.Search(State(start[0], start[1]), environment)
+        solution, frontier, visited = search.search()
+        return len(visited), None if solution is None else solution.cost_so_far
+
+    def run_parallel(processes):
+        search = Search(State(start[0], start[1]), environment, processes, batch_size, grid, collect=False)
+        solution, frontier, visited = search.search()
+        return search.counts['expansions'], None if solution is None else solution.cost_so_far
+
+    grid = shared_grid(environment)
+    seconds, (expansions, cost) = best_of(run_astar)
+    rows = [(0, seconds, expansions, cost)]
+    for processes in process_counts:
+        seconds, (expansions, cost) = best_of(lambda: run_parallel(processes))
+        rows.append((processes, seconds, expansions, cost))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Speedup of HDA* against astar.Search on one query')
+    parser.add_argument('map_name', metavar='map-name', help='Map file, text, binary or tiled')
+    parser.add_argument('--energy', type=int, default=10 ** 9, help='Energy budget, default is unlimited')
+    parser.add_argument('--start-x', type=int, default=0, help='Starting X position, default is 0')
+    parser.add_argument('--start-y', type=int, default=0, help='Starting Y position, default is 0')
+    parser.add_argument('--end-x', type=int, default=-1, help='Ending X position, default is last column')
+    parser.add_argument('--end-y', type=int, default=-1, help='Ending Y position, default is last row')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Numbers of worker processes to time, default is 1 2 4 8')
+    parser.add_argument('--batch-size', type=int, default=256, help='Successors per message, default is 256')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of each search, the fastest is kept')
+    args = parser.parse_args()
+
+    with open(args.map_name, 'r') as mapfile:
+        env = Environment(mapfile, args.energy, (args.end_x, args.end_y))
+    rows = measure_speedup(env, (args.start_x, args.start_y), args.processes, args.batch_size, args.repeat)
+
+    baseline = rows[0][1]
+    sys.stdout.write("%-10s %10s %12s %10s %8s\n" % ('search', 'seconds', 'expansions', 'cost', 'speedup'))
+    for processes, seconds, expansions, cost in rows:
+        name = 'astar' if processes == 0 else 'hda*x%d' % processes
+        sys.stdout.write("%-10s %10.3f %12d %10s %8.2f\n" % (name, seconds, expansions, cost,
+                                                             baseline / seconds if seconds > 0 else 0.0))
+    if len(set(row[3] for row in rows)) > 1:
+        sys.stderr.write("error: the searches found different costs\n")
+        sys.exit(1)
@@ -0,0 +1,123 @@
+#!usr/bin/python
+"""
+File:           path.py
+
+Author:         Alexander Adranly
+
+Description:    Compact move encodings for the paths found by the search algorithms
+
+"""
+
+# move codes, 2 bits each, in the order the moves are considered
+MOVE_N, MOVE_E, MOVE_S, MOVE_W = 0, 1, 2, 3
+MOVES = ('N', 'E', 'S', 'W')
+MOVE_CODES = {'N': MOVE_N, 'E': MOVE_E, 'S': MOVE_S, 'W': MOVE_W}
+
+# code of the move that undoes a move: N <-> S, E <-> W
+OPPOSITE_CODES = (2, 3, 0, 1)
+
+
+def move_between(source, target):
+    """
+    :param source: (x_pos, y_pos)
+    :param target: (x_pos, y_pos): position next to source
+    :return: (int) code of the move from source to target
+    """
+    if target[1] > source[1]:
+        return MOVE_N
+    if target[0] > source[0]:
+        return MOVE_E
+    if target[1] < source[1]:
+        return MOVE_S
+    return MOVE_W
+
+
+def opposite_moves(moves):
+    """
+    Backtrace a list of moves: reverse the order and flip every direction
+
+    ex: ['N', 'E'] --> ['W', 'S']
+
+    :param moves: [char, ...]: moves in order
+    :return: [char, ...]: moves that walk the path back to its start
+    """
+    return [MOVES[OPPOSITE_CODES[MOVE_CODES[move]]] for move in reversed(moves)]
+
+
+class PackedPath(object):
+
+    def __init__(self, codes=()):
+        """
+        Packed Path
+
+            Sequence of moves stored with 2 bits per move, four moves per byte.
+            The first move sits in the lowest bits of the first byte.
+
+        --- INSTANCE VARIABLES ---
+        self.data: bytearray: packed move codes
+        self.length: int: number of moves in the path
+        """
+        self.data = bytearray((len(codes) + 3) // 4)
+        self.length = len(codes)
+        for i, code in enumerate(codes):
+            self.data[i >> 2] |= code << ((i & 3) << 1)
+
+    @classmethod
+    def from_moves(cls, moves):
+        """
+        :param moves: [char, ...]: moves in order (e.g.,['N', 'E', 'E'])
+        :return: PackedPath: packed version of the moves
+        """
+        return cls([MOVE_CODES[move] for move in moves])
+
+    @classmethod
+    def from_bytes(cls, data, length):
+        """
+        :param data: (bytes) packed move codes, as returned by to_bytes()
+        :param length: (int) number of moves stored in data
+        :return: PackedPath: path backed by a copy of data
+        """
+        if len(data) < (length + 3) // 4:
+            raise ValueError("packed path of %d moves needs %d bytes, got %d"
+                             % (length, (length + 3) // 4, len(data)))
+        path = cls()
+        path.data = bytearray(data[:(length + 3) // 4])
+        path.length = length
+        return path
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return isinstance(other, PackedPath) and self.length == other.length and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def code(self, i):
+        """
+        :param i: (int) index of the move
+        :return: (int) code of the i-th move
+        """
+        return (self.data[i >> 2] >> ((i & 3) << 1)) & 3
+
+    def codes(self):
+        """
+        :return: [int, ...]: move codes in order
+        """
+        return [self.code(i) for i in range(0, self.length)]
+
+    def moves(self):
+        """
+        :return: [char, ...]: moves in order (e.g.,['N', 'E', 'E'])
+        """
+        return [MOVES[code] for code in self.codes()]
+
+    def to_bytes(self):
+        """
+        :return: (bytes) packed move codes, use with the path length to restore the path
+        """
+        return bytes(self.data)
+
+    def __str__(self):
+        return ''.join(self.moves())
@@ -0,0 +1,437 @@
+#!usr/bin/python
+"""
+File:           reachability.py
+
+Author:         Alexander Adranly
+
+Description:    Everything reachable from a start within the energy budget, as a cost array
+
+    The cost of the cheapest path from the start to every position is computed at once, with the move
+    the agent arrives by, so the path to any position is read back in O(path length) (see
+    ReachabilityField.moves). Each move costs at least 1, so only the window of positions at most
+    energy_budget moves away is computed, and costs over the budget are dropped.
+
+    With numpy the field is relaxed over the whole window with array operations, never per position:
+
+    'delta' (default) is a delta-stepping wavefront. The positions whose cost dropped wait in a queue;
+    each pass takes the ones within `delta` of the cheapest, relaxes their moves in the four directions
+    at once (numpy.minimum.at keeps the cheapest of several moves into the same position) and queues
+    the positions that got cheaper. A position can be relaxed again when its cost drops later, so the
+    costs are exact whatever delta is; a small delta relaxes in nearly Dijkstra order, a large one
+    relaxes more positions per pass and more of them twice.
+
+    'sweep' relaxes every row (or column) along one direction of travel at once:
+
+        cost[i] = min(cost[i], cost[i - 1] + step[i - 1])
+
+    With prefix[i] the cost of the moves from the first position of the line to position i, the
+    recurrence unrolls to cost[i] = prefix[i] + min over j <= i of (cost[j] - prefix[j]), a cumulative
+    minimum. Sweeps run N, E, S, W in turn until a round changes nothing: each round settles paths with
+    one more change of direction, so it is fastest on flat, open terrain and slow on noise and mazes.
+    A sweep only relaxes again the lines that a change crossed since its last run.
+
+    Without numpy (or with method='dijkstra') a Dijkstra search bounded by the budget computes the same
+    field.
+
+    Costs are -1 for positions that are not reachable within budget. Arrivals hold the move code (see
+    path.MOVES) the cheapest path arrives by, -1 for the start and unreachable positions. Costs are
+    optimal; among paths of equal cost the one read back may differ from the one astar.py picks.
+
+    Usage:
+        python main.py reachability.py map --energy 300 [--summary-only] [--search-option method=sweep]
+        python reachability.py map --energy 300 --start-x 0 --start-y 0 [--method delta|sweep|dijkstra]
+"""
+import argparse
+import heapq
+
+from environment import Environment
+from path import MOVE_E, MOVE_N, MOVE_S, MOVE_W, MOVES
+from state import State
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# cost of the positions not reached yet, far above any budget and safe to add prefix costs to
+UNREACHED = 1 << 60
+
+# (move code, axis of the window, sweep against the axis), in the order the sweeps run
+SWEEPS = ((MOVE_N, 0, False), (MOVE_E, 1, False), (MOVE_S, 0, True), (MOVE_W, 1, True))
+
+METHODS = ('delta', 'sweep', 'dijkstra')
+# width of the cost buckets of the 'delta' method
+DELTA = 16
+
+# (dx, dy) of each move code
+MOVE_OFFSETS = {MOVE_N: (0, 1), MOVE_E: (1, 0), MOVE_S: (0, -1), MOVE_W: (-1, 0)}
+
+
+class ReachabilityField(object):
+
+    def __init__(self, environment, start, start_cost=0, method='delta', delta=DELTA):
+        """
+        REACHABILITY FIELD
+
+            Cheapest cost from a start to every position within the energy budget, see the module description
+
+        --- PARAMETERS ---
+        start: (x_pos, y_pos): start position
+        start_cost: int: energy already spent at the start
+        method: str: 'delta' or 'sweep' relaxation with numpy, 'dijkstra' search. 'dijkstra' is used whatever
+            the method when numpy is not installed.
+        delta: int: width of the cost buckets of the 'delta' method
+
+        --- INSTANCE VARIABLES ---
+        self.x_min, self.y_min: int: map position of the first column and row of the window
+        self.width, self.height: int: size of the window
+        self.costs: numpy int64 array [row, column] of the window (a list of rows for 'dijkstra'): cost of each
+            position, -1 when it is not reachable within budget
+        self.arrivals: numpy int8 array (a list of rows for 'dijkstra'): move the cheapest path arrives by,
+            -1 for the start and unreachable positions
+        self.iterations: int: passes of 'delta' or rounds of four sweeps of 'sweep' run until the costs stopped
+            changing, 0 for 'dijkstra'
+        """
+        if method not in METHODS:
+            raise ValueError("unknown method '" + str(method) + "', expected one of " + str(METHODS))
+        if delta < 1:
+            raise ValueError("delta must be at least 1")
+        self.start = tuple(start)
+        self.budget = environment.energy_budget
+        self.iterations = 0
+        radius = max(self.budget - start_cost, -1)
+        x_start, y_start = self.start
+        self.x_min, self.y_min = max(x_start - radius, 0), max(y_start - radius, 0)
+        x_max = min(x_start + radius, environment.width - 1)
+        y_max = min(y_start + radius, environment.height - 1)
+        self.width, self.height = max(x_max - self.x_min + 1, 0), max(y_max - self.y_min + 1, 0)
+        self.method = 'dijkstra' if numpy is None else method
+        self.delta = delta
+
+        rows = window_rows(environment, self.x_min, self.y_min, self.width, self.height)
+        if self.method == 'dijkstra':
+            self.costs, self.arrivals = self.dijkstra_field(rows, start_cost)
+        elif self.width == 0 or self.height == 0:
+            self.costs = numpy.full((self.height, self.width), -1, dtype=numpy.int64)
+            self.arrivals = numpy.full((self.height, self.width), -1, dtype=numpy.int8)
+        else:
+            elevations = numpy.array(rows, dtype=numpy.int64).reshape(self.height, self.width)
+            if self.method == 'delta':
+                self.costs, self.arrivals = self.delta_field(elevations, start_cost)
+            else:
+                self.costs, self.arrivals = self.sweep_field(elevations, start_cost)
+            self.costs[self.costs == UNREACHED] = -1
+
+    def delta_field(self, elevations, start_cost):
+        """
+        --- HELPER METHOD ---
+        Relax the costs of the window by delta-stepping until no cost drops
+
+        The window is framed by a border of positions no move reaches, and flattened, so the
+        neighbor of a position in a direction is at a fixed offset
+        """
+        line = self.width + 2
+        framed = numpy.zeros((self.height + 2, line), dtype=numpy.int64)
+        framed[1:-1, 1:-1] = elevations
+        inside = numpy.zeros(framed.shape, dtype=bool)
+        inside[1:-1, 1:-1] = True
+        framed, inside = framed.ravel(), inside.ravel()
+
+        # cost of the move from each position in each direction, UNREACHED when it leaves the window
+        offsets = ((MOVE_N, line), (MOVE_E, 1), (MOVE_S, -line), (MOVE_W, -1))
+        steps = []
+        for code, offset in offsets:
+            step = numpy.full(framed.size, UNREACHED, dtype=numpy.int64)
+            sources = numpy.flatnonzero(inside & numpy.roll(inside, -offset))
+            step[sources] = move_costs(framed[sources], framed[sources + offset])
+            steps.append(step)
+
+        costs = numpy.full(framed.size, UNREACHED, dtype=numpy.int64)
+        arrivals = numpy.full(framed.size, -1, dtype=numpy.int8)
+        root = (self.start[1] - self.y_min + 1) * line + self.start[0] - self.x_min + 1
+        costs[root] = start_cost
+        queue = numpy.array([root], dtype=numpy.int64)
+
+        while len(queue) != 0:
+            self.iterations += 1
+            queued_costs = costs[queue]
+            bucket = queued_costs < queued_costs.min() + self.delta
+            sources, queue = queue[bucket], queue[~bucket]
+            source_costs = costs[sources]
+
+            dropped = [queue]
+            for (code, offset), step in zip(offsets, steps):
+                targets = sources + offset
+                relaxed = source_costs + step[sources]
+                better = (relaxed < costs[targets]) & (relaxed <= self.budget)
+                if not better.any():
+                    continue
+                targets, relaxed = targets[better], relaxed[better]
+                numpy.minimum.at(costs, targets, relaxed)
+                # of several moves into a position, the cheapest one sets its arrival
+                won = costs[targets] == relaxed
+                arrivals[targets[won]] = code
+                dropped.append(targets[won])
+            if len(dropped) > 1:
+                queue = numpy.unique(numpy.concatenate(dropped))
+
+        shape = (self.height + 2, line)
+        return (costs.reshape(shape)[1:-1, 1:-1].copy(), arrivals.reshape(shape)[1:-1, 1:-1].copy())
+
+    def sweep_field(self, elevations, start_cost):
+        """
+        --- HELPER METHOD ---
+        Relax the costs of the window with directional sweeps until they stop changing
+        """
+        costs = numpy.full((self.height, self.width), UNREACHED, dtype=numpy.int64)
+        arrivals = numpy.full((self.height, self.width), -1, dtype=numpy.int8)
+        costs[self.start[1] - self.y_min, self.start[0] - self.x_min] = start_cost
+
+        # cost of the moves from the first position of each line, per sweep
+        prefixes = []
+        for code, axis, backwards in SWEEPS:
+            line = oriented(elevations, axis, backwards)
+            steps = move_costs(line[:, :-1], line[:, 1:])
+            prefix = numpy.zeros(line.shape, dtype=numpy.int64)
+            numpy.cumsum(steps, axis=1, out=prefix[:, 1:])
+            prefixes.append(prefix)
+
+        # lines each sweep has to relax again: only lines crossed by a change since its last run can improve
+        pending = [numpy.ones(self.width if axis == 0 else self.height, dtype=bool) for code, axis, _ in SWEEPS]
+        while any(lines.any() for lines in pending):
+            self.iterations += 1
+            for index, ((code, axis, backwards), prefix) in enumerate(zip(SWEEPS, prefixes)):
+                lines = numpy.flatnonzero(pending[index])
+                pending[index][:] = False
+                if len(lines) == 0:
+                    continue
+                # a slice of every line is a view, cheaper than gathering them
+                selected = slice(None) if len(lines) == len(pending[index]) else lines
+                view, line_prefix = oriented(costs, axis, backwards), prefix[selected]
+                current = view[selected]
+                relaxed = numpy.minimum.accumulate(current - line_prefix, axis=1)
+                relaxed += line_prefix
+                improved = (relaxed < current) & (relaxed <= self.budget)
+                changed = improved.any(axis=1)
+                if not changed.any():
+                    continue
+                current[improved] = relaxed[improved]
+                view[selected] = current
+                moves = oriented(arrivals, axis, backwards)
+                arrived = moves[selected]
+                arrived[improved] = code
+                moves[selected] = arrived
+
+                # changed lines for the other sweep of this axis, changed positions along them for the others
+                crossed = improved.any(axis=0)
+                if backwards:
+                    crossed = crossed[::-1]
+                for other, (_, other_axis, _) in enumerate(SWEEPS):
+                    if other == index:
+                        continue
+                    if other_axis == axis:
+                        pending[other][lines[changed]] = True
+                    else:
+                        pending[other][crossed] = True
+
+        return costs, arrivals
+
+    def dijkstra_field(self, rows, start_cost):
+        """
+        --- HELPER METHOD ---
+        Same field as delta_field, from a Dijkstra search bounded by the budget
+        """
+        width, height = self.width, self.height
+        if hasattr(rows, 'tolist'):
+            rows = rows.tolist()                                    # python ints from numpy storage
+        costs = [-1] * (width * height)
+        arrivals = [-1] * (width * height)
+        if width > 0 and height > 0:
+            elevation_cost = Environment.elevation_cost
+            settled = bytearray(width * height)
+            root = (self.start[1] - self.y_min) * width + self.start[0] - self.x_min
+            costs[root] = start_cost
+            queue = [(start_cost, root)]
+
+            while queue:
+                cost, index = heapq.heappop(queue)
+                if settled[index]:
+                    continue                                        # stale entry
+                settled[index] = 1
+                column, row = index % width, index // width
+                elevation = rows[row][column]
+
+                for code, neighbor, valid in ((MOVE_N, index + width, row < height - 1),
+                                              (MOVE_E, index + 1, column < width - 1),
+                                              (MOVE_S, index - width, row > 0),
+                                              (MOVE_W, index - 1, column > 0)):
+                    if not valid or settled[neighbor]:
+                        continue
+                    cost_next = cost + elevation_cost(elevation, rows[neighbor // width][neighbor % width])
+                    if cost_next <= self.budget and (costs[neighbor] < 0 or cost_next < costs[neighbor]):
+                        costs[neighbor] = cost_next
+                        arrivals[neighbor] = code
+                        heapq.heappush(queue, (cost_next, neighbor))
+
+        return ([costs[row * width:(row + 1) * width] for row in range(0, height)],
+                [arrivals[row * width:(row + 1) * width] for row in range(0, height)])
+
+    def in_window(self, x_pos, y_pos):
+        """
+        :return: (bool) True if the position is in the window of the field
+        """
+        return 0 <= x_pos - self.x_min < self.width and 0 <= y_pos - self.y_min < self.height
+
+    def cost(self, x_pos, y_pos):
+        """
+        :param x_pos: (int)
+        :param y_pos: (int)
+        :return: (int) cost of the cheapest path to the position, None when it is not reachable within budget
+        """
+        if not self.in_window(x_pos, y_pos):
+            return None
+        cost = int(self.costs[y_pos - self.y_min][x_pos - self.x_min])
+        return None if cost < 0 else cost
+
+    def moves(self, x_pos, y_pos):
+        """
+        Read the cheapest path to a position back from the arrivals, O(path length)
+
+        :param x_pos: (int)
+        :param y_pos: (int)
+        :return: [char, ...]: moves of the cheapest path (e.g. ['N', 'E']), None when it is not reachable
+        """
+        if self.cost(x_pos, y_pos) is None:
+            return None
+        codes = []
+        while (x_pos, y_pos) != self.start:
+            code = int(self.arrivals[y_pos - self.y_min][x_pos - self.x_min])
+            codes.append(code)
+            x_pos, y_pos = x_pos - MOVE_OFFSETS[code][0], y_pos - MOVE_OFFSETS[code][1]
+        return [MOVES[code] for code in reversed(codes)]
+
+    def reachable(self):
+        """
+        :return: [(cost, x_pos, y_pos), ...]: every reachable position, cheapest first, then by row and column
+        """
+        if self.method != 'dijkstra':
+            rows, columns = numpy.nonzero(self.costs >= 0)
+            costs = self.costs[rows, columns]
+            order = numpy.lexsort((columns, rows, costs))
+            return list(zip((costs[order]).tolist(), (columns[order] + self.x_min).tolist(),
+                            (rows[order] + self.y_min).tolist()))
+        ordered = sorted((cost, row, column)
+                         for row, line in enumerate(self.costs) for column, cost in enumerate(line) if cost >= 0)
+        return [(cost, column + self.x_min, row + self.y_min) for cost, row, column in ordered]
+
+
+def window_rows(environment, x_min, y_min, width, height):
+    """
+    Elevations of a window of the map, read a row at a time
+
+    :return: numpy array [row, column] of the window with numpy storage, else [[int, ...], ...]
+    """
+    if environment.storage == 'numpy':
+        return environment.elevations[y_min:y_min + height, x_min:x_min + width]
+    rows = []
+    for y_pos in range(y_min, y_min + height):
+        row = environment.elevations[y_pos]
+        values = row.tolist() if hasattr(row, 'tolist') else row
+        rows.append([int(value) for value in values[x_min:x_min + width]])
+    return rows
+
+
+def oriented(array, axis, backwards):
+    """
+    View of a window in which a sweep runs along the rows, towards increasing indexes
+
+    :param array: numpy array [row, column]
+    :param axis: (int) 0 to sweep along columns (N and S), 1 along rows (E and W)
+    :param backwards: (bool) sweep towards decreasing map coordinates
+    :return: numpy view, writes go to the array
+    """
+    view = array.T if axis == 0 else array
+    return view[:, ::-1] if backwards else view
+
+
+def move_costs(source, destination):
+    """
+    Vectorized Environment.elevation_cost
+
+    :param source: numpy array of elevations the agent leaves
+    :param destination: numpy array of elevations the agent arrives at, same shape
+    :return: numpy array of move costs
+    """
+    rise = destination - source
+    return numpy.where(rise > 0, 1 + rise * rise, 1 - rise)
+
+
+class Search(object):
+
+    def __init__(self, init_state, environment, method='delta', delta=DELTA):
+        """
+        REACHABILITY SEARCH
+
+            Runs main.py queries on a ReachabilityField: the solution is the cheapest path to the goal, and the
+            closed list holds every position reachable within the budget, cheapest first
+
+        --- PARAMETERS ---
+        method: str: see ReachabilityField
+        delta: int: see ReachabilityField
+        """
+        self.environment = environment
+        self.current_state = init_state
+        self.method = method
+        self.delta = delta
+        self.field = None
+
+    def search(self):
+        """
+        :return:
+        solution (State): goal state of the cheapest path, or None when the goal is out of budget
+        frontier ([]): the field has no frontier
+        visited ([State, ...]): every position reachable within budget, cheapest first
+        """
+        environment = self.environment
+        root = self.current_state
+        root.a_star = root.cost_so_far
+        self.field = ReachabilityField(environment, root.position, root.cost_so_far, self.method, self.delta)
+
+        # parents cost less than their children, so they are built first
+        states = {root.position: root}
+        visited = []
+        for cost, x_pos, y_pos in self.field.reachable():
+            position = (x_pos, y_pos)
+            if position not in states:
+                code = int(self.field.arrivals[y_pos - self.field.y_min][x_pos - self.field.x_min])
+                new_state = State(x_pos, y_pos)
+                new_state.parent = states[(x_pos - MOVE_OFFSETS[code][0], y_pos - MOVE_OFFSETS[code][1])]
+                new_state.move = code
+                new_state.cost_so_far = cost
+                new_state.a_star = cost
+                states[position] = new_state
+            visited.append(states[position])
+
+        return states.get((environment.end_x, environment.end_y)), [], visited
+
+
+if __name__ == '__main__':
+    from instrument import timer
+
+    parser = argparse.ArgumentParser(description='Cost of every position reachable within the energy budget')
+    parser.add_argument('map_name', metavar='map-name', type=argparse.FileType('r'), help='Name of map file')
+    parser.add_argument('--energy', type=int, default=100, help='Starting energy level, default is 100')
+    parser.add_argument('--start-x', type=int, default=0, help='Starting X position, default is 0')
+    parser.add_argument('--start-y', type=int, default=0, help='Starting Y position, default is 0')
+    parser.add_argument('--method', choices=METHODS, default='delta', help='Relaxation method, default is delta')
+    parser.add_argument('--delta', type=int, default=DELTA, help='Bucket width of the delta method')
+    args = parser.parse_args()
+
+    env = Environment(args.map_name, args.energy, (-1, -1))
+    started = timer()
+    field = ReachabilityField(env, (args.start_x, args.start_y), method=args.method, delta=args.delta)
+    elapsed = timer() - started
+    print("Window: %dx%d at (%d, %d)" % (field.width, field.height, field.x_min, field.y_min))
+    print("Reachable positions: %d" % len(field.reachable()))
+    print("Method: %s, %d iterations" % (field.method, field.iterations))
+    print("Time: %.3f s" % elapsed)
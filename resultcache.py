@@ -0,0 +1,303 @@
+#!usr/bin/python
+"""
+File:           resultcache.py
+
+Author:         Alexander Adranly
+
+Description:    Cache of search results keyed by (map content hash, start, goal)
+
+    The cheapest path between two positions does not depend on the energy budget: a search that found
+    a path of cost C answers every budget, with that path when the budget is at least C and with no
+    solution otherwise. A search that found nothing within a budget B proves that every path costs
+    more than B, so it answers every budget up to B. Each entry holds either the optimal cost and the
+    path (packed 2 bits per move, see path.PackedPath), or that lower bound.
+
+    Entries are kept in an LRU cache bounded by an estimate of their size in bytes. They can also be
+    appended to a directory, one log file per map content hash, so a restarted process finds them again.
+    A changed map has another content hash, so its old entries are never read; the log of the previous
+    content of a map file is deleted when the first entry of the new content is written.
+
+    Log record (little-endian): i start x, i start y, i goal x, i goal y, q cost (-1 when unknown),
+    q lower bound (-1 when the cost is known), I path length, then the packed path
+"""
+import os
+import struct
+from collections import OrderedDict
+
+from path import PackedPath
+
+RECORD = struct.Struct('<iiiiqqI')
+# bytes counted for an entry besides its packed path: key, tuple and integer objects
+ENTRY_OVERHEAD = 200
+# name of the file of a cache directory mapping map files to the content hash of their log
+INDEX = 'maps.index'
+
+
+class ResultCache(object):
+
+    def __init__(self, max_bytes=64 << 20, directory=None):
+        """
+        RESULT CACHE
+
+            LRU cache of search results keyed by (map content hash, start, goal)
+
+        --- INSTANCE VARIABLES ---
+        self.max_bytes: int: most bytes the entries kept in memory may take, see ENTRY_OVERHEAD
+        self.directory: str: directory the entries are appended to, None to keep them in memory only
+        self.entries: OrderedDict: (digest, start, goal) -> (cost, packed path bytes, path length, lower bound),
+            least recently used first. cost is None when only the lower bound is known.
+        self.size: int: bytes taken by self.entries
+        self.offsets: {str: {(start, goal): int}}: offset of the last record of each key in the log of a
+            content hash, read once per content hash
+        self.counts: {str: int}: hits, misses, stores, evictions and disk_reads
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.size = 0
+        self.offsets = {}
+        self.counts = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'disk_reads': 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, environment, start, goal, budget):
+        """
+        Answer a query from the cache
+
+        :param environment: (Environment) map
+        :param start: (x_pos, y_pos)
+        :param goal: (x_pos, y_pos)
+        :param budget: (int) energy budget of the query
+        :return: None when the cache cannot answer, else (cost, PackedPath): the solution, or (None, None)
+            when there is no solution within the budget
+        """
+        key = (environment.content_hash(), tuple(start), tuple(goal))
+        entry = self.get(key)
+        if entry is not None:
+            cost, data, length, bound = entry
+            if cost is not None:
+                self.counts['hits'] += 1
+                if cost <= budget:
+                    return cost, PackedPath.from_bytes(data, length)
+                return None, None
+            if budget <= bound:
+                self.counts['hits'] += 1
+                return None, None
+        self.counts['misses'] += 1
+        return None
+
+    def store(self, environment, start, goal, budget, solution):
+        """
+        Record the result of an optimal search
+
+        :param environment: (Environment) map
+        :param start: (x_pos, y_pos)
+        :param goal: (x_pos, y_pos)
+        :param budget: (int) energy budget of the search
+        :param solution: (State) goal state of the optimal solution, None when there was none within the budget
+        :return: None
+        """
+        key = (environment.content_hash(), tuple(start), tuple(goal))
+        if solution is not None:
+            path = solution.packed_moves()
+            entry = (solution.cost_so_far, path.to_bytes(), len(path), None)
+        else:
+            known = self.get(key)
+            if known is not None and (known[0] is not None or known[3] >= budget):
+                return                                                  # already known as well
+            entry = (None, b'', 0, budget)
+        self.counts['stores'] += 1
+        self.put(key, entry)
+        self.append(environment, key, entry)
+
+    def get(self, key):
+        """
+        --- HELPER METHOD ---
+        Entry of a key from memory, or from the log of its content hash
+        """
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.entries[key] = entry                                   # most recently used goes last
+            return entry
+        entry = self.read(key)
+        if entry is not None:
+            self.put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """
+        --- HELPER METHOD ---
+        Keep an entry in memory, evicting the least recently used ones over max_bytes
+        """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= entry_size(old)
+        self.entries[key] = entry
+        self.size += entry_size(entry)
+        while self.size > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= entry_size(evicted)
+            self.counts['evictions'] += 1
+
+    def clear(self):
+        """
+        Drop the entries kept in memory, persisted entries are kept
+
+        :return: None
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """
+        :return: {str: int}: counters (see self.counts), entries and bytes kept in memory
+        """
+        return dict(self.counts, entries=len(self.entries), bytes=self.size)
+
+    def log_path(self, digest):
+        """
+        :param digest: (str) map content hash
+        :return: (str) log of the entries of the content hash, None without a directory
+        """
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, digest + '.results')
+
+    def read(self, key):
+        """
+        --- HELPER METHOD ---
+        Last record of a key in the log of its content hash
+        """
+        digest, start, goal = key
+        offset = self.log_offsets(digest).get((start, goal))
+        if offset is None:
+            return None
+        try:
+            with open(self.log_path(digest), 'rb') as log:
+                log.seek(offset)
+                record = read_record(log)
+        except (IOError, OSError):
+            record = None                                               # deleted by another process
+        if record is None:
+            del self.offsets[digest]
+            return None
+        self.counts['disk_reads'] += 1
+        return record[1]
+
+    def log_offsets(self, digest):
+        """
+        --- HELPER METHOD ---
+        Offsets of the records of a log, read through once
+        """
+        if digest not in self.offsets:
+            offsets = {}
+            path = self.log_path(digest)
+            if path is not None and os.path.exists(path):
+                with open(path, 'rb') as log:
+                    while True:
+                        offset = log.tell()
+                        record = read_record(log)
+                        if record is None:
+                            break
+                        offsets[record[0]] = offset
+            self.offsets[digest] = offsets
+        return self.offsets[digest]
+
+    def append(self, environment, key, entry):
+        """
+        --- HELPER METHOD ---
+        Append an entry to the log of its content hash, in a single write
+        """
+        digest, start, goal = key
+        path = self.log_path(digest)
+        if path is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        offsets = self.log_offsets(digest)
+        if not offsets:
+            self.forget_previous(environment, digest)
+
+        cost, data, length, bound = entry
+        record = RECORD.pack(start[0], start[1], goal[0], goal[1], -1 if cost is None else cost,
+                             -1 if bound is None else bound, length) + data
+        with open(path, 'ab') as log:
+            log.seek(0, os.SEEK_END)
+            offsets[(start, goal)] = log.tell()
+            log.write(record)
+
+    def forget_previous(self, environment, digest):
+        """
+        --- HELPER METHOD ---
+        Record the content hash of the map file of an environment in the index, and delete the log of its
+        previous content
+        """
+        if environment.map_path is None:
+            return
+        map_path = os.path.abspath(environment.map_path)
+        index_path = os.path.join(self.directory, INDEX)
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                for line in index_file:
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) == 2:
+                        index[fields[0]] = fields[1]
+
+        previous = index.get(map_path)
+        if previous == digest:
+            return
+        if previous is not None and previous not in [other for name, other in index.items() if name != map_path]:
+            # no other map file has that content
+            old_log = self.log_path(previous)
+            if os.path.exists(old_log):
+                os.remove(old_log)
+            self.offsets.pop(previous, None)
+        index[map_path] = digest
+        temporary = index_path + '.tmp'
+        with open(temporary, 'w') as index_file:
+            for name in sorted(index):
+                index_file.write(name + '\t' + index[name] + '\n')
+        os.rename(temporary, index_path)
+
+
+def entry_size(entry):
+    """
+    :param entry: (cost, packed path bytes, path length, lower bound)
+    :return: (int) bytes counted for the entry
+    """
+    return ENTRY_OVERHEAD + len(entry[1])
+
+
+def read_record(log):
+    """
+    :param log: (file) log opened in binary mode
+    :return: ((start, goal), entry) of the next record, None at the end of the log or on a partial record
+    """
+    header = log.read(RECORD.size)
+    if len(header) < RECORD.size:
+        return None
+    x_start, y_start, x_goal, y_goal, cost, bound, length = RECORD.unpack(header)
+    data = log.read((length + 3) // 4)
+    if len(data) < (length + 3) // 4:
+        return None
+    entry = (None if cost < 0 else cost, bytes(data), length, None if bound < 0 else bound)
+    return ((x_start, y_start), (x_goal, y_goal)), entry
+
+
+# cache used by astar.Search(cache=True)
+cache = ResultCache()
+
+
+def configure(max_bytes=64 << 20, directory=None):
+    """
+    Replace the shared cache
+
+    :param max_bytes: (int) most bytes the entries kept in memory may take
+    :param directory: (str) directory the entries are appended to, None to keep them in memory only
+    :return: ResultCache: the new shared cache
+    """
+    global cache
+    cache = ResultCache(max_bytes, directory)
+    return cache
@@ -0,0 +1,740 @@
+#!/usr/bin/python3
+"""
+File:           service.py
+
+Author:         Alexander Adranly
+
+Description:    Resident path planning service: maps are loaded once, queries are answered over a socket
+
+    python 3.7+ only (asyncio). The maps named on the command line are loaded before the worker processes
+    are forked: text maps are copied into shared memory (a read-only numpy view, see share_environment),
+    binary maps are memory-mapped, tiled maps are reopened by each worker. Each worker keeps the heuristic
+    tables of its recent goals (see Environment.enable_heuristic_cache).
+
+    Protocol: one JSON object per line in each direction, over a Unix socket or TCP. Requests on a
+    connection are answered as soon as they are done, not in order: match them with "id".
+
+        query:    {"id": any, "map": name, "start": [x, y], "goal": [x, y], "energy": int,
+                   "algorithm": "astar" | "bbfs" (default astar), "options": {Search keyword arguments},
+                   "deadline": seconds (default --deadline, 0 for none)}
+        answer:   {"id", "status", "cost", "moves", "considered", "search_seconds", "seconds"}
+                  status is one of STATUSES; cost and moves are null without a solution, an "error"
+                  message comes with status "error"
+        cancel:   {"op": "cancel", "id": any} -> {"op": "cancel", "id", "cancelled": bool},
+                  the query itself is then answered with status "cancelled"
+        stats:    {"op": "stats"} -> {"op": "stats", "stats": {...}}: answers by status, throughput and
+                  latency histograms, see ServiceStats
+        maps:     {"op": "maps"} -> {"op": "maps", "maps": {name: {"width", "height", "storage"}}}
+
+    A search past its deadline or cancelled is stopped by the worker running it at its next successor
+    generation (see interruptible). Queries waiting for a worker are answered with status "busy" when
+    --slots queries are already pending.
+
+    Usage:
+        python3 service.py serve --map hills=hills.map --map maze.amap --unix /tmp/astar.sock --workers 8
+        echo '{"id": 1, "map": "hills", "start": [0, 0], "goal": [99, 99], "energy": 5000}' | \\
+            python3 service.py query --unix /tmp/astar.sock
+        python3 service.py load --unix /tmp/astar.sock --map hills --requests 2000 --concurrency 32
+        python3 service.py stats --unix /tmp/astar.sock
+"""
+import argparse
+import asyncio
+import bisect
+import concurrent.futures
+import copy
+import json
+import multiprocessing
+import os
+import random
+import signal
+import sys
+import time
+from collections import OrderedDict
+
+import parallel
+import tiledmap
+from environment import Environment
+from instrument import timer
+from mapformat import MappedRows
+from state import State
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SEARCH_MODULES = ('astar', 'bbfs')
+STATUSES = ('ok', 'no_solution', 'timeout', 'cancelled', 'busy', 'error')
+
+# upper bounds of the latency histogram buckets, in seconds, the last bucket holds everything above
+LATENCY_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+# successor generations between two checks of the deadline and the cancel flag of a search
+CHECK_EVERY = 64
+# heuristic tables kept by each worker and map
+CACHE_SIZE = 16
+
+# maps and cancel flags, set before the workers are forked so that they inherit them
+_maps = OrderedDict()
+_flags = None
+# maps already prepared by this worker (see worker_environment)
+_ready = set()
+
+
+class SearchInterrupted(Exception):
+    """
+    Raised inside a search that ran past its deadline or was cancelled
+    """
+
+
+def parse_map_spec(spec):
+    """
+    :param spec: (str) NAME=PATH, or PATH: the name is then the file name without its extension
+    :return: (name, path)
+    """
+    if '=' in spec:
+        name, path = spec.split('=', 1)
+    else:
+        path = spec
+        name = os.path.splitext(os.path.basename(spec))[0]
+    if not name:
+        raise ValueError("empty map name in '" + spec + "'")
+    return name, path
+
+
+def share_environment(environment):
+    """
+    Move the elevations of a map parsed in memory into shared memory, as a read-only numpy array, so the
+    forked workers read one copy. Memory-mapped and tiled maps are shared through their file already.
+
+    :param environment: (Environment) loaded map
+    :return: (bool) True if the elevations were moved
+    """
+    elevations = environment.elevations
+    if numpy is None or environment.storage == 'tiled' or isinstance(elevations, MappedRows):
+        return False
+    if environment.storage == 'numpy' and not elevations.flags.writeable:
+        return False                                                    # memory-mapped binary map
+    grid = parallel.shared_grid(environment)
+    view = numpy.ctypeslib.as_array(grid).reshape(environment.height, environment.width)
+    view.flags.writeable = False
+    environment.elevations = view
+    environment.storage = 'numpy'
+    return True
+
+
+def load_maps(specs):
+    """
+    :param specs: [str, ...]: map specifications, see parse_map_spec
+    :return: OrderedDict {name: Environment}: the maps, shared (see share_environment)
+    """
+    maps = OrderedDict()
+    for spec in specs:
+        name, path = parse_map_spec(spec)
+        if name in maps:
+            raise ValueError("map name '" + name + "' is used twice")
+        with open(path, 'r') as mapfile:
+            environment = Environment(mapfile, 0, (0, 0))
+        share_environment(environment)
+        maps[name] = environment
+    return maps
+
+
+def interruptible(environment, deadline, flags, slot):
+    """
+    Copy of an environment whose successor generation raises SearchInterrupted once the deadline is
+    passed or the cancel flag of the query is set, checked every CHECK_EVERY calls
+
+    :param environment: (Environment) environment of the search
+    :param deadline: (float) time.time() after which the search stops, None for no deadline
+    :param flags: (RawArray) cancel flags of the queries, None when queries cannot be cancelled
+    :param slot: (int) index of the flag of this query
+    :return: Environment: guarded copy, sharing the elevations and caches of the environment
+    """
+    guarded = copy.copy(environment)
+    get_available_moves, successors = environment.get_available_moves, environment.successors
+    calls = [0]
+
+    def check():
+        calls[0] += 1
+        if calls[0] % CHECK_EVERY == 0:
+            if flags is not None and flags[slot]:
+                raise SearchInterrupted('cancelled')
+            if deadline is not None and time.time() > deadline:
+                raise SearchInterrupted('timeout')
+
+    def guarded_moves(state):
+        check()
+        return get_available_moves(state)
+
+    def guarded_successors(x_pos, y_pos):
+        check()
+        return successors(x_pos, y_pos)
+
+    guarded.get_available_moves = guarded_moves
+    guarded.successors = guarded_successors
+    return guarded
+
+
+def worker_environment(name):
+    """
+    Map of a worker, prepared on its first query: tiled maps get their own file handle and tile cache,
+    and the heuristic tables of recent goals are kept
+
+    :param name: (str) map name
+    :return: Environment
+    """
+    environment = _maps[name]
+    if name not in _ready:
+        if environment.storage == 'tiled':
+            environment.width, environment.height, environment.elevations = \
+                tiledmap.open_tiled_map(environment.map_path)
+        environment.enable_heuristic_cache(CACHE_SIZE)
+        _ready.add(name)
+    return environment
+
+
+def run_query(name, algorithm, start, goal, energy, options, deadline, slot):
+    """
+    Worker task: run one query
+
+    :param name: (str) map name
+    :param algorithm: (str) one of SEARCH_MODULES
+    :param start: (x_pos, y_pos)
+    :param goal: (x_pos, y_pos)
+    :param energy: (int) energy budget
+    :param options: {str: value}: extra keyword arguments for the Search class
+    :param deadline: (float) time.time() after which the search stops, None for no deadline
+    :param slot: (int) cancel flag of the query
+    :return: {str: value}: status, cost, moves, considered and search_seconds
+    """
+    started = timer()
+    answer = {'status': 'ok', 'cost': None, 'moves': None, 'considered': None}
+    try:
+        if _flags is not None and _flags[slot]:
+            raise SearchInterrupted('cancelled')
+        if deadline is not None and time.time() > deadline:
+            raise SearchInterrupted('timeout')                          # expired while waiting for a worker
+        environment = interruptible(worker_environment(name).derive(energy, goal), deadline, _flags, slot)
+        search_pkg = __import__(algorithm)
+        search = search_pkg.Search(State(start[0], start[1]), environment, **options)
+        solution, frontier, visited = search.search()
+        answer['considered'] = len(visited)
+        if solution is None:
+            answer['status'] = 'no_solution'
+        else:
+            answer['cost'] = solution.cost_so_far
+            answer['moves'] = ''.join(solution.moves_so_far)
+    except SearchInterrupted as reason:
+        answer['status'] = str(reason)
+    except Exception as error:
+        answer['status'] = 'error'
+        answer['error'] = str(error)
+    answer['search_seconds'] = timer() - started
+    return answer
+
+
+def parse_query(request, maps):
+    """
+    Check a query and fill in its defaults
+
+    :param request: {str: value}: decoded query line
+    :param maps: {str: Environment}: loaded maps
+    :return: (name, algorithm, start, goal, energy, options, deadline): deadline in seconds or None
+    """
+    name = request.get('map')
+    if name not in maps:
+        raise ValueError("unknown map '" + str(name) + "', expected one of " + str(list(maps)))
+    environment = maps[name]
+    algorithm = request.get('algorithm', 'astar')
+    if algorithm not in SEARCH_MODULES:
+        raise ValueError("unknown algorithm '" + str(algorithm) + "', expected one of " + str(SEARCH_MODULES))
+
+    positions = []
+    for key in ('start', 'goal'):
+        position = request.get(key)
+        if not isinstance(position, list) or len(position) != 2 or \
+                not all(isinstance(value, int) for value in position):
+            raise ValueError("'" + key + "' must be [x, y]")
+        if not environment.is_valid_position(position[0], position[1]):
+            raise ValueError("'" + key + "' " + str(position) + " is outside of map '" + name + "'")
+        positions.append(tuple(position))
+
+    energy = request.get('energy')
+    if not isinstance(energy, int):
+        raise ValueError("'energy' must be an integer")
+    options = request.get('options', {})
+    if not isinstance(options, dict):
+        raise ValueError("'options' must be an object")
+    deadline = request.get('deadline')
+    if deadline is not None and (not isinstance(deadline, (int, float)) or deadline < 0):
+        raise ValueError("'deadline' must be a number of seconds")
+    return name, algorithm, positions[0], positions[1], energy, options, deadline
+
+
+class Histogram(object):
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """
+        Histogram
+
+        --- INSTANCE VARIABLES ---
+        self.bounds: (float, ...): upper bounds of the buckets, in increasing order
+        self.counts: [int, ...]: values in each bucket, the last one counts the values above every bound
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.largest = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.largest = max(self.largest, value)
+
+    def percentile(self, fraction):
+        """
+        :param fraction: (float) between 0 and 1
+        :return: (float) upper bound of the bucket holding the percentile (largest value for the last
+            bucket), None when the histogram is empty
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.largest
+        return self.largest
+
+    def as_dict(self):
+        """
+        :return: {str: value}: bounds, counts, count, mean, max and the p50, p90 and p99 estimates
+        """
+        return {'bounds': list(self.bounds), 'counts': list(self.counts), 'count': self.count,
+                'mean': self.total / self.count if self.count else None, 'max': self.largest,
+                'p50': self.percentile(0.5), 'p90': self.percentile(0.9), 'p99': self.percentile(0.99)}
+
+
+class Throughput(object):
+
+    def __init__(self, window=60):
+        """
+        Throughput
+
+            Answers per second over the last seconds, counted in one-second buckets
+
+        --- INSTANCE VARIABLES ---
+        self.buckets: {int: int}: answers by second (int(time.time())) of the last window seconds
+        """
+        self.window = window
+        self.buckets = {}
+
+    def add(self, now=None):
+        second = int(time.time() if now is None else now)
+        self.buckets[second] = self.buckets.get(second, 0) + 1
+        if len(self.buckets) > self.window:
+            for old in [key for key in self.buckets if key <= second - self.window]:
+                del self.buckets[old]
+
+    def rate(self, seconds, now=None):
+        """
+        :param seconds: (int) length of the period, at most window
+        :return: (float) answers per second over the last complete seconds of the period
+        """
+        current = int(time.time() if now is None else now)
+        return sum(self.buckets.get(second, 0) for second in range(current - seconds, current)) / float(seconds)
+
+    def as_dict(self):
+        return {'last_1s': self.rate(1), 'last_10s': self.rate(10), 'last_60s': self.rate(min(60, self.window))}
+
+
+class ServiceStats(object):
+
+    def __init__(self):
+        """
+        SERVICE STATISTICS
+
+        --- INSTANCE VARIABLES ---
+        self.statuses: {str: int}: answers by status
+        self.latency: Histogram: seconds between reading a query and writing its answer
+        self.search: Histogram: seconds a worker spent on a query
+        self.throughput: Throughput: answers per second
+        """
+        self.started = time.time()
+        self.statuses = dict((status, 0) for status in STATUSES)
+        self.latency = Histogram()
+        self.search = Histogram()
+        self.throughput = Throughput()
+
+    def record(self, answer, latency):
+        """
+        :param answer: {str: value}: answer of a query
+        :param latency: (float) seconds the query took
+        :return: None
+        """
+        self.statuses[answer['status']] += 1
+        self.latency.add(latency)
+        if answer.get('search_seconds') is not None:
+            self.search.add(answer['search_seconds'])
+        self.throughput.add()
+
+    def as_dict(self):
+        return {'uptime': time.time() - self.started, 'statuses': dict(self.statuses),
+                'throughput': self.throughput.as_dict(), 'latency': self.latency.as_dict(),
+                'search': self.search.as_dict()}
+
+
+class Service(object):
+
+    def __init__(self, maps, workers=None, slots=1024, deadline=30.0):
+        """
+        PATH PLANNING SERVICE
+
+            asyncio front end of a pool of forked worker processes, see the module description
+
+        --- PARAMETERS ---
+        maps: OrderedDict {str: Environment}: loaded maps, see load_maps
+        workers: int: number of worker processes, defaults to the number of CPUs
+        slots: int: most queries pending at once, the others are answered 'busy'
+        deadline: float: default deadline of a query in seconds, 0 for none
+
+        --- INSTANCE VARIABLES ---
+        self.flags: RawArray: cancel flag of each slot, read by the workers
+        self.free: [int, ...]: slots not used by a pending query
+        self.pool: ProcessPoolExecutor: workers, forked after the maps were loaded
+        """
+        global _maps, _flags
+        context = parallel.fork_context()
+        self.maps = maps
+        self.deadline = deadline
+        self.flags = context.RawArray('b', slots)
+        self.free = list(range(slots - 1, -1, -1))
+        self.stats = ServiceStats()
+        _maps, _flags = maps, self.flags
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers or multiprocessing.cpu_count(),
+                                                           mp_context=context)
+
+    async def answer(self, request):
+        """
+        Run a query on the pool
+
+        :param request: {str: value}: decoded query line
+        :return: {str: value}: answer, without the id
+        """
+        started = timer()
+        loop = asyncio.get_running_loop()
+        try:
+            name, algorithm, start, goal, energy, options, deadline = parse_query(request, self.maps)
+        except ValueError as error:
+            return self.finish({'status': 'error', 'error': str(error)}, started)
+        if not self.free:
+            return self.finish({'status': 'busy'}, started)
+
+        if deadline is None:
+            deadline = self.deadline
+        slot = self.free.pop()
+        self.flags[slot] = 0
+        future = self.pool.submit(run_query, name, algorithm, start, goal, energy, options,
+                                  time.time() + deadline if deadline else None, slot)
+        # the slot is reused once the worker is done with it, even after a timeout or a cancel
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self.free.append, slot))
+        try:
+            answer = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), deadline or None)
+        except asyncio.TimeoutError:
+            self.flags[slot] = 1
+            future.cancel()
+            answer = {'status': 'timeout'}
+        except asyncio.CancelledError:
+            self.flags[slot] = 1
+            future.cancel()
+            answer = {'status': 'cancelled'}
+        return self.finish(answer, started)
+
+    def finish(self, answer, started):
+        """
+        --- HELPER METHOD ---
+        """
+        answer.setdefault('cost', None)
+        answer.setdefault('moves', None)
+        answer['seconds'] = timer() - started
+        self.stats.record(answer, answer['seconds'])
+        return answer
+
+    async def handle_connection(self, reader, writer):
+        """
+        Read the requests of a connection until it is closed, each query runs in its own task
+
+        :return: None
+        """
+        pending = {}
+        lock = asyncio.Lock()
+
+        async def send(message):
+            async with lock:
+                writer.write((json.dumps(message, sort_keys=True) + '\n').encode('utf-8'))
+                await writer.drain()
+
+        async def respond(request):
+            answer = await self.answer(request)
+            answer['id'] = request.get('id')
+            pending.pop(request.get('id'), None)
+            try:
+                await send(answer)
+            except ConnectionError:
+                pass                                                    # the client went away
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    if not isinstance(request, dict):
+                        raise ValueError("a request must be a JSON object")
+                except ValueError as error:
+                    await send({'id': None, 'status': 'error', 'error': str(error), 'cost': None, 'moves': None})
+                    continue
+
+                operation = request.get('op', 'query')
+                if operation == 'query':
+                    pending[request.get('id')] = asyncio.ensure_future(respond(request))
+                elif operation == 'cancel':
+                    task = pending.get(request.get('id'))
+                    if task is not None:
+                        task.cancel()
+                    await send({'op': 'cancel', 'id': request.get('id'), 'cancelled': task is not None})
+                elif operation == 'stats':
+                    await send({'op': 'stats', 'stats': self.stats.as_dict()})
+                elif operation == 'maps':
+                    await send({'op': 'maps', 'maps': dict((name, {'width': env.width, 'height': env.height,
+                                                                   'storage': env.storage})
+                                                           for name, env in self.maps.items())})
+                else:
+                    await send({'op': operation, 'status': 'error', 'error': "unknown op '" + str(operation) + "'"})
+            if pending:
+                await asyncio.wait(list(pending.values()))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in pending.values():
+                task.cancel()
+            writer.close()
+
+    async def serve(self, unix=None, host=None, port=None):
+        """
+        Serve until SIGINT or SIGTERM
+
+        :param unix: (str) path of the Unix socket, or None to listen on TCP
+        :param host: (str) TCP address
+        :param port: (int) TCP port
+        :return: None
+        """
+        if unix is not None:
+            if os.path.exists(unix):
+                os.unlink(unix)
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        sys.stderr.write("serving " + ', '.join(self.maps) + " on " +
+                         (unix if unix is not None else '%s:%d' % (host, port)) + "\n")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if unix is not None and os.path.exists(unix):
+                os.unlink(unix)
+
+    def close(self):
+        for slot in range(0, len(self.flags)):
+            self.flags[slot] = 1                                        # stop the searches still running
+        self.pool.shutdown(wait=True)
+
+
+def parse_address(args):
+    """
+    :param args: parsed arguments with unix and tcp
+    :return: (unix path, host, port)
+    """
+    if args.unix:
+        return args.unix, None, None
+    host, _, port = args.tcp.rpartition(':')
+    return None, host or '127.0.0.1', int(port)
+
+
+async def connect(address):
+    """
+    :param address: (unix path, host, port), see parse_address
+    :return: (StreamReader, StreamWriter)
+    """
+    unix, host, port = address
+    if unix is not None:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def call(reader, writer, message):
+    """
+    Send one request and read one line
+
+    :return: {str: value}: decoded answer
+    """
+    writer.write((json.dumps(message) + '\n').encode('utf-8'))
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("the service closed the connection")
+    return json.loads(line.decode('utf-8'))
+
+
+async def run_client(address, lines, out):
+    """
+    Send request lines on one connection and print every answer line, in the order they come back
+
+    :param lines: iterable of JSON request lines
+    :param out: (file) output
+    :return: None
+    """
+    reader, writer = await connect(address)
+    expected = 0
+    for line in lines:
+        if line.strip():
+            writer.write(line.rstrip('\n').encode('utf-8') + b'\n')
+            expected += 1
+    await writer.drain()
+    for _ in range(0, expected):
+        line = await reader.readline()
+        if not line:
+            break
+        out.write(line.decode('utf-8'))
+    writer.close()
+
+
+async def run_load(address, map_name, requests, concurrency, energy, deadline=None, goals=0, seed=1):
+    """
+    Load generator: random queries on a map from several connections, each with one query at a time
+
+    :param map_name: (str) map to query
+    :param requests: (int) number of queries
+    :param concurrency: (int) number of connections
+    :param energy: (int) energy budget of the queries
+    :param deadline: (float) deadline of the queries, None for the service default
+    :param goals: (int) draw the goals from this many random positions, 0 for a new one per query
+    :param seed: (int) seed of the queries
+    :return: {str: value}: report: requests, seconds, throughput, latency (client side, see Histogram),
+        statuses and the stats of the service
+    """
+    reader, writer = await connect(address)
+    maps = (await call(reader, writer, {'op': 'maps'}))['maps']
+    if map_name not in maps:
+        raise ValueError("unknown map '" + str(map_name) + "', the service has " + str(sorted(maps)))
+    width, height = maps[map_name]['width'], maps[map_name]['height']
+
+    rng = random.Random(seed)
+    goal_set = [(rng.randrange(width), rng.randrange(height)) for _ in range(0, goals)]
+    queries = []
+    for index in range(0, requests):
+        goal = rng.choice(goal_set) if goal_set else (rng.randrange(width), rng.randrange(height))
+        query = {'id': index, 'map': map_name, 'start': [rng.randrange(width), rng.randrange(height)],
+                 'goal': list(goal), 'energy': energy}
+        if deadline is not None:
+            query['deadline'] = deadline
+        queries.append(query)
+    queries.reverse()
+
+    latency = Histogram()
+    statuses = dict((status, 0) for status in STATUSES)
+
+    async def client():
+        client_reader, client_writer = await connect(address)
+        while queries:
+            query = queries.pop()
+            started = timer()
+            answer = await call(client_reader, client_writer, query)
+            latency.add(timer() - started)
+            statuses[answer['status']] = statuses.get(answer['status'], 0) + 1
+        client_writer.close()
+
+    started = timer()
+    await asyncio.gather(*[client() for _ in range(0, concurrency)])
+    seconds = timer() - started
+    stats = (await call(reader, writer, {'op': 'stats'}))['stats']
+    writer.close()
+    return {'requests': requests, 'concurrency': concurrency, 'seconds': seconds,
+            'throughput': requests / seconds if seconds > 0 else None, 'latency': latency.as_dict(),
+            'statuses': statuses, 'service': stats}
+
+
+def add_address_arguments(command):
+    """
+    --- HELPER METHOD ---
+    """
+    group = command.add_mutually_exclusive_group(required=True)
+    group.add_argument('--unix', metavar='PATH', help='Unix socket of the service')
+    group.add_argument('--tcp', metavar='HOST:PORT', help='TCP address of the service')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resident path planning service, its client and a load generator')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve = commands.add_parser('serve', help='Load maps and answer queries until SIGINT or SIGTERM')
+    serve.add_argument('--map', action='append', required=True, metavar='[NAME=]PATH',
+                       help='Map to load (text, binary or tiled), may be given more than once')
+    add_address_arguments(serve)
+    serve.add_argument('--workers', type=int, default=None, help='Worker processes, default is the number of CPUs')
+    serve.add_argument('--slots', type=int, default=1024, help='Most queries pending at once, default is 1024')
+    serve.add_argument('--deadline', type=float, default=30.0,
+                       help='Default deadline of a query in seconds, 0 for none, default is 30')
+
+    query = commands.add_parser('query', help='Send the JSON request lines of stdin and print the answers')
+    add_address_arguments(query)
+
+    stats = commands.add_parser('stats', help='Print the statistics of the service')
+    add_address_arguments(stats)
+
+    load = commands.add_parser('load', help='Send random queries and report throughput and latency')
+    add_address_arguments(load)
+    load.add_argument('--map', required=True, help='Name of the map to query')
+    load.add_argument('--requests', type=int, default=1000, help='Number of queries, default is 1000')
+    load.add_argument('--concurrency', type=int, default=16, help='Number of connections, default is 16')
+    load.add_argument('--energy', type=int, default=10 ** 6, help='Energy budget of the queries')
+    load.add_argument('--deadline', type=float, default=None, help='Deadline of the queries in seconds')
+    load.add_argument('--goals', type=int, default=0,
+                      help='Draw the goals from this many positions, default is a new goal per query')
+    load.add_argument('--seed', type=int, default=1, help='Seed of the queries, default is 1')
+
+    args = parser.parse_args()
+    address = parse_address(args)
+
+    if args.command == 'serve':
+        service = Service(load_maps(args.map), args.workers, args.slots, args.deadline)
+        try:
+            asyncio.run(service.serve(*address))
+        finally:
+            service.close()
+    elif args.command == 'query':
+        asyncio.run(run_client(address, sys.stdin, sys.stdout))
+    elif args.command == 'stats':
+        async def print_stats():
+            reader, writer = await connect(address)
+            sys.stdout.write(json.dumps((await call(reader, writer, {'op': 'stats'}))['stats'],
+                                        sort_keys=True, indent=2) + '\n')
+            writer.close()
+        asyncio.run(print_stats())
+    else:
+        report = asyncio.run(run_load(address, args.map, args.requests, args.concurrency, args.energy,
+                                      args.deadline, args.goals, args.seed))
+        sys.stdout.write(json.dumps(report, sort_keys=True, indent=2) + '\n')
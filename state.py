@@ -7,10 +7,14 @@ Author:         Alexander Adranly
 Description:    Implementation of the state representation of the given environment
 
 """
+from path import MOVES, PackedPath
 
 
 class State(object):
 
+    # no per-instance __dict__, a search creates one State per generated successor
+    __slots__ = ('position', 'parent', 'move', 'prefix_moves', 'cost_so_far', 'a_star')
+
     def __init__(self, x_pos, y_pos):
         """
         State Object
@@ -20,14 +24,23 @@ class State(object):
         --- INSTANCE VARIABLES ---
         self.position: (x_pos, y_pos): tuple holds the x/y coordinate position of the state in the environment
         
-        self.moves_so_far: [char, ...] : all past moves used by the agent to reach this state
+        self.parent: State: state the agent came from, None for the first state of a path
+        
+        self.move: int: code of the move taken from the parent to reach this state (see path.MOVES), None if no parent
+        
+        self.prefix_moves: [char, ...]: moves taken before the first state of the path, usually empty
+        
+            The moves of a state are not copied into each child, the full move list is rebuilt from
+            the parent references when it is asked for (see moves_so_far)
         
         self.cost_so_var: int: total cost required for the agent to reach this state
         
         self.a_star: int: A* value of the state --> heuristic + cost
         """
         self.position = (x_pos, y_pos)
-        self.moves_so_far = []
+        self.parent = None
+        self.move = None
+        self.prefix_moves = []
         self.cost_so_far = 0
         self.a_star = 0
 
@@ -41,3 +54,52 @@ class State(object):
         :return: (str) representation of the state instance as a string
         """
         return "Pos=" + str(self.position) + " Moves=" + str(self.moves_so_far) + " Cost=" + str(self.cost_so_far)
+
+    def move_codes(self):
+        """
+        Walk the parent references back to the first state of the path
+
+        :return: [int, ...]: codes of the moves taken after self.prefix_moves, in order
+        """
+        codes = []
+        node = self
+        while node.parent is not None:
+            codes.append(node.move)
+            node = node.parent
+        codes.reverse()
+        return codes
+
+    @property
+    def moves_so_far(self):
+        """
+        :return: [char, ...]: all past moves used by the agent to reach this state
+        """
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        moves = list(node.prefix_moves)
+        moves.extend([MOVES[code] for code in self.move_codes()])
+        return moves
+
+    @moves_so_far.setter
+    def moves_so_far(self, moves):
+        """
+        Set an explicit move list, detaching the state from its parent
+
+        :param moves: [char, ...]: all past moves used by the agent to reach this state
+        :return: None
+        """
+        self.parent = None
+        self.move = None
+        self.prefix_moves = list(moves)
+
+    def packed_moves(self):
+        """
+        :return: PackedPath: all past moves used by the agent to reach this state, 2 bits per move
+        """
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        if node.prefix_moves:
+            return PackedPath.from_moves(self.moves_so_far)
+        return PackedPath(self.move_codes())
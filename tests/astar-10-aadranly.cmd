@@ -0,0 +1 @@
+--energy 300 --search-option heuristic=alt --landmarks 4
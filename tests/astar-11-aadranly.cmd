@@ -0,0 +1 @@
+--energy 300 --search-option epsilon=3 --search-option epsilon_step=1
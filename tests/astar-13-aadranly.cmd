@@ -0,0 +1 @@
+--energy 300 --tile-cache 2
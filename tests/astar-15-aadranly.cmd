@@ -0,0 +1 @@
+--batch tests/astar-15-aadranly.queries --search-option cache=1
@@ -0,0 +1 @@
+--search-option frontier=bucket --energy 300
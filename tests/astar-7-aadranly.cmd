@@ -0,0 +1 @@
+--search-option nodes=pool
@@ -0,0 +1 @@
+--energy 20 --start-x=7 --start-y=1 --end-x=2 --end-y=4 --search-option heuristic=exact --search-option nodes=pool
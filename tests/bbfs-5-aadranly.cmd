@@ -0,0 +1 @@
+--search-option nodes=pool --energy 300 --start-x 7 --start-y 1 --end-x 2 --end-y 4
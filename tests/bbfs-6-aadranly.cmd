@@ -0,0 +1 @@
+--search-option mode=dijkstra --energy 50 --start-x=7 --start-y=1 --end-x=2 --end-y=4
@@ -0,0 +1 @@
+--search-option mode=astar --energy 300
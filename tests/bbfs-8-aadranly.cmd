@@ -0,0 +1 @@
+--search-option mode=astar --search-option prune=1 --energy 10 --start-x=7 --start-y=1 --end-x=2 --end-y=4
@@ -0,0 +1 @@
+--energy 300
@@ -0,0 +1 @@
+--energy 300 --search-option cluster_size=4 --search-option exact=1
@@ -0,0 +1 @@
+--energy 80 --start-x=7 --start-y=1 --end-x=2 --end-y=4 --search-option cluster_size=3 --search-option entrance_width=2
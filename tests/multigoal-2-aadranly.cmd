@@ -0,0 +1 @@
+--energy 300 --search-option goals=tests/multigoal-1-aadranly.goals --search-option mode=nearest
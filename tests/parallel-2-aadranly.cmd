@@ -0,0 +1 @@
+--energy 300 --minimal-display --search-option processes=3 --search-option batch_size=2
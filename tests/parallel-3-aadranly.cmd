@@ -0,0 +1 @@
+--energy 300 --summary-only --stats-counters --search-option processes=1
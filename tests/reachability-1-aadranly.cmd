@@ -0,0 +1 @@
+--energy 150 --end-x 5 --end-y 3
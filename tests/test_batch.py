@@ -0,0 +1,75 @@
+#!usr/bin/python
+"""
+File:           test_batch.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of batch queries run on a process pool, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import batch                                                                # noqa: E402
+import environment                                                          # noqa: E402
+from state import State                                                     # noqa: E402
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astar-4-jconner.map')
+
+# goals interleaved so that the groups sent to the workers finish out of input order
+QUERY_LINES = [
+    "# start_x start_y end_x end_y energy",
+    "0 0 9 8 300",
+    "3 2 7 7 500",
+    "",
+    "9 8 0 0 300",
+    "0 0 9 8 100",
+    "5 5 5 5 0",
+    "3 2 7 7 8",
+    "0 8 9 0 1000",
+    "9 0 0 8 50",
+    "0 0 9 8 282",
+]
+
+
+class BatchTest(unittest.TestCase):
+
+    def expected(self, query):
+        """
+        :return: (query, moves, cost, states considered) of a single astar.Search
+        """
+        start_x, start_y, end_x, end_y, energy = query
+        solution, frontier, visited = astar.Search(State(start_x, start_y),
+                                                   environment.Environment(MAP, energy, (end_x, end_y))).search()
+        if solution is None:
+            return query, None, None, len(visited)
+        return query, ''.join(solution.moves_so_far), solution.cost_so_far, len(visited)
+
+    def check_batch(self, processes, chunksize, window):
+        queries = list(batch.read_queries(QUERY_LINES))
+        self.assertEqual(len(queries), 9)
+        results = list(batch.run_batch(environment.Environment(MAP, 0, (0, 0)), iter(queries), 'astar',
+                                       processes=processes, chunksize=chunksize, window=window))
+        self.assertEqual([result[0] for result in results], queries)
+        self.assertEqual(results, [self.expected(query) for query in queries])
+        # both solved and unsolved queries are in the batch
+        self.assertTrue(any(result[2] is None for result in results))
+        self.assertTrue(any(result[2] is not None for result in results))
+
+    def test_single_process(self):
+        self.check_batch(1, 64, 4096)
+
+    def test_process_pool(self):
+        self.check_batch(2, 1, 4096)
+
+    def test_process_pool_windows(self):
+        self.check_batch(2, 2, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!usr/bin/python
+"""
+File:           test_bbfs.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the bidirectional breadth first search frontiers, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import bbfs                                                                 # noqa: E402
+import environment                                                          # noqa: E402
+from path import MOVES, opposite_moves                                      # noqa: E402
+from state import State                                                     # noqa: E402
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astar-4-jconner.map')
+
+
+def nested_loop_overlap(front, back):
+    """
+    Reference: the frontier overlap as a nested loop over both frontiers
+
+    :return: [(position, cost, moves), ...]: solutions, cheapest first
+    """
+    overlap = []
+    for start in front:
+        for end in back:
+            if start.position == end.position:
+                overlap.append((start.position, start.cost_so_far + end.cost_so_far,
+                                start.moves_so_far + opposite_moves(end.moves_so_far)))
+    overlap.sort(key=lambda solution: solution[1])
+    return overlap
+
+
+class BreadthFrontierTest(unittest.TestCase):
+
+    def test_fifo(self):
+        frontier = bbfs.BreadthFrontier()
+        for i, position in enumerate([(0, 0), (1, 0), (2, 0)]):
+            frontier.append('item%d' % i, position, 10)
+        self.assertEqual(len(frontier), 3)
+        self.assertEqual(frontier.popleft(), 'item0')
+        self.assertEqual(frontier.items(), ['item1', 'item2'])
+        self.assertIsNone(frontier.get((0, 0)))
+
+    def test_filter(self):
+        frontier = bbfs.BreadthFrontier()
+        frontier.append('old', (1, 1), 10)
+        frontier.append('other', (2, 1), 10)
+
+        # the same or a higher cost is rejected, the older entry stays
+        self.assertTrue(frontier.filter((1, 1), 10))
+        self.assertTrue(frontier.filter((1, 1), 12))
+        self.assertFalse(frontier.filter((3, 1), 1))
+        self.assertEqual(frontier.get((1, 1))[2], 'old')
+
+        # a cheaper state replaces the entry and goes to the back of the queue
+        self.assertFalse(frontier.filter((1, 1), 9))
+        self.assertIsNone(frontier.get((1, 1)))
+        frontier.append('new', (1, 1), 9)
+        self.assertEqual(len(frontier), 2)
+        self.assertEqual(frontier.items(), ['other', 'new'])
+        self.assertEqual([frontier.popleft(), frontier.popleft()], ['other', 'new'])
+        self.assertRaises(IndexError, frontier.popleft)
+
+
+class FrontierOverlapTest(unittest.TestCase):
+
+    def random_frontier(self, rng, size):
+        frontier = []
+        for _ in range(size):
+            state = State(rng.randrange(4), rng.randrange(4))
+            state.cost_so_far = rng.randrange(6)
+            state.moves_so_far = [rng.choice(MOVES) for _ in range(rng.randrange(4))]
+            frontier.append(state)
+        return frontier
+
+    def test_same_as_nested_loop(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            front, back = self.random_frontier(rng, rng.randrange(12)), self.random_frontier(rng, rng.randrange(12))
+            overlap = [(state.position, state.cost_so_far, state.moves_so_far)
+                       for state in environment.Environment.frontier_overlap(front, back)]
+            self.assertEqual(overlap, nested_loop_overlap(front, back))
+
+    def test_inputs_unchanged(self):
+        start, end = State(1, 1), State(1, 1)
+        start.moves_so_far, end.moves_so_far = ['N'], ['W', 'S']
+        solution = environment.Environment.frontier_overlap([start], [end])[0]
+        self.assertEqual(solution.moves_so_far, ['N', 'N', 'E'])
+        self.assertEqual(start.moves_so_far, ['N'])
+        self.assertEqual(end.moves_so_far, ['W', 'S'])
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_nodes(self):
+        # the node pool and State objects meet at the same place
+        for start, goal, energy in (((0, 0), (-1, -1), 300), ((9, 8), (0, 0), 300), ((3, 2), (7, 7), 8)):
+            results = []
+            for nodes in ('state', 'pool'):
+                solution, frontier, visited = bbfs.Search(State(start[0], start[1]),
+                                                          environment.Environment(MAP, energy, goal),
+                                                          nodes=nodes).search()
+                results.append((None if solution is None else (solution.moves_so_far, solution.cost_so_far),
+                                [state.position for state in visited], [state.position for state in frontier]))
+            self.assertEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
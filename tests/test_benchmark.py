@@ -0,0 +1,113 @@
+#!usr/bin/python
+"""
+File:           test_benchmark.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the benchmark terrains and of the regression check, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import benchmark                                                            # noqa: E402
+import environment                                                          # noqa: E402
+from state import State                                                     # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark-baseline.json')
+
+
+class TerrainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_deterministic(self):
+        for terrain, generator in sorted(benchmark.GENERATORS.items()):
+            rows = [generator(23, 17, 5)(y_pos) for y_pos in range(17)]
+            self.assertEqual([generator(23, 17, 5)(y_pos) for y_pos in range(17)], rows)
+            self.assertTrue(all(len(row) == 23 for row in rows))
+        # another seed is another map
+        self.assertNotEqual(benchmark.noise(23, 17, 6)(0), benchmark.noise(23, 17, 5)(0))
+
+    def test_ranges(self):
+        values = dict((terrain, set(value for y_pos in range(30) for value in generator(30, 30, 1)(y_pos)))
+                      for terrain, generator in benchmark.GENERATORS.items())
+        self.assertTrue(values['noise'] <= set(range(10)))
+        self.assertTrue(values['fractal'] <= set(range(41)))
+        self.assertEqual(values['maze'], set([0, benchmark.WALL]))
+        self.assertEqual(values['plains'], set([0]))
+
+    def test_maze_is_solvable(self):
+        # every cell of a binary tree maze is connected: the path never climbs a wall
+        for width, height in ((11, 11), (12, 9)):
+            path = os.path.join(self.directory, 'maze.map')
+            benchmark.write_map('maze', width, height, 3, path)
+            goal = benchmark.goal_of('maze', width, height)
+            solution = astar.Search(State(0, 0), environment.Environment(path, 10 ** 6, goal)).search()[0]
+            self.assertEqual(solution.cost_so_far, len(solution.moves_so_far))
+
+    def test_text_and_tiled(self):
+        text_map = os.path.join(self.directory, 'fractal.map')
+        tiled_map = os.path.join(self.directory, 'fractal.tmap')
+        benchmark.write_map('fractal', 40, 30, 2, text_map)
+        benchmark.write_map('fractal', 40, 30, 2, tiled_map)
+        tiled = environment.Environment(tiled_map, 0, (0, 0))
+        self.assertEqual(tiled.flat_elevations(), environment.Environment(text_map, 0, (0, 0)).flat_elevations())
+        tiled.elevations.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ['fractal.map', 'fractal.tmap'])
+
+    def test_baseline_cases(self):
+        # the expansions and costs of the stored baseline do not depend on the machine
+        baseline = [result for result in benchmark.read_report(BASELINE)['results'] if result['exponent'] == 2]
+        self.assertTrue(baseline)
+        for reference in baseline:
+            case = dict((key, reference[key]) for key in ('terrain', 'exponent', 'seed', 'algorithm', 'options'))
+            case['repeat'] = 1
+            case['path'] = benchmark.map_path(self.directory, case['terrain'], case['exponent'], case['seed'])
+            result = benchmark.run_case(case)
+            self.assertEqual((result['expansions'], result['cost']), (reference['expansions'], reference['cost']),
+                             benchmark.case_key(result))
+
+
+class CompareTest(unittest.TestCase):
+
+    def result(self, **fields):
+        result = {'algorithm': 'astar', 'terrain': 'noise', 'exponent': 4, 'seed': 1, 'options': {},
+                  'expansions': 100, 'cost': 50, 'wall_time': 1.0, 'peak_rss_kb': 1000}
+        result.update(fields)
+        return result
+
+    def test_unchanged(self):
+        self.assertEqual(benchmark.compare([self.result(wall_time=1.2)], [self.result()]), [])
+        # cases missing from the baseline are not compared
+        self.assertEqual(benchmark.compare([self.result(seed=2, cost=1)], [self.result()]), [])
+
+    def test_regressions(self):
+        self.assertEqual(len(benchmark.compare([self.result(expansions=101)], [self.result()])), 1)
+        self.assertEqual(len(benchmark.compare([self.result(cost=49)], [self.result()])), 1)
+        self.assertEqual(len(benchmark.compare([self.result(wall_time=1.3)], [self.result()], 0.25)), 1)
+        self.assertEqual(len(benchmark.compare([self.result(peak_rss_kb=1300)], [self.result()], 0.25)), 1)
+        self.assertEqual(len(benchmark.compare([self.result(error='timed out')], [self.result()])), 1)
+
+    def test_noisy_times(self):
+        fast = self.result(wall_time=benchmark.MIN_TIME / 2)
+        self.assertEqual(benchmark.compare([self.result(wall_time=benchmark.MIN_TIME)], [fast]), [])
+
+    def test_options_in_key(self):
+        self.assertEqual(benchmark.case_key(self.result(options={'frontier': 'bucket', 'closed': 'hash'})),
+                         'astar/noise/1e4/seed1/closed=hash,frontier=bucket')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!usr/bin/python
+"""
+File:           test_closedset.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the closed set backends, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import closedset                                                            # noqa: E402
+import environment                                                          # noqa: E402
+from state import State                                                     # noqa: E402
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astar-4-jconner.map')
+
+# a map wider than it is tall, so a row/column mix-up lands on another cell
+WIDTH, HEIGHT = 5, 3
+CORNERS = [(0, 0), (WIDTH - 1, 0), (0, HEIGHT - 1), (WIDTH - 1, HEIGHT - 1)]
+
+
+class ClosedSetTest(unittest.TestCase):
+
+    def check_edges(self, name):
+        closed = closedset.make_closed_set(name, WIDTH, HEIGHT)
+        for position in CORNERS:
+            closed.add(State(position[0], position[1]), position)
+
+        cells = [(x_pos, y_pos) for y_pos in range(HEIGHT) for x_pos in range(WIDTH)]
+        self.assertEqual([cell for cell in cells if cell in closed], sorted(CORNERS, key=lambda cell: cell[::-1]))
+        # the last cell of a row and the first cell of the next row are next to each other in the grid
+        self.assertIn((WIDTH - 1, 0), closed)
+        self.assertNotIn((0, 1), closed)
+        self.assertEqual(len(closed), len(CORNERS))
+        self.assertEqual([state.position for state in closed.items()], CORNERS)
+
+    def test_grid(self):
+        self.check_edges('grid')
+
+    def test_hash(self):
+        self.check_edges('hash')
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, closedset.make_closed_set, 'tree', WIDTH, HEIGHT)
+
+    def test_search_to_corners(self):
+        # searches between opposite corners close the cells on every edge of the map
+        for start, goal in (((0, 0), (-1, -1)), ((9, 8), (0, 0)), ((0, 8), (9, 0))):
+            results = []
+            for name in ('grid', 'hash'):
+                solution, frontier, visited = astar.Search(State(start[0], start[1]),
+                                                           environment.Environment(MAP, 1000, goal),
+                                                           closed=name).search()
+                results.append((solution.moves_so_far, solution.cost_so_far,
+                                [state.position for state in visited], [state.position for state in frontier]))
+            self.assertEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!usr/bin/python
+"""
+File:           test_dstar.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the D* Lite replanning, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import dstar                                                                # noqa: E402
+import environment                                                          # noqa: E402
+from state import State                                                     # noqa: E402
+
+SIZE = 30
+ENERGY = 1000
+
+
+class ReplanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.directory, 'terrain.map')
+        with open(self.map_path, 'w') as mapfile:
+            for y_pos in range(SIZE):
+                mapfile.write(' '.join(str((x_pos * 7 + y_pos * 13) % 5) for x_pos in range(SIZE)) + '\n')
+        self.environment = environment.Environment(self.map_path, ENERGY, (-1, -1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_replan(self, search, start):
+        """
+        Replan and compare with an A* search and a new D* search of the changed map
+        """
+        solution, frontier, visited = search.replan(start)
+        expected = astar.Search(State(start[0], start[1]), self.environment.derive(ENERGY, (-1, -1))).search()[0]
+        full = dstar.Search(State(start[0], start[1]), self.environment).search()[2]
+
+        self.assertEqual(solution.cost_so_far, expected.cost_so_far)
+        self.assertLess(len(visited), len(full))
+        positions = [state.position for state in frontier]
+        self.assertEqual(len(positions), len(set(positions)))
+        return solution
+
+    def route(self, solution):
+        """
+        :return: [(x_pos, y_pos), ...]: positions of a solution, goal first
+        """
+        positions = []
+        while solution is not None:
+            positions.append(solution.position)
+            solution = solution.parent
+        return positions
+
+    def test_patched_route(self):
+        search = dstar.Search(State(0, 0), self.environment)
+        solution = search.search()[0]
+
+        # raise a wall across the middle of the route
+        route = self.route(solution)
+        x_pos, y_pos = route[len(route) // 2]
+        x_min, x_max = max(0, x_pos - 2), min(SIZE - 1, x_pos + 2)
+        self.environment.patch(x_min, y_pos, [[99] * (x_max - x_min + 1)])
+        solution = self.check_replan(search, (0, 0))
+        for x_wall in range(x_min, x_max + 1):
+            self.assertNotIn((x_wall, y_pos), self.route(solution))
+
+    def test_moved_agent(self):
+        search = dstar.Search(State(0, 0), self.environment)
+        route = self.route(search.search()[0])
+
+        # the agent moved a few steps along its route, then a cell ahead of it changed
+        start = route[-5]
+        x_pos, y_pos = route[len(route) // 2]
+        self.environment.set_elevation(x_pos, y_pos, 50)
+        self.check_replan(search, start)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!usr/bin/python
+"""
+File:           test_environment.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of Environment that the map fixtures cannot reach, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import environment                                                          # noqa: E402
+import mapformat                                                            # noqa: E402
+import tiledmap                                                             # noqa: E402
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astar-4-jconner.map')
+
+
+class MapFormatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_text_map_path(self):
+        with open(MAP, 'r') as mapfile:
+            opened = environment.Environment(mapfile, 100, (-1, -1))
+        from_path = environment.Environment(MAP, 100, (-1, -1))
+        self.assertEqual(from_path.flat_elevations(), opened.flat_elevations())
+        self.assertEqual(from_path.map_path, MAP)
+
+    def test_round_trip(self):
+        binary_map = os.path.join(self.directory, 'astar-4.amap')
+        text_map = os.path.join(self.directory, 'astar-4.map')
+        mapformat.text_to_binary(MAP, binary_map)
+        mapformat.binary_to_text(binary_map, text_map)
+        with open(MAP, 'r') as original, open(text_map, 'r') as converted:
+            self.assertEqual([line.split() for line in converted], [line.split() for line in original])
+        self.assertEqual(environment.Environment(binary_map, 100, (-1, -1)).content_hash(),
+                         environment.Environment(MAP, 100, (-1, -1)).content_hash())
+
+
+class StorageTest(unittest.TestCase):
+
+    def setUp(self):
+        if environment.numpy is None:
+            self.skipTest("numpy is not installed")
+        self.lists = environment.Environment(MAP, 100, (-1, -1), storage='list')
+        self.arrays = environment.Environment(MAP, 100, (-1, -1), storage='numpy')
+        self.cells = [(x_pos, y_pos) for y_pos in range(self.lists.height) for x_pos in range(self.lists.width)]
+
+    def test_elevations(self):
+        self.assertEqual((self.arrays.width, self.arrays.height), (self.lists.width, self.lists.height))
+        expected = [self.lists.elevation(x_pos, y_pos) for x_pos, y_pos in self.cells]
+        self.assertEqual([self.arrays.elevation(x_pos, y_pos) for x_pos, y_pos in self.cells], expected)
+        self.assertEqual(self.arrays.flat_elevations(), self.lists.flat_elevations())
+        self.assertEqual(self.arrays.content_hash(), self.lists.content_hash())
+
+    def test_elevations_at(self):
+        expected = [self.lists.elevation(x_pos, y_pos) for x_pos, y_pos in self.cells]
+        for env in (self.lists, self.arrays):
+            values = env.elevations_at(self.cells)
+            self.assertEqual(values, expected)
+            self.assertTrue(all(type(value) is int for value in values))
+            self.assertEqual(env.elevations_at([]), [])
+            # the corners, in any order and repeated
+            corners = [(9, 8), (0, 0), (9, 0), (0, 8), (0, 0)]
+            self.assertEqual(env.elevations_at(corners), [env.elevation(x_pos, y_pos) for x_pos, y_pos in corners])
+
+    def test_invalid_position(self):
+        for env in (self.lists, self.arrays):
+            for position in ((10, 0), (0, 9), (-1, 0)):
+                self.assertRaises(Exception, env.elevations_at, [(0, 0), position])
+
+    def test_heuristic_table(self):
+        for goal in ((9, 8), (0, 0), (4, 3)):
+            self.assertEqual(self.arrays.heuristic_table(goal), self.lists.heuristic_table(goal))
+            table = self.lists.heuristic_table(goal)
+            self.assertEqual(table[2][5], self.lists.lower_bound(2, 5, goal))
+
+
+class DerivedPatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.binary_map = os.path.join(self.directory, 'astar-4.amap')
+        mapformat.text_to_binary(MAP, self.binary_map)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_patch(self, storage):
+        original = environment.Environment(self.binary_map, 100, (-1, -1), storage=storage)
+        original_hash = original.content_hash()
+        derived = original.derive(200, (0, 0))
+        elevation = original.elevation(0, 0)
+        derived.set_elevation(0, 0, elevation + 5)
+
+        # the patched copy is a different map, the memory-mapped one is unchanged
+        self.assertEqual(original.elevation(0, 0), elevation)
+        self.assertEqual(derived.elevation(0, 0), elevation + 5)
+        self.assertEqual(original.content_hash(), original_hash)
+        self.assertNotEqual(derived.content_hash(), original_hash)
+        self.assertEqual(len(original.changes), 0)
+        self.assertEqual(len(derived.changes), 1)
+
+    def test_numpy_storage(self):
+        if environment.numpy is None:
+            self.skipTest("numpy is not installed")
+        self.check_patch('numpy')
+
+    def test_list_storage(self):
+        self.check_patch('list')
+
+
+class TiledHashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.tiled_map = os.path.join(self.directory, 'astar-4.tmap')
+        tiledmap.to_tiled(MAP, self.tiled_map, tile_size=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, path):
+        tiled = environment.Environment(path, 100, (-1, -1))
+        self.addCleanup(tiled.elevations.close)
+        return tiled
+
+    def test_no_tile_read(self):
+        tiled = self.open(self.tiled_map)
+        digest = tiled.content_hash()
+        self.assertEqual(tiled.elevations.stats()['misses'], 0)
+        self.assertEqual(self.open(self.tiled_map).content_hash(), digest)
+
+        other_map = os.path.join(self.directory, 'other.tmap')
+        shutil.copyfile(self.tiled_map, other_map)
+        self.assertNotEqual(self.open(other_map).content_hash(), digest)
+
+    def test_patched_tiles(self):
+        tiled = self.open(self.tiled_map)
+        digest = tiled.content_hash()
+        elevation = tiled.elevation(5, 5)
+        tiled.set_elevation(5, 5, elevation + 1)
+        patched = tiled.content_hash()
+        self.assertNotEqual(patched, digest)
+        tiled.set_elevation(5, 5, elevation + 2)
+        self.assertNotEqual(tiled.content_hash(), patched)
+        tiled.set_elevation(5, 5, elevation + 1)
+        self.assertEqual(tiled.content_hash(), patched)
+
+
+if __name__ == '__main__':
+    unittest.main()
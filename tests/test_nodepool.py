@@ -0,0 +1,89 @@
+#!usr/bin/python
+"""
+File:           test_nodepool.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the array-backed node pool, run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import environment                                                          # noqa: E402
+from nodepool import NO_PARENT, NodePool                                    # noqa: E402
+from path import MOVE_E, MOVE_N, MOVE_S                                     # noqa: E402
+from state import State                                                     # noqa: E402
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'astar-4-jconner.map')
+
+
+class NodePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        # a root with two branches: root -> N -> N -> E and root -> E -> S
+        self.pool = NodePool()
+        self.root = self.pool.add(2, 2, 0, 7)
+        self.north = self.pool.add(2, 3, 1, 7, self.root, MOVE_N)
+        self.north_north = self.pool.add(2, 4, 3, 8, self.north, MOVE_N)
+        self.leaf = self.pool.add(3, 4, 4, 8, self.north_north, MOVE_E)
+        self.east = self.pool.add(3, 2, 2, 9, self.root, MOVE_E)
+        self.south_east = self.pool.add(3, 1, 5, 11, self.east, MOVE_S)
+
+    def test_add(self):
+        self.assertEqual(len(self.pool), 6)
+        self.assertEqual(self.pool.position(self.leaf), (3, 4))
+        self.assertEqual(self.pool.parent[self.root], NO_PARENT)
+        self.assertEqual(self.pool.move[self.root], -1)
+
+    def test_parent_chains(self):
+        leaf, south_east = self.pool.to_states([self.leaf, self.south_east])
+        self.assertEqual(leaf.moves_so_far, ['N', 'N', 'E'])
+        self.assertEqual(south_east.moves_so_far, ['E', 'S'])
+        self.assertEqual((leaf.position, leaf.cost_so_far, leaf.a_star), ((3, 4), 4, 8))
+
+        chain = []
+        state = leaf
+        while state is not None:
+            chain.append((state.position, state.cost_so_far))
+            state = state.parent
+        self.assertEqual(chain, [((3, 4), 4), ((2, 4), 3), ((2, 3), 1), ((2, 2), 0)])
+
+        # both branches share the State of the root
+        self.assertIs(leaf.parent.parent.parent, south_east.parent.parent)
+        self.assertIsNone(south_east.parent.parent.parent)
+        self.assertIsNone(south_east.parent.parent.move)
+
+    def test_shared_states(self):
+        states = {}
+        first = self.pool.to_states([self.north_north], states)[0]
+        self.assertEqual(sorted(states), [self.root, self.north, self.north_north])
+        # ancestors already built are reused, not rebuilt
+        leaf, root = self.pool.to_states([self.leaf, self.root], states)
+        self.assertIs(leaf.parent, first)
+        self.assertIs(root, first.parent.parent)
+
+        initial = State(2, 2)
+        initial.prefix_moves = ['W']
+        leaf = self.pool.to_states([self.leaf], {self.root: initial})[0]
+        self.assertEqual(leaf.moves_so_far, ['W', 'N', 'N', 'E'])
+
+    def test_pool_search(self):
+        # the pool stores the nodes of astar with nodes='pool': same results as State objects
+        results = []
+        for nodes in ('state', 'pool'):
+            solution, frontier, visited = astar.Search(State(0, 0), environment.Environment(MAP, 300, (-1, -1)),
+                                                       nodes=nodes).search()
+            results.append((solution.moves_so_far, solution.cost_so_far,
+                            [(state.position, state.moves_so_far, state.cost_so_far) for state in visited],
+                            [(state.position, state.moves_so_far, state.cost_so_far) for state in frontier]))
+        self.assertEqual(results[0], results[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
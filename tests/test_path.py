@@ -0,0 +1,100 @@
+#!usr/bin/python
+"""
+File:           test_path.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the packed move encoding and of the paths rebuilt from parent references,
+                run from the repository root:
+
+        python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from path import MOVES, PackedPath, move_between, opposite_moves            # noqa: E402
+from state import State                                                     # noqa: E402
+
+
+class PackedPathTest(unittest.TestCase):
+
+    def check_round_trip(self, moves):
+        packed = PackedPath.from_moves(moves)
+        self.assertEqual(len(packed), len(moves))
+        self.assertEqual(packed.moves(), moves)
+        self.assertEqual(str(packed), ''.join(moves))
+        self.assertEqual(len(packed.to_bytes()), (len(moves) + 3) // 4)
+
+        restored = PackedPath.from_bytes(packed.to_bytes(), len(moves))
+        self.assertEqual(restored, packed)
+        self.assertEqual(restored.moves(), moves)
+
+    def test_empty(self):
+        self.check_round_trip([])
+        self.assertEqual(PackedPath().to_bytes(), b'')
+
+    def test_partial_byte(self):
+        self.check_round_trip(['W', 'S', 'E'])
+
+    def test_several_bytes(self):
+        # every move in every slot of a byte, and a last byte that is not full
+        self.check_round_trip([MOVES[(i * 3 + i // 4) % 4] for i in range(0, 23)])
+        self.check_round_trip(['W'] * 8)
+
+    def test_first_move_in_low_bits(self):
+        self.assertEqual(PackedPath.from_moves(['E', 'S', 'W', 'N', 'W']).to_bytes(), b'\x39\x03')
+
+    def test_short_data(self):
+        self.assertRaises(ValueError, PackedPath.from_bytes, b'\x00', 5)
+
+    def test_equality(self):
+        # the same bytes with another length is another path
+        self.assertNotEqual(PackedPath.from_moves(['N']), PackedPath.from_moves(['N', 'N']))
+        self.assertNotEqual(PackedPath.from_moves(['N', 'E']), PackedPath.from_moves(['N', 'S']))
+
+
+class ParentPathTest(unittest.TestCase):
+
+    def walk(self, moves, prefix=()):
+        """
+        :return: State at the end of moves from (5, 5), built with parent references
+        """
+        steps = {'N': (0, 1), 'E': (1, 0), 'S': (0, -1), 'W': (-1, 0)}
+        current = State(5, 5)
+        current.prefix_moves = list(prefix)
+        for move in moves:
+            x_pos, y_pos = current.position[0] + steps[move][0], current.position[1] + steps[move][1]
+            next_state = State(x_pos, y_pos)
+            next_state.parent = current
+            next_state.move = move_between(current.position, next_state.position)
+            current = next_state
+        return current
+
+    def test_moves_so_far(self):
+        moves = ['N', 'N', 'E', 'S', 'W', 'W', 'N']
+        state = self.walk(moves)
+        self.assertEqual(state.moves_so_far, moves)
+        self.assertEqual(state.packed_moves().moves(), moves)
+        self.assertEqual(str(state), "Pos=(4, 7) Moves=" + str(moves) + " Cost=0")
+
+    def test_prefix_moves(self):
+        state = self.walk(['E', 'E'], prefix=['S'])
+        self.assertEqual(state.moves_so_far, ['S', 'E', 'E'])
+        self.assertEqual(state.packed_moves().moves(), ['S', 'E', 'E'])
+
+    def test_set_moves(self):
+        state = self.walk(['E', 'E'])
+        state.moves_so_far = ['N']
+        self.assertIsNone(state.parent)
+        self.assertEqual(state.moves_so_far, ['N'])
+
+    def test_opposite_moves(self):
+        self.assertEqual(opposite_moves(['N', 'E', 'E', 'S']), ['N', 'W', 'W', 'S'])
+        self.assertEqual(opposite_moves([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!usr/bin/python
+"""
+File:           test_service.py
+
+Author:         Alexander Adranly
+
+Description:    Checks of the path planning service over a Unix socket, run from the repository root:
+
+        python3 -m unittest discover tests
+
+    service.py is python 3.7+ only, these checks are skipped on older versions. The coroutines of
+    service.py are driven from here with run_until_complete, so this file still parses on python 2.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import astar                                                                # noqa: E402
+import environment                                                          # noqa: E402
+from state import State                                                     # noqa: E402
+
+if sys.version_info >= (3, 7):
+    import asyncio
+    import service
+
+SIZE = 300
+# long enough for a query on the whole map to be stopped while it runs
+SLOW_QUERY = {'map': 'terrain', 'start': [0, 0], 'goal': [SIZE - 1, SIZE - 1], 'energy': 10 ** 6}
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "service.py requires python 3.7+")
+class ServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.directory, 'terrain.map')
+        with open(self.map_path, 'w') as mapfile:
+            for y_pos in range(SIZE):
+                mapfile.write(' '.join(str((x_pos * 7 + y_pos * 13) % 10) for x_pos in range(SIZE)) + '\n')
+        self.socket_path = os.path.join(self.directory, 'service.sock')
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.service = service.Service(service.load_maps(['terrain=' + self.map_path]), workers=2, deadline=0)
+        # fork the workers before connecting, or they would inherit the client socket and keep it open
+        self.service.pool.submit(int).result()
+        self.server = self.loop.create_task(self.service.serve(unix=self.socket_path))
+        while not os.path.exists(self.socket_path):
+            self.complete(asyncio.sleep(0.01))
+        self.reader, self.writer = self.complete(service.connect((self.socket_path, None, None)))
+
+    def tearDown(self):
+        # the service ends the connection once it sees the client close it
+        self.writer.close()
+        self.complete(self.writer.wait_closed())
+        self.server.cancel()
+        self.complete(asyncio.wait(asyncio.all_tasks(self.loop)))
+        self.service.close()
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        shutil.rmtree(self.directory)
+
+    def complete(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode('utf-8'))
+
+    def receive(self):
+        return json.loads(self.complete(self.reader.readline()).decode('utf-8'))
+
+    def call(self, message):
+        return self.complete(service.call(self.reader, self.writer, message))
+
+    def test_query(self):
+        answer = self.call({'id': 1, 'map': 'terrain', 'start': [0, 0], 'goal': [6, 4], 'energy': 1000})
+        expected = astar.Search(State(0, 0), environment.Environment(self.map_path, 1000, (6, 4))).search()[0]
+        self.assertEqual(answer['id'], 1)
+        self.assertEqual(answer['status'], 'ok')
+        self.assertEqual(answer['cost'], expected.cost_so_far)
+        self.assertEqual(answer['moves'], ''.join(expected.moves_so_far))
+
+    def test_errors(self):
+        answer = self.call({'id': 1, 'map': 'other', 'start': [0, 0], 'goal': [1, 1], 'energy': 100})
+        self.assertEqual(answer['status'], 'error')
+        self.assertIn("unknown map 'other'", answer['error'])
+
+        answer = self.call({'id': 2, 'map': 'terrain', 'start': [0, 0], 'goal': [SIZE, 0], 'energy': 100})
+        self.assertEqual(answer['status'], 'error')
+        self.assertIn("'goal' [" + str(SIZE) + ", 0] is outside of map 'terrain'", answer['error'])
+        self.assertIsNone(answer['cost'])
+
+    def test_cancel_and_timeout(self):
+        query = dict(SLOW_QUERY, id='slow')
+        self.send(query)
+        self.complete(asyncio.sleep(0.1))
+        self.send({'op': 'cancel', 'id': 'slow'})
+        answers = dict((answer.get('op', 'query'), answer) for answer in (self.receive(), self.receive()))
+        self.assertEqual(answers['cancel'], {'op': 'cancel', 'id': 'slow', 'cancelled': True})
+        self.assertEqual(answers['query']['status'], 'cancelled')
+
+        self.assertFalse(self.call({'op': 'cancel', 'id': 'slow'})['cancelled'])
+
+        answer = self.call(dict(SLOW_QUERY, id='late', deadline=0.1))
+        self.assertEqual(answer['status'], 'timeout')
+        self.assertLess(answer['seconds'], 5)
+
+    def test_stats(self):
+        self.call({'id': 1, 'map': 'terrain', 'start': [0, 0], 'goal': [6, 4], 'energy': 1000})
+        self.call({'id': 2, 'map': 'terrain', 'start': [0, 0], 'goal': [6, 4], 'energy': 1})
+        self.call({'id': 3, 'map': 'other', 'start': [0, 0], 'goal': [6, 4], 'energy': 1000})
+        self.call(dict(SLOW_QUERY, id=4, deadline=0.1))
+
+        stats = self.call({'op': 'stats'})['stats']
+        self.assertEqual(stats['statuses'], {'ok': 1, 'no_solution': 1, 'timeout': 1, 'cancelled': 0,
+                                             'busy': 0, 'error': 1})
+        self.assertEqual(stats['latency']['count'], 4)
+        self.assertEqual(sum(stats['latency']['counts']), 4)
+        # worker timings: the two searches that ran to the end, and the timed out one when its worker
+        # stopped it before the front end gave up on it
+        self.assertIn(stats['search']['count'], (2, 3))
+        self.assertEqual(sum(stats['search']['counts']), stats['search']['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,550 @@
+#!/usr/bin/python
+"""
+File:           tiledmap.py
+
+Author:         Alexander Adranly
+
+Description:    Tiled elevation map format for maps larger than memory, read through an LRU cache of tiles
+
+    Binary layout (little-endian):
+        header: 4s magic 'ATIL', B version, c typecode ('h' int16 or 'i' int32), 2 pad bytes,
+                I width, I height, I tile size
+        tiles:  square tiles of tile size * tile size elevations, row by row starting at y = 0,
+                ordered by tile row then tile column; tiles on the right and top borders are padded
+
+    Only the tiles the search touches are read. Decoded tiles are kept in an LRU cache of a fixed
+    number of tiles, so memory is bounded whatever the size of the map. With prefetching on, a
+    background thread reads the next tile in the direction the search has been growing (the
+    direction between the last two missed tiles) while the current one is searched.
+
+    Usage:
+        python tiledmap.py to-tiled huge.map huge.tmap --tile-size 256
+        python main.py astar.py huge.tmap --tile-cache 256 --prefetch-tiles --search-option closed=hash
+"""
+import argparse
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+
+import mapformat
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+MAGIC = b'ATIL'
+VERSION = 1
+HEADER = struct.Struct('<4sBc2xIII')
+DEFAULT_TILE_SIZE = 256
+
+# settings used when Environment opens a tiled map, see configure
+settings = {'cache_tiles': 64, 'prefetch': False}
+
+
+def configure(cache_tiles=64, prefetch=False):
+    """
+    :param cache_tiles: (int) number of decoded tiles kept in memory, at least 1
+    :param prefetch: (bool) read the next tile in the direction of the search in the background
+    :return: None
+    """
+    if cache_tiles < 1:
+        raise ValueError("the tile cache must hold at least 1 tile, got " + str(cache_tiles))
+    settings['cache_tiles'] = cache_tiles
+    settings['prefetch'] = prefetch
+
+
+def is_tiled_map(mapfile):
+    """
+    Checks if an opened map file is in the tiled format, without consuming the file
+
+    :param mapfile: (file) map file opened by the caller, or a path
+    :return: (bool) True if the file starts with the tiled map magic
+    """
+    path = mapfile if isinstance(mapfile, str) else getattr(mapfile, 'name', None)
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def decode_tile(typecode, data):
+    """
+    :param typecode: (char) 'h' or 'i'
+    :param data: (bytes) little-endian elevations of a tile
+    :return: array: elevations of the tile, index (y % tile size) * tile size + x % tile size
+    """
+    tile = array(typecode)
+    if hasattr(tile, 'frombytes'):
+        tile.frombytes(data)
+    else:
+        tile.fromstring(data)
+    if sys.byteorder == 'big':
+        tile.byteswap()
+    return tile
+
+
+class TiledGrid(object):
+
+    def __init__(self, path, cache_tiles=64, prefetch=False):
+        """
+        Tiled Grid
+
+            Grid of a tiled map file that reads like a list of lists: rows[y][x], with elevation(x, y)
+            as the fast path. Tiles are read on demand and kept in an LRU cache.
+
+        --- PARAMETERS ---
+        path: str: tiled map file
+        cache_tiles: int: number of decoded tiles kept in memory, at least 1
+        prefetch: bool: read the next tile in the direction of the search in a background thread
+
+        --- INSTANCE VARIABLES ---
+        self.tiles: OrderedDict: tile index -> array, least recently used first
+        self.modified: {tile index: [int, ...]}: tiles changed by write(), kept in memory and never evicted
+        self.hits, self.misses, self.evictions: int: cache counters, see stats()
+        self.last_index, self.last_tile: most recently used tile, checked before the cache
+        self.last_miss: (tile x, tile y): last tile read from the file, None before the first miss
+        self.prefetcher: Prefetcher: background reader, None when prefetching is off
+        """
+        if cache_tiles < 1:
+            raise ValueError("the tile cache must hold at least 1 tile, got " + str(cache_tiles))
+        self.path = path
+        self.handle = open(path, 'rb')
+        header = self.handle.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(path + ": truncated tiled map header")
+        magic, version, typecode, width, height, tile_size = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(path + ": not a tiled map file")
+        if version != VERSION:
+            raise ValueError(path + ": unsupported tiled map version %d" % version)
+        self.typecode = str(typecode.decode('ascii'))
+        if self.typecode not in mapformat.TYPECODES or tile_size == 0:
+            raise ValueError(path + ": bad typecode or tile size")
+
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tiles_x = (width + tile_size - 1) // tile_size
+        self.tiles_y = (height + tile_size - 1) // tile_size
+        self.tile_bytes = tile_size * tile_size * mapformat.TYPECODES[self.typecode]
+        expected = HEADER.size + self.tiles_x * self.tiles_y * self.tile_bytes
+        if os.fstat(self.handle.fileno()).st_size < expected:
+            raise ValueError(path + ": tiles are truncated, expected %d bytes" % expected)
+
+        self.cache_tiles = cache_tiles
+        self.tiles = OrderedDict()
+        self.modified = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_index = -1
+        self.last_tile = None
+        self.last_miss = None
+        self.prefetcher = Prefetcher(self) if prefetch else None
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y_pos):
+        if not 0 <= y_pos < self.height:
+            raise IndexError("row index out of range")
+        return TiledRow(self, y_pos)
+
+    def __iter__(self):
+        for y_pos in range(0, self.height):
+            yield TiledRow(self, y_pos)
+
+    def elevation(self, x_pos, y_pos):
+        """
+        :param x_pos: (int) x coordinate, assumed valid
+        :param y_pos: (int) y coordinate, assumed valid
+        :return: (int) elevation of the position
+        """
+        tile_size = self.tile_size
+        index = (y_pos // tile_size) * self.tiles_x + x_pos // tile_size
+        if index == self.last_index:
+            self.hits += 1
+        else:
+            self.last_tile = self.tile(index)
+            self.last_index = index
+        return self.last_tile[(y_pos % tile_size) * tile_size + x_pos % tile_size]
+
+    def tile(self, index):
+        """
+        Decoded tile, read from the file on a miss
+
+        :param index: (int) tile row * tiles_x + tile column
+        :return: array: elevations of the tile (see decode_tile)
+        """
+        tile = self.modified.get(index)
+        if tile is not None:
+            self.hits += 1
+            return tile
+
+        tile = self.tiles.pop(index, None)
+        if tile is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            if self.prefetcher is not None:
+                tile = self.prefetcher.take(index)
+                self.predict(index)
+            if tile is None:
+                tile = self.read_tile(self.handle, index)
+            while len(self.tiles) >= self.cache_tiles:
+                self.tiles.popitem(last=False)                          # least recently used
+                self.evictions += 1
+        self.tiles[index] = tile                                        # most recently used goes last
+        return tile
+
+    def read_tile(self, handle, index):
+        """
+        --- HELPER METHOD ---
+        :param handle: (file) tiled map opened in binary mode
+        :param index: (int) tile index
+        :return: array: decoded tile
+        """
+        handle.seek(HEADER.size + index * self.tile_bytes)
+        return decode_tile(self.typecode, handle.read(self.tile_bytes))
+
+    def predict(self, index):
+        """
+        --- HELPER METHOD ---
+        Prefetch the tile after a missed tile, in the direction from the previous miss
+
+        :param index: (int) tile index that just missed
+        :return: None
+        """
+        tile_x, tile_y = index % self.tiles_x, index // self.tiles_x
+        if self.last_miss is not None:
+            step_x = (tile_x > self.last_miss[0]) - (tile_x < self.last_miss[0])
+            step_y = (tile_y > self.last_miss[1]) - (tile_y < self.last_miss[1])
+            next_x, next_y = tile_x + step_x, tile_y + step_y
+            if (step_x or step_y) and 0 <= next_x < self.tiles_x and 0 <= next_y < self.tiles_y:
+                next_index = next_y * self.tiles_x + next_x
+                if next_index not in self.tiles and next_index not in self.modified:
+                    self.prefetcher.request(next_index)
+        self.last_miss = (tile_x, tile_y)
+
+    def row(self, y_pos):
+        """
+        :param y_pos: (int) y coordinate
+        :return: [int, ...]: copy of a row, gathered from its tiles
+        """
+        tile_size = self.tile_size
+        start = (y_pos % tile_size) * tile_size
+        first = (y_pos // tile_size) * self.tiles_x
+        values = []
+        for tile_x in range(0, self.tiles_x):
+            length = min(tile_size, self.width - tile_x * tile_size)
+            values.extend(self.tile(first + tile_x)[start:start + length])
+        return [int(value) for value in values]
+
+    def write(self, x_min, y_min, rows):
+        """
+        Change elevations in memory, the file is never written
+
+        Changed tiles move out of the cache into self.modified, so they are never evicted and re-read
+
+        :param x_min: (int) x coordinate of the first column
+        :param y_min: (int) y coordinate of the first row
+        :param rows: int[][]: new elevations indexed [y - y_min][x - x_min]
+        :return: None
+        """
+        tile_size = self.tile_size
+        for offset, row in enumerate(rows):
+            y_pos = y_min + offset
+            for column, value in enumerate(row):
+                x_pos = x_min + column
+                index = (y_pos // tile_size) * self.tiles_x + x_pos // tile_size
+                tile = self.modified.get(index)
+                if tile is None:
+                    tile = list(self.tile(index))                       # may not fit the file typecode
+                    self.tiles.pop(index, None)
+                    self.modified[index] = tile
+                tile[(y_pos % tile_size) * tile_size + x_pos % tile_size] = int(value)
+        self.last_index = -1
+
+    def fingerprint(self):
+        """
+        Identify the content of the grid without reading its tiles: the header, the identity of the file
+        (absolute path, size and modification time) and the tiles changed by write()
+
+        :return: (bytes) to be hashed, see Environment.content_hash
+        """
+        info = os.fstat(self.handle.fileno())
+        parts = [HEADER.pack(MAGIC, VERSION, self.typecode.encode('ascii'), self.width, self.height,
+                             self.tile_size),
+                 ('%s %d %r\n' % (os.path.abspath(self.path), info.st_size, info.st_mtime)).encode('utf-8')]
+        for index in sorted(self.modified):
+            tile = self.modified[index]
+            parts.append(struct.pack('<q' + str(len(tile)) + 'q', index, *tile))
+        return b''.join(parts)
+
+    def stats(self):
+        """
+        :return: {str: int}: cache counters: hits, misses, evictions, cached and modified tiles,
+            tiles prefetched and prefetched tiles used
+        """
+        counters = {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'cached': len(self.tiles), 'modified': len(self.modified),
+                    'prefetched': 0, 'prefetch_hits': 0}
+        if self.prefetcher is not None:
+            counters['prefetched'] = self.prefetcher.prefetched
+            counters['prefetch_hits'] = self.prefetcher.used
+        return counters
+
+    def close(self):
+        """
+        Stop the prefetcher and close the file
+
+        :return: None
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+        self.handle.close()
+
+
+class TiledRow(object):
+
+    def __init__(self, grid, y_pos):
+        """
+        Tiled Row
+
+            Single row of a TiledGrid, read one element at a time
+        """
+        self.grid = grid
+        self.y_pos = y_pos
+
+    def __len__(self):
+        return self.grid.width
+
+    def __getitem__(self, x_pos):
+        if not 0 <= x_pos < self.grid.width:
+            raise IndexError("column index out of range")
+        return self.grid.elevation(x_pos, self.y_pos)
+
+    def tolist(self):
+        """
+        :return: [int, ...]: copy of the row
+        """
+        return self.grid.row(self.y_pos)
+
+
+class Prefetcher(object):
+
+    def __init__(self, grid):
+        """
+        Prefetcher
+
+            Background thread that reads requested tiles with its own file handle. File reads release
+            the interpreter lock, so the search keeps running while a tile is read.
+
+        --- INSTANCE VARIABLES ---
+        self.requests: Queue: tile indexes to read, None stops the thread
+        self.ready: {tile index: array}: tiles read but not used yet, at most cache_tiles of them
+        self.pending: set: tile indexes requested and not read yet
+        self.prefetched: int: tiles read by the thread
+        self.used: int: misses answered by a prefetched tile
+        """
+        self.grid = grid
+        self.requests = queue.Queue()
+        self.ready = {}
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.prefetched = 0
+        self.used = 0
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, index):
+        """
+        :param index: (int) tile to read in the background
+        :return: None
+        """
+        with self.lock:
+            if index in self.pending or index in self.ready:
+                return
+            self.pending.add(index)
+        self.requests.put(index)
+
+    def take(self, index):
+        """
+        :param index: (int) missed tile
+        :return: array: the tile if it was prefetched, None otherwise
+        """
+        with self.lock:
+            tile = self.ready.pop(index, None)
+        if tile is not None:
+            self.used += 1
+        return tile
+
+    def run(self):
+        """
+        --- HELPER METHOD ---
+        Thread body: read requested tiles until stopped
+
+        :return: None
+        """
+        with open(self.grid.path, 'rb') as handle:
+            while True:
+                index = self.requests.get()
+                if index is None:
+                    return
+                tile = self.grid.read_tile(handle, index)
+                with self.lock:
+                    self.pending.discard(index)
+                    if len(self.ready) >= self.grid.cache_tiles:
+                        self.ready.pop(next(iter(self.ready)))         # never used, make room
+                    self.ready[index] = tile
+                    self.prefetched += 1
+
+    def stop(self):
+        """
+        :return: None
+        """
+        self.requests.put(None)
+        self.thread.join()
+
+
+def open_tiled_map(path):
+    """
+    :param path: (str) path of the tiled map
+    :return: (width, height, grid): grid is a TiledGrid with the current settings (see configure)
+    """
+    grid = TiledGrid(path, settings['cache_tiles'], settings['prefetch'])
+    return grid.width, grid.height, grid
+
+
+def write_tiled_map(out, width, height, rows, tile_size=DEFAULT_TILE_SIZE, typecode='i'):
+    """
+    Write elevations in the tiled map format
+
+    Rows may come in any order; only the band of tile_size rows they belong to is kept in memory
+    until it is complete, so a map written row by row never has to fit in memory
+
+    :param out: (file) destination opened in binary mode, must be seekable
+    :param width: (int) width of the map
+    :param height: (int) height of the map
+    :param rows: iterable of (y_pos, [int, ...]): every row of the map exactly once
+    :param tile_size: (int) side of a tile
+    :param typecode: (char) 'h' or 'i'
+    :return: None
+    """
+    if typecode not in mapformat.TYPECODES:
+        raise ValueError("unknown typecode '" + str(typecode) + "', expected one of " +
+                         str(sorted(mapformat.TYPECODES)))
+    tiles_x = (width + tile_size - 1) // tile_size
+    tiles_y = (height + tile_size - 1) // tile_size
+    tile_bytes = tile_size * tile_size * mapformat.TYPECODES[typecode]
+    out.write(HEADER.pack(MAGIC, VERSION, typecode.encode('ascii'), width, height, tile_size))
+
+    bands = {}                                                          # tile row -> rows received
+    for y_pos, row in rows:
+        if len(row) != width:
+            raise ValueError("row %d has %d elements, expected %d" % (y_pos, len(row), width))
+        tile_y = y_pos // tile_size
+        band = bands.setdefault(tile_y, {})
+        band[y_pos % tile_size] = row
+        if len(band) < min(tile_size, height - tile_y * tile_size):
+            continue
+
+        del bands[tile_y]
+        for tile_x in range(0, tiles_x):
+            tile = array(typecode, [0]) * (tile_size * tile_size)
+            first = tile_x * tile_size
+            length = min(tile_size, width - first)
+            for offset, band_row in band.items():
+                tile[offset * tile_size:offset * tile_size + length] = array(typecode, band_row[first:first + length])
+            if sys.byteorder == 'big':
+                tile.byteswap()
+            out.seek(HEADER.size + (tile_y * tiles_x + tile_x) * tile_bytes)
+            out.write(tile.tobytes() if hasattr(tile, 'tobytes') else tile.tostring())
+
+    if bands:
+        raise ValueError("rows missing from tile rows " + str(sorted(bands)))
+    out.seek(HEADER.size + tiles_x * tiles_y * tile_bytes)
+    out.truncate()
+
+
+def text_rows(text_path):
+    """
+    Stream the rows of a text map twice: once to measure it, once to yield its rows
+
+    :param text_path: (str) text map, top row first
+    :return: (width, height, typecode, rows): rows yields (y_pos, [int, ...])
+    """
+    width, height, low, high = -1, 0, 0, 0
+    with open(text_path, 'r') as mapfile:
+        for line in mapfile:
+            row = [int(value) for value in line.split()]
+            if width == -1:
+                width = len(row)
+            elif len(row) != width:
+                raise ValueError(text_path + ": inconsistent map width in row %d" % (height + 1))
+            low, high = min([low] + row), max([high] + row)
+            height += 1
+    typecode = mapformat.pick_typecode([[low, high]])
+
+    def rows():
+        with open(text_path, 'r') as mapfile:
+            for number, line in enumerate(mapfile):
+                yield height - 1 - number, [int(value) for value in line.split()]  # last line is y = 0
+
+    return width, height, typecode, rows()
+
+
+def to_tiled(source_path, tiled_path, tile_size=DEFAULT_TILE_SIZE):
+    """
+    Convert a text or binary map (see mapformat.py) into a tiled map
+
+    :param source_path: (str) source map
+    :param tiled_path: (str) destination tiled map
+    :param tile_size: (int) side of a tile
+    :return: None
+    """
+    if mapformat.is_binary_map(source_path):
+        width, height, grid = mapformat.open_binary_map(source_path, use_numpy=False)
+        typecode = str(grid.item_format[1:])
+        rows = ((y_pos, grid[y_pos].tolist()) for y_pos in range(0, height))
+    else:
+        width, height, typecode, rows = text_rows(source_path)
+    with open(tiled_path, 'wb') as out:
+        write_tiled_map(out, width, height, rows, tile_size, typecode)
+
+
+def tiled_to_text(tiled_path, text_path):
+    """
+    Convert a tiled map into a text map (top row first, like the maps in tests/)
+
+    :param tiled_path: (str) source tiled map
+    :param text_path: (str) destination text map
+    :return: None
+    """
+    grid = TiledGrid(tiled_path)
+    with open(text_path, 'w') as out:
+        for y_pos in range(grid.height - 1, -1, -1):
+            out.write(' '.join([str(elevation) for elevation in grid.row(y_pos)]) + '\n')
+    grid.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert elevation maps to and from the tiled format')
+    parser.add_argument('direction', choices=['to-tiled', 'to-text'],
+                        help='to-tiled: text or binary map -> tiled map, to-text: tiled map -> text map')
+    parser.add_argument('source', help='Map to read')
+    parser.add_argument('destination', help='Map to write')
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                        help='Side of a tile, default is %d' % DEFAULT_TILE_SIZE)
+    args = parser.parse_args()
+
+    if args.direction == 'to-tiled':
+        to_tiled(args.source, args.destination, args.tile_size)
+    else:
+        tiled_to_text(args.source, args.destination)